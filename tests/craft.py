@@ -0,0 +1,133 @@
+"""
+Builders for the raw IPv4 packets the probe engines receive, for
+engines that match them without opening sockets, and for traced paths
+along with an engine that answers from one
+"""
+
+import socket
+import struct
+from typing import Optional
+
+from tracelens.models import HopResult, ProbeResult
+from tracelens.probe.base import BaseProbe
+from tracelens.probe.packets import checksum
+
+
+LOCAL_IP = '198.51.100.7'
+ROUTER_IP = '203.0.113.1'
+TARGET_IP = '192.0.2.10'
+
+SEND_TIME = 100.0
+RECV_TIME = 100.025  # 25 ms later
+
+
+def engine(cls, **attrs):
+    """An engine with its bookkeeping set up but no sockets opened"""
+    probe = object.__new__(cls)
+    BaseProbe.__init__(probe, timeout=2.0)
+    probe.__dict__.update(attrs)
+    return probe
+
+
+def ip_header(src: str, dst: str, protocol: int, payload_len: int = 0,
+              ttl: int = 64, ident: int = 0, options: bytes = b'') -> bytes:
+    """IPv4 header; ``options`` must be a multiple of 4 bytes"""
+    ihl = 5 + len(options) // 4
+    return struct.pack(
+        '!BBHHHBBH4s4s',
+        (4 << 4) + ihl, 0, 4 * ihl + payload_len, ident, 0, ttl, protocol, 0,
+        socket.inet_aton(src), socket.inet_aton(dst)
+    ) + options
+
+
+def ip_packet(src: str, dst: str, protocol: int, payload: bytes, **fields) -> bytes:
+    return ip_header(src, dst, protocol, len(payload), **fields) + payload
+
+
+def icmp(icmp_type: int, code: int, body: bytes, rest: bytes = b'\x00' * 4) -> bytes:
+    """ICMP message with a valid checksum; ``rest`` is the 4 bytes after it"""
+    header = struct.pack('!BBH', icmp_type, code, 0) + rest
+    cs = checksum(header + body)
+    return struct.pack('!BBH', icmp_type, code, cs) + rest + body
+
+
+def echo(icmp_type: int, identifier: int, sequence: int, payload: bytes = b'') -> bytes:
+    """Echo Request (8) or Echo Reply (0)"""
+    return icmp(icmp_type, 0, payload, struct.pack('!HH', identifier, sequence))
+
+
+def udp(src_port: int, dst_port: int, payload: bytes = b'') -> bytes:
+    return struct.pack('!HHHH', src_port, dst_port, 8 + len(payload), 0) + payload
+
+
+def tcp(src_port: int, dst_port: int, seq: int = 0, ack: int = 0, flags: int = 0x02) -> bytes:
+    return struct.pack('!HHIIBBHHH', src_port, dst_port, seq, ack, 5 << 4, flags, 65535, 0, 0)
+
+
+def icmp_error(icmp_type: int, code: int, quoted: bytes, router: str = ROUTER_IP,
+               ttl: int = 250) -> bytes:
+    """
+    Time Exceeded (11) / Unreachable (3) from ``router`` quoting the start
+    of ``quoted`` (an IP packet we sent): its header plus 8 bytes.
+    """
+    ihl = (quoted[0] & 0x0F) * 4
+    message = icmp(icmp_type, code, quoted[:ihl + 8])
+    return ip_packet(router, LOCAL_IP, socket.IPPROTO_ICMP, message, ttl=ttl)
+
+
+def path(*ips, reached: bool = True) -> list[HopResult]:
+    """Hops 1..n answering from ``ips`` (None = silent)"""
+    hops = [
+        HopResult(hop=ttl, ip=ip, rtts=[float(ttl)] if ip else [None], probes_sent=3)
+        for ttl, ip in enumerate(ips, start=1)
+    ]
+    hops[-1].reached_target = reached
+    if reached:
+        hops[-1].stop_reason = 'reached'
+    return hops
+
+
+class PathProbe(BaseProbe):
+    """
+    Engine that answers at once from a fixed path: TTL n from ``ips[n-1]``
+    (None = silent), any TTL at or past the end from the destination,
+    ``ips[-1]``. Records every TTL sent in ``sent``.
+    """
+    
+    def __init__(self, *ips: Optional[str], timeout: float = 2.0):
+        super().__init__(timeout)
+        self.ips = ips
+        self.sent: list[int] = []
+        self._answers: dict = {}
+    
+    def answer(self, ttl: int) -> ProbeResult:
+        self.sent.append(ttl)
+        distance = min(ttl, len(self.ips))
+        ip = self.ips[distance - 1]
+        if ip is None:
+            return ProbeResult()
+        
+        reached = distance == len(self.ips)
+        return ProbeResult(
+            responder_ip=ip, rtt_ms=float(distance), reached_target=reached,
+            reply_ttl=65 - distance if reached else 256 - distance
+        )
+    
+    def probe(self, target_ip, ttl, timeout=None) -> ProbeResult:
+        return self.answer(ttl)
+    
+    def send(self, target_ip, ttl, timeout=None):
+        key = next(self._keys)
+        self._answers[key] = self.answer(ttl)
+        return key
+    
+    def poll(self, timeout):
+        results = list(self._answers.items())
+        self._answers.clear()
+        return results
+    
+    def cancel(self, key):
+        self._answers.pop(key, None)
+    
+    def close(self):
+        pass
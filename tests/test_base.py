@@ -0,0 +1,67 @@
+"""
+In-flight bookkeeping shared by the probe engines
+"""
+
+import socket
+import time
+
+import pytest
+
+from tracelens.probe.base import BaseProbe
+from craft import TARGET_IP
+
+
+class AnsweringProbe(BaseProbe):
+    """Every pending probe is answered as soon as the engine reads"""
+    
+    def __init__(self):
+        super().__init__(timeout=1.0)
+        self._reader, self._writer = socket.socketpair()
+        self._writer.send(b'x')  # never read, so always readable
+    
+    def send(self, target_ip, ttl, timeout=None):
+        key = next(self._keys)
+        self._track(key, target_ip, ttl, time.perf_counter(), timeout)
+        return key
+    
+    def probe(self, target_ip, ttl, timeout=None):
+        return self._wait(self.send(target_ip, ttl, timeout), timeout)
+    
+    def _receive_sockets(self):
+        return [self._reader]
+    
+    def _read_ready(self):
+        return [
+            self._complete(key, f'10.0.0.{pending.ttl}', time.perf_counter(), False)
+            for key, pending in list(self._pending.items())
+        ]
+    
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+
+
+@pytest.fixture
+def probe():
+    with AnsweringProbe() as probe:
+        yield probe
+
+
+def test_blocking_probe_keeps_results_of_sent_probes(probe):
+    first = probe.send(TARGET_IP, 1)
+    second = probe.send(TARGET_IP, 2)
+    
+    assert probe.probe(TARGET_IP, 3).responder_ip == '10.0.0.3'
+    
+    results = dict(probe.poll(0))
+    assert results.keys() == {first, second}
+    assert results[second].responder_ip == '10.0.0.2'
+    assert probe.poll(0) == []
+
+
+def test_cancel_drops_a_held_result(probe):
+    key = probe.send(TARGET_IP, 1)
+    probe.probe(TARGET_IP, 2)
+    
+    probe.cancel(key)
+    assert probe.poll(0) == []
@@ -0,0 +1,134 @@
+"""
+BatchTracer over one shared fake engine
+"""
+
+import asyncio
+
+import pytest
+
+from tracelens import batch
+from tracelens.batch import BatchTracer, plain_hop
+from craft import PathProbe, TARGET_IP
+
+
+ROUTERS = ('10.0.0.1', '10.0.1.1', '10.0.2.1', '10.0.3.1')
+TARGETS = ['192.0.2.10', '192.0.2.11', '192.0.2.12', '192.0.2.13']
+REFUSED_IP = '192.0.2.66'
+
+
+class SharedPathProbe(PathProbe):
+    """PathProbe that refuses probes to ``REFUSED_IP`` and counts its users"""
+    
+    def __init__(self, *ips):
+        super().__init__(*ips)
+        self.targets: set[str] = set()
+        self.inflight_limit = None
+    
+    def limit_inflight(self, limit):
+        self.inflight_limit = limit
+    
+    def accept(self, target_ip):
+        if target_ip == REFUSED_IP:
+            raise RuntimeError('probe refused')
+        self.targets.add(target_ip)
+    
+    def probe(self, target_ip, ttl, timeout=None):
+        self.accept(target_ip)
+        return super().probe(target_ip, ttl, timeout)
+    
+    def send(self, target_ip, ttl, timeout=None):
+        self.accept(target_ip)
+        return super().send(target_ip, ttl, timeout)
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    probe = SharedPathProbe(*ROUTERS, TARGET_IP)
+    monkeypatch.setattr(batch, 'create_probe', lambda *args, **kwargs: probe)
+    return probe
+
+
+def run(tracer: BatchTracer, targets) -> list:
+    results = []
+    tracer.run_sync(targets, results.append)
+    return results
+
+
+class TestRun:
+    def test_every_target_traced_over_one_engine(self, probe):
+        results = run(BatchTracer(concurrency=2, max_inflight=64), TARGETS)
+        
+        assert sorted(result.target for result in results) == TARGETS
+        assert probe.targets == set(TARGETS)
+        assert probe.inflight_limit == 64
+        for result in results:
+            assert result.error is None and result.reachable
+            assert [hop.ip for hop in result.hops] == [*ROUTERS, TARGET_IP]
+            assert result.total_hops == 5
+    
+    def test_refused_target_is_reported_and_the_rest_finish(self, probe):
+        results = run(BatchTracer(concurrency=2), [TARGETS[0], REFUSED_IP, TARGETS[1]])
+        
+        by_target = {result.target: result for result in results}
+        assert by_target[REFUSED_IP].error == 'probe refused'
+        assert not by_target[REFUSED_IP].hops
+        assert by_target[TARGETS[0]].reachable and by_target[TARGETS[1]].reachable
+    
+    def test_failing_target_list_is_raised(self, probe):
+        def targets():
+            yield TARGETS[0]
+            raise OSError('target file vanished')
+        
+        with pytest.raises(OSError, match='vanished'):
+            run(BatchTracer(concurrency=1), targets())
+    
+    def test_shared_stop_set_spares_later_traces_the_near_side(self, probe):
+        run(BatchTracer(concurrency=1, stop_set=True, start_ttl=4), TARGETS[:1])
+        first = len(probe.sent)
+        
+        tracer = BatchTracer(concurrency=1, stop_set=True, start_ttl=4)
+        results = run(tracer, TARGETS[:2])
+        
+        assert [hop.from_stop_set for hop in results[1].hops] == [True] * 2 + [False] * 3
+        assert len(probe.sent) - first < 2 * first
+
+
+class TestEnrichment:
+    def test_every_hop_goes_through_enrich(self, probe):
+        def enrich(hop):
+            enriched = plain_hop(hop)
+            enriched.ptr = f'hop{hop.hop}.example'
+            return enriched
+        
+        results = run(BatchTracer(concurrency=2, enrich=enrich), TARGETS[:2])
+        
+        for result in results:
+            assert [hop.ptr for hop in result.hops] == [f'hop{n}.example' for n in range(1, 6)]
+    
+    def test_failed_enrichment_leaves_the_hop_plain(self, probe):
+        def enrich(hop):
+            raise ValueError('lookup failed')
+        
+        (result,) = run(BatchTracer(enrich=enrich), TARGETS[:1])
+        assert [hop.ip for hop in result.hops] == [*ROUTERS, TARGET_IP]
+        assert all(hop.ptr is None for hop in result.hops)
+    
+    def test_enrich_trace_gets_each_finished_trace_once(self, probe):
+        calls = []
+        
+        async def enrich_trace(hops):
+            calls.append([hop.hop for hop in hops])
+            await asyncio.sleep(0)
+            return [plain_hop(hop) for hop in hops]
+        
+        results = run(BatchTracer(concurrency=2, enrich_trace=enrich_trace), TARGETS)
+        
+        assert calls == [[1, 2, 3, 4, 5]] * len(TARGETS)
+        assert all(result.reachable for result in results)
+    
+    def test_failed_enrich_trace_leaves_the_trace_plain(self, probe):
+        async def enrich_trace(hops):
+            raise ValueError('lookup failed')
+        
+        (result,) = run(BatchTracer(enrich_trace=enrich_trace), TARGETS[:1])
+        assert result.error is None and result.total_hops == 5
@@ -0,0 +1,184 @@
+"""
+Classic BPF reply filters, run through a small interpreter
+"""
+
+import socket
+
+import pytest
+
+from tracelens.probe import bpf
+from tracelens.probe.bpf import (
+    ACCEPT, REJECT, assemble, echo_filter, port_filter, tcp_reply_filter
+)
+from craft import LOCAL_IP, ROUTER_IP, TARGET_IP, echo, icmp_error, ip_packet, tcp, udp
+
+
+def run(program: list[tuple[int, int, int, int]], packet: bytes) -> int:
+    """
+    Execute ``program`` on ``packet`` the way the kernel does for the
+    instructions our filters use. Loads past the end reject the packet.
+    """
+    a = x = 0
+    pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        cls = code & 0x07
+        
+        if cls == bpf.BPF_RET:
+            return k
+        
+        if cls == bpf.BPF_LDX:
+            assert code == bpf.BPF_LDX | bpf.BPF_B | bpf.BPF_MSH
+            if k >= len(packet):
+                return REJECT
+            x = (packet[k] & 0x0F) * 4
+        
+        elif cls == bpf.BPF_LD:
+            assert code & 0xE0 == bpf.BPF_IND
+            size = 1 if code & 0x18 == bpf.BPF_B else 2
+            offset = x + k
+            if offset + size > len(packet):
+                return REJECT
+            a = int.from_bytes(packet[offset:offset + size], 'big')
+        
+        elif cls == bpf.BPF_ALU:
+            operand = x if code & bpf.BPF_X else k
+            op = code & 0xF0
+            if op == bpf.BPF_ADD:
+                a = (a + operand) & 0xFFFFFFFF
+            elif op == bpf.BPF_AND:
+                a &= operand
+            elif op == bpf.BPF_LSH:
+                a = (a << operand) & 0xFFFFFFFF
+            else:
+                raise AssertionError(f"unexpected ALU op {op:#x}")
+        
+        elif cls == bpf.BPF_MISC:
+            assert code == bpf.BPF_MISC | bpf.BPF_TAX
+            x = a
+        
+        elif cls == bpf.BPF_JMP:
+            op = code & 0xF0
+            if op == bpf.BPF_JEQ:
+                taken = a == k
+            elif op == bpf.BPF_JGE:
+                taken = a >= k
+            elif op == bpf.BPF_JSET:
+                taken = bool(a & k)
+            else:
+                raise AssertionError(f"unexpected jump op {op:#x}")
+            pc += jt if taken else jf
+        
+        else:
+            raise AssertionError(f"unexpected instruction class {cls:#x}")
+
+
+def test_assemble_resolves_labels_to_relative_jumps():
+    program = assemble([
+        (bpf.BPF_JMP | bpf.BPF_JEQ | bpf.BPF_K, 1, 'yes', 'no'),
+        'no',
+        (bpf.BPF_RET | bpf.BPF_K, REJECT),
+        'yes',
+        (bpf.BPF_RET | bpf.BPF_K, ACCEPT),
+    ])
+    
+    assert program == [
+        (bpf.BPF_JMP | bpf.BPF_JEQ | bpf.BPF_K, 1, 0, 1),
+        (bpf.BPF_RET | bpf.BPF_K, 0, 0, REJECT),
+        (bpf.BPF_RET | bpf.BPF_K, 0, 0, ACCEPT),
+    ]
+
+
+class TestEchoFilter:
+    IDENT = 0x1234
+    
+    def sent(self, identifier: int = IDENT) -> bytes:
+        return ip_packet(LOCAL_IP, TARGET_IP, socket.IPPROTO_ICMP, echo(8, identifier, 7))
+    
+    def test_accepts_echo_reply_with_our_identifier(self):
+        reply = ip_packet(TARGET_IP, LOCAL_IP, socket.IPPROTO_ICMP, echo(0, self.IDENT, 7))
+        assert run(echo_filter(self.IDENT), reply) == ACCEPT
+    
+    def test_rejects_echo_reply_for_another_identifier(self):
+        reply = ip_packet(TARGET_IP, LOCAL_IP, socket.IPPROTO_ICMP, echo(0, 0x4321, 7))
+        assert run(echo_filter(self.IDENT), reply) == REJECT
+    
+    @pytest.mark.parametrize('icmp_type', [11, 3])
+    def test_accepts_errors_quoting_our_echo_request(self, icmp_type):
+        assert run(echo_filter(self.IDENT), icmp_error(icmp_type, 0, self.sent())) == ACCEPT
+    
+    def test_rejects_errors_quoting_another_identifier(self):
+        assert run(echo_filter(self.IDENT), icmp_error(11, 0, self.sent(0x4321))) == REJECT
+    
+    def test_rejects_errors_quoting_udp(self):
+        quoted = ip_packet(LOCAL_IP, TARGET_IP, socket.IPPROTO_UDP, udp(40000, 33434))
+        assert run(echo_filter(self.IDENT), icmp_error(11, 0, quoted)) == REJECT
+    
+    def test_rejects_other_icmp_types(self):
+        redirect = ip_packet(ROUTER_IP, LOCAL_IP, socket.IPPROTO_ICMP, echo(5, self.IDENT, 7))
+        assert run(echo_filter(self.IDENT), redirect) == REJECT
+    
+    def test_follows_ip_options_in_both_headers(self):
+        options = b'\x01' * 8
+        sent = ip_packet(LOCAL_IP, TARGET_IP, socket.IPPROTO_ICMP, echo(8, self.IDENT, 7),
+                         options=options)
+        error = icmp_error(11, 0, sent)
+        with_options = error[:20] + options + error[20:]
+        with_options = bytes([0x47]) + with_options[1:]
+        
+        assert run(echo_filter(self.IDENT), with_options) == ACCEPT
+
+
+class TestPortFilter:
+    FIRST, LAST = 33434, 33463
+    
+    def error(self, dst_port: int, protocol: int = socket.IPPROTO_UDP) -> bytes:
+        header = udp(40000, dst_port) if protocol == socket.IPPROTO_UDP else tcp(40000, dst_port)
+        return icmp_error(11, 0, ip_packet(LOCAL_IP, TARGET_IP, protocol, header))
+    
+    @pytest.mark.parametrize('dst_port', [FIRST, 33450, LAST])
+    def test_accepts_ports_in_range(self, dst_port):
+        program = port_filter(socket.IPPROTO_UDP, self.FIRST, self.LAST)
+        assert run(program, self.error(dst_port)) == ACCEPT
+    
+    @pytest.mark.parametrize('dst_port', [FIRST - 1, LAST + 1, 80])
+    def test_rejects_ports_outside_range(self, dst_port):
+        program = port_filter(socket.IPPROTO_UDP, self.FIRST, self.LAST)
+        assert run(program, self.error(dst_port)) == REJECT
+    
+    def test_single_port(self):
+        program = port_filter(socket.IPPROTO_TCP, 443)
+        assert run(program, self.error(443, socket.IPPROTO_TCP)) == ACCEPT
+        assert run(program, self.error(444, socket.IPPROTO_TCP)) == REJECT
+    
+    def test_rejects_other_quoted_protocols(self):
+        program = port_filter(socket.IPPROTO_UDP, self.FIRST, self.LAST)
+        assert run(program, self.error(self.FIRST, socket.IPPROTO_TCP)) == REJECT
+    
+    def test_rejects_truncated_quote(self):
+        program = port_filter(socket.IPPROTO_UDP, self.FIRST, self.LAST)
+        assert run(program, self.error(self.FIRST)[:-6]) == REJECT
+
+
+class TestTCPReplyFilter:
+    PROGRAM = tcp_reply_filter(80, 32768, 65535)
+    
+    def segment(self, src_port: int = 80, dst_port: int = 40000, flags: int = 0x12) -> bytes:
+        # Raw TCP sockets see the IP header too
+        return ip_packet(TARGET_IP, LOCAL_IP, socket.IPPROTO_TCP,
+                         tcp(src_port, dst_port, flags=flags))
+    
+    @pytest.mark.parametrize('flags', [0x12, 0x04, 0x14])
+    def test_accepts_syn_ack_and_rst(self, flags):
+        assert run(self.PROGRAM, self.segment(flags=flags)) == ACCEPT
+    
+    @pytest.mark.parametrize('flags', [0x02, 0x10, 0x18])
+    def test_rejects_other_segments(self, flags):
+        assert run(self.PROGRAM, self.segment(flags=flags)) == REJECT
+    
+    def test_rejects_other_remote_port(self):
+        assert run(self.PROGRAM, self.segment(src_port=443)) == REJECT
+    
+    def test_rejects_local_port_below_range(self):
+        assert run(self.PROGRAM, self.segment(dst_port=22)) == REJECT
@@ -0,0 +1,128 @@
+"""
+JSON cache: per-IP entries and the separate ASN table
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip('dns.asyncresolver')
+pytest.importorskip('httpx')
+
+from tracelens.cache import Cache
+from tracelens.enrichment.asn_lookup import ASNInfo, ASNLookup, ASNOrg
+
+
+IP = '192.0.2.10'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return Cache(path=tmp_path / 'cache.json')
+
+
+def test_asn_is_split_between_the_ip_and_asn_tables(cache):
+    cache.set(IP, asn=ASNInfo(asn='AS64500', org='Example Net', prefix='192.0.2.0/24',
+                              country='US', registry='arin'))
+    
+    assert cache.get_asn(IP) == ASNInfo(asn='AS64500', org='Example Net',
+                                        prefix='192.0.2.0/24', country='US', registry='arin')
+    assert 'org' not in cache.get(IP)
+    assert cache.get_asn_org('AS64500').org == 'Example Net'
+
+
+def test_ip_misses_once_its_asn_expires(tmp_path):
+    cache = Cache(path=tmp_path / 'cache.json', asn_ttl=60)
+    cache.set(IP, asn=ASNInfo(asn='AS64500', org='Example Net'))
+    cache._asns['AS64500']['_ts'] -= 120
+    
+    assert cache.get_asn(IP) is None
+
+
+def test_as_without_registration_is_a_hit(cache):
+    cache.set_asn_org(ASNOrg(asn='AS64501'))
+    cache.set(IP, asn=ASNInfo(asn='AS64501', prefix='192.0.2.0/24'))
+    
+    asn = cache.get_asn(IP)
+    assert asn is not None
+    assert (asn.asn, asn.org) == ('AS64501', None)
+
+
+def test_old_cache_files_are_migrated(tmp_path):
+    path = tmp_path / 'cache.json'
+    now = time.time()
+    path.write_text(json.dumps({
+        IP: {'_ts': now, 'asn': 'AS64500', 'org': 'Example Net', 'prefix': '192.0.2.0/24'},
+        '192.0.2.11': {'_ts': now, 'asn': 'AS64500', 'org': 'Example Net'},
+        '198.51.100.1': {'_ts': now, 'ptr': 'host.example'},
+    }))
+    
+    cache = Cache(path=path)
+    assert cache.get_asn(IP).org == 'Example Net'
+    assert 'org' not in cache.get('192.0.2.11')
+    assert cache.get_ptr('198.51.100.1') == 'host.example'
+    
+    cache.save()
+    saved = json.loads(path.read_text())
+    assert saved['asns']['AS64500']['org'] == 'Example Net'
+    assert set(saved['ips']) == {IP, '192.0.2.11', '198.51.100.1'}
+
+
+def test_save_and_reload(cache):
+    cache.set(IP, asn=ASNInfo(asn='AS64500', org='Example Net'), ptr='host.example')
+    cache.save()
+    
+    reloaded = Cache(path=cache.path)
+    assert reloaded.get_asn(IP).org == 'Example Net'
+    assert reloaded.get_ptr(IP) == 'host.example'
+
+
+class TestASNLookupOrgs:
+    def lookup(self, cache, answers: dict):
+        """An ASNLookup whose TXT queries are answered from ``answers``"""
+        lookup = ASNLookup(cache=cache)
+        lookup.queries = []
+        
+        async def query_txt(domain):
+            lookup.queries.append(domain)
+            await asyncio.sleep(0)
+            return answers.get(domain)
+        
+        lookup._query_txt = query_txt
+        return lookup
+    
+    def test_as_without_registration_is_asked_once(self, cache):
+        lookup = self.lookup(cache, {'AS64501.asn.cymru.com': ''})
+        
+        async def main():
+            first = await lookup.lookup_org('AS64501')
+            second = await lookup.lookup_org('AS64501')
+            return first, second
+        
+        first, second = asyncio.run(main())
+        assert first == second == ASNOrg(asn='AS64501')
+        assert lookup.queries == ['AS64501.asn.cymru.com']
+    
+    def test_failed_queries_are_not_cached(self, cache):
+        lookup = self.lookup(cache, {})
+        
+        async def main():
+            return [await lookup.lookup_org('AS64501') for _ in range(2)]
+        
+        assert asyncio.run(main()) == [None, None]
+        assert len(lookup.queries) == 2
+        assert cache.get_asn_org('AS64501') is None
+    
+    def test_concurrent_lookups_share_one_query(self, cache):
+        lookup = self.lookup(cache, {
+            'AS64500.asn.cymru.com': '64500 | US | arin | 2001-01-01 | Example Net, US'
+        })
+        
+        async def main():
+            return await asyncio.gather(*(lookup.lookup_org('AS64500') for _ in range(5)))
+        
+        orgs = asyncio.run(main())
+        assert {org.org for org in orgs} == {'Example Net, US'}
+        assert len(lookup.queries) == 1
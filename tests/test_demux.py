@@ -0,0 +1,36 @@
+"""
+Raw ICMP reply parsing in the LinuxICMPProbe demultiplexer
+"""
+
+import socket
+
+from tracelens.probe.demux import parse_icmp_reply
+from craft import LOCAL_IP, RECV_TIME, ROUTER_IP, TARGET_IP, echo, icmp_error, ip_packet, udp
+
+
+class TestParseICMPReply:
+    def test_echo_reply(self):
+        data = ip_packet(TARGET_IP, LOCAL_IP, socket.IPPROTO_ICMP, echo(0, 0x1234, 9), ttl=57)
+        reply = parse_icmp_reply(data, TARGET_IP, RECV_TIME)
+        
+        assert reply.key == (0x1234, 9)
+        assert (reply.icmp_type, reply.responder_ip, reply.reply_ttl) == (0, TARGET_IP, 57)
+    
+    def test_time_exceeded_quoting_echo_request(self):
+        sent = ip_packet(LOCAL_IP, TARGET_IP, socket.IPPROTO_ICMP, echo(8, 0x1234, 9))
+        reply = parse_icmp_reply(icmp_error(11, 0, sent), ROUTER_IP, RECV_TIME)
+        
+        assert reply.key == (0x1234, 9)
+        assert (reply.icmp_type, reply.icmp_code) == (11, 0)
+    
+    def test_ignores_errors_quoting_other_packets(self):
+        sent = ip_packet(LOCAL_IP, TARGET_IP, socket.IPPROTO_UDP, udp(40000, 33434))
+        assert parse_icmp_reply(icmp_error(11, 0, sent), ROUTER_IP, RECV_TIME) is None
+    
+    def test_ignores_echo_requests_and_truncated_packets(self):
+        request = ip_packet(LOCAL_IP, TARGET_IP, socket.IPPROTO_ICMP, echo(8, 0x1234, 9))
+        sent = ip_packet(LOCAL_IP, TARGET_IP, socket.IPPROTO_ICMP, echo(8, 0x1234, 9))
+        
+        assert parse_icmp_reply(request, LOCAL_IP, RECV_TIME) is None
+        assert parse_icmp_reply(icmp_error(11, 0, sent)[:-4], ROUTER_IP, RECV_TIME) is None
+        assert parse_icmp_reply(b'\x45' + bytes(10), ROUTER_IP, RECV_TIME) is None
@@ -0,0 +1,39 @@
+"""
+Ancillary data of the unprivileged error-queue engines
+"""
+
+import socket
+import struct
+
+from tracelens.probe.batchio import SO_TIMESTAMPNS
+from tracelens.probe.errqueue import IP_RECVERR, SO_EE_ORIGIN_ICMP, parse_ancillary
+from craft import ROUTER_IP
+
+
+def extended_err(origin: int, icmp_type: int, code: int, offender: str) -> bytes:
+    """struct sock_extended_err followed by the offender's sockaddr_in"""
+    return (struct.pack('=IBBBBII', 113, origin, icmp_type, code, 0, 0, 0)
+            + struct.pack('=HH4s', socket.AF_INET, 0, socket.inet_aton(offender)) + bytes(8))
+
+
+def test_queued_error_stamp_and_ttl():
+    error, stamp, reply_ttl = parse_ancillary([
+        (socket.IPPROTO_IP, IP_RECVERR, extended_err(SO_EE_ORIGIN_ICMP, 11, 0, ROUTER_IP)),
+        (socket.SOL_SOCKET, SO_TIMESTAMPNS, struct.pack('@ll', 12, 345)),
+        (socket.IPPROTO_IP, socket.IP_TTL, struct.pack('@i', 247)),
+    ])
+    
+    assert (error.icmp_type, error.icmp_code, error.offender_ip) == (11, 0, ROUTER_IP)
+    assert stamp == 12_000_000_345
+    assert reply_ttl == 247
+
+
+def test_reply_without_error_or_ttl():
+    assert parse_ancillary([]) == (None, None, None)
+
+
+def test_local_errors_are_skipped():
+    error, _, _ = parse_ancillary([
+        (socket.IPPROTO_IP, IP_RECVERR, extended_err(1, 0, 0, '0.0.0.0')),
+    ])
+    assert error is None
@@ -0,0 +1,72 @@
+"""
+Per-prefix path history and distance from reply TTLs
+"""
+
+import pytest
+
+from tracelens.models import HopResult
+from tracelens.probe.history import PathHistory, distance_from_reply_ttl
+from craft import path
+
+
+class TestPathHistory:
+    TARGET = '192.0.2.10'
+    
+    def test_only_complete_paths_are_recorded(self):
+        history = PathHistory()
+        history.add(self.TARGET, path('10.0.0.1', '10.0.1.1', reached=False))
+        history.add(self.TARGET, [])
+        
+        assert len(history) == 0
+        assert history.distance(self.TARGET) is None
+    
+    def test_distance_is_shared_by_the_prefix(self):
+        history = PathHistory()
+        history.add(self.TARGET, path('10.0.0.1', '10.0.1.1', self.TARGET))
+        
+        assert history.distance('192.0.2.99') == 3
+        assert history.distance('192.0.3.10') is None
+    
+    def test_known_matches_ttl_and_interface_below_the_destination(self):
+        history = PathHistory()
+        history.add(self.TARGET, path('10.0.0.1', '10.0.1.1', self.TARGET))
+        
+        assert history.known(self.TARGET, HopResult(hop=2, ip='10.0.1.1'))
+        assert not history.known(self.TARGET, HopResult(hop=2, ip='10.0.0.1'))
+        assert not history.known(self.TARGET, HopResult(hop=2, ip=None))
+        assert not history.known(self.TARGET, HopResult(hop=3, ip=self.TARGET))
+    
+    def test_infer_copies_marked_from_history(self):
+        history = PathHistory()
+        recorded = path('10.0.0.1', '10.0.1.1', '10.0.2.1', self.TARGET)
+        history.add(self.TARGET, recorded)
+        
+        inferred = history.infer(self.TARGET, HopResult(hop=3, ip='10.0.2.1'))
+        
+        assert [hop.ip for hop in inferred] == ['10.0.0.1', '10.0.1.1']
+        assert all(hop.from_history and hop.probes_sent == 0 for hop in inferred)
+        assert all(hop.stop_reason is None for hop in inferred)
+        assert inferred[0] is not recorded[0]
+        assert history.infer(self.TARGET, HopResult(hop=3, ip='10.9.9.9')) == []
+    
+    def test_latest_path_wins(self):
+        history = PathHistory()
+        history.add(self.TARGET, path('10.0.0.1', self.TARGET))
+        history.add(self.TARGET, path('10.0.0.1', '10.0.1.1', self.TARGET))
+        assert history.distance(self.TARGET) == 3
+    
+    def test_least_recent_prefix_is_evicted(self):
+        history = PathHistory(size=2)
+        for target in ('192.0.2.1', '198.51.100.1', '192.0.2.2', '203.0.113.1'):
+            history.add(target, path('10.0.0.1', target))
+        
+        assert len(history) == 2
+        assert history.distance('198.51.100.1') is None
+        assert history.distance('192.0.2.1') == 2
+
+
+@pytest.mark.parametrize('reply_ttl, distance', [
+    (64, 1), (54, 11), (120, 9), (128, 1), (250, 6), (30, 3),
+])
+def test_distance_from_reply_ttl(reply_ttl, distance):
+    assert distance_from_reply_ttl(reply_ttl) == distance
@@ -0,0 +1,44 @@
+"""
+ICMPProbe, the wrapper around the platform's ICMP engine
+"""
+
+import pytest
+
+from tracelens.probe import icmp
+from tracelens.probe.icmp import ICMPProbe
+from tracelens.probe.pacing import Pacer
+from craft import TARGET_IP, PathProbe
+
+
+class LimitedProbe(PathProbe):
+    MAX_INFLIGHT = 64
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    impl = LimitedProbe('10.0.0.1', TARGET_IP)
+    monkeypatch.setattr(icmp, 'create_icmp_probe', lambda timeout: impl)
+    return ICMPProbe()
+
+
+def test_in_flight_cap_is_the_implementations(probe):
+    assert probe.MAX_INFLIGHT == 64
+
+
+def test_limit_inflight_reaches_the_implementation(probe):
+    probe.limit_inflight(10)
+    assert probe._impl._inflight_limit == 10
+
+
+def test_pacer_is_shared_with_the_implementation(probe):
+    assert probe.pacer is None
+    
+    pacer = Pacer(pps=100)
+    probe.pacer = pacer
+    assert probe._impl.pacer is pacer
+    assert probe.pacer is pacer
+
+
+def test_probes_go_through_the_implementation(probe):
+    assert probe.probe(TARGET_IP, 1).responder_ip == '10.0.0.1'
+    assert probe._impl.sent == [1]
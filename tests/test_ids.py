@@ -0,0 +1,76 @@
+"""
+Process-wide probe ID pools
+"""
+
+import pytest
+
+from tracelens.probe.ids import IDPool
+
+
+def test_hands_out_each_id_once():
+    pool = IDPool(1, 4)
+    owner = object()
+    ids = [pool.acquire(owner) for _ in range(4)]
+    
+    assert sorted(ids) == [1, 2, 3, 4]
+    assert len(pool) == 4
+
+
+def test_raises_when_exhausted():
+    pool = IDPool(10, 11, 'test ID')
+    pool.acquire('a')
+    pool.acquire('a')
+    
+    with pytest.raises(RuntimeError, match='All 2 test IDs are in use'):
+        pool.acquire('a')
+
+
+def test_released_ids_are_reused_after_the_rest():
+    pool = IDPool(1, 3)
+    first = pool.acquire('a')
+    second = pool.acquire('a')
+    pool.release(first)
+    
+    # Allocation moves round the range rather than reusing at once
+    third = pool.acquire('a')
+    assert third not in (first, second)
+    assert pool.acquire('a') == first
+
+
+def test_owner_lookup():
+    pool = IDPool(1, 8)
+    a, b = object(), object()
+    id_a = pool.acquire(a)
+    id_b = pool.acquire(b)
+    
+    assert pool.owner(id_a) is a
+    assert pool.owner(id_b) is b
+    pool.release(id_a)
+    assert pool.owner(id_a) is None
+
+
+def test_release_checks_owner():
+    pool = IDPool(1, 8)
+    a, b = object(), object()
+    value = pool.acquire(a)
+    
+    pool.release(value, b)
+    assert pool.owner(value) is a
+    pool.release(value, a)
+    assert pool.owner(value) is None
+
+
+def test_release_all():
+    pool = IDPool(1, 8)
+    a, b = object(), object()
+    for _ in range(3):
+        pool.acquire(a)
+    kept = pool.acquire(b)
+    
+    pool.release_all(a)
+    assert len(pool) == 1
+    assert pool.owner(kept) is b
+
+
+def test_size():
+    assert IDPool(32768, 65535).size == 32768
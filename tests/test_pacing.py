@@ -0,0 +1,88 @@
+"""
+Token bucket and probe pacer
+"""
+
+import asyncio
+
+import pytest
+
+from tracelens.probe.pacing import Pacer, TokenBucket, set_shared_pacer, shared_pacer
+
+
+class TestTokenBucket:
+    def test_spaces_tokens_at_the_rate(self):
+        bucket = TokenBucket(rate=10)
+        assert [bucket.reserve(0.0) for _ in range(3)] == pytest.approx([0.0, 0.1, 0.2])
+    
+    def test_burst_is_free(self):
+        bucket = TokenBucket(rate=10, burst=3)
+        waits = [bucket.reserve(0.0) for _ in range(5)]
+        assert waits == pytest.approx([0.0, 0.0, 0.0, 0.1, 0.2])
+    
+    def test_refills_while_idle(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        for _ in range(4):
+            bucket.reserve(0.0)
+        
+        # Idle time refills the bucket, but never beyond the burst
+        assert bucket.reserve(10.0) == 0.0
+        assert bucket.reserve(10.0) == 0.0
+        assert bucket.reserve(10.0) == pytest.approx(0.1)
+    
+    def test_waits_shrink_as_time_passes(self):
+        bucket = TokenBucket(rate=10)
+        bucket.reserve(0.0)
+        assert bucket.reserve(0.04) == pytest.approx(0.06)
+    
+    def test_burst_of_at_least_one(self):
+        assert TokenBucket(rate=10, burst=0).burst == 1
+
+
+class TestPacer:
+    def test_counts_delayed_probes(self):
+        pacer = Pacer(pps=10)
+        delays = [pacer.reserve('192.0.2.1') for _ in range(3)]
+        
+        assert delays[0] == 0.0
+        assert delays[2] > delays[1] > 0.0
+        stats = pacer.stats
+        assert (stats.probes, stats.delayed) == (3, 2)
+        assert stats.max_wait == delays[2]
+        assert stats.mean_wait == pytest.approx(sum(delays) / 3)
+    
+    def test_prefix_limit_is_per_prefix(self):
+        pacer = Pacer(pps=1_000_000, prefix_pps=1)
+        assert pacer.reserve('192.0.2.1') < 0.01
+        # Same /24: waits for the prefix bucket
+        assert pacer.reserve('192.0.2.200') > 0.9
+        # Another /24 has its own bucket
+        assert pacer.reserve('198.51.100.1') < 0.01
+    
+    def test_prefix_buckets_are_bounded(self, monkeypatch):
+        monkeypatch.setattr(Pacer, 'MAX_PREFIXES', 2)
+        pacer = Pacer(pps=1_000_000, prefix_pps=1)
+        for ip in ('192.0.2.1', '198.51.100.1', '203.0.113.1'):
+            pacer.reserve(ip)
+        assert len(pacer._prefixes) == 2
+    
+    def test_wait_async_sleeps_for_the_delay(self):
+        pacer = Pacer(pps=20)
+        
+        async def main():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            for _ in range(3):
+                await pacer.wait_async('192.0.2.1')
+            return loop.time() - started
+        
+        assert asyncio.run(main()) >= 0.09
+
+
+def test_shared_pacer_can_be_installed_and_removed():
+    pacer = Pacer(pps=100)
+    set_shared_pacer(pacer)
+    try:
+        assert shared_pacer() is pacer
+    finally:
+        set_shared_pacer(None)
+    assert shared_pacer() is None
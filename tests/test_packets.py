@@ -0,0 +1,112 @@
+"""
+Incremental checksums and packet templates
+"""
+
+import random
+import struct
+
+import pytest
+
+from tracelens.probe.packets import PacketTemplate, TemplateCache, checksum, checksum_update
+
+
+def with_checksum(data: bytes, offset: int) -> bytes:
+    """``data`` with a fresh checksum over all of it written at ``offset``"""
+    zeroed = data[:offset] + b'\x00\x00' + data[offset + 2:]
+    return zeroed[:offset] + struct.pack('!H', checksum(zeroed)) + zeroed[offset + 2:]
+
+
+def test_checksum_known_value():
+    # RFC 1071 section 3 example
+    assert checksum(bytes.fromhex('0001f203f4f5f6f7')) == ~0xDDF2 & 0xFFFF
+
+
+def test_checksum_of_odd_length_pads_with_zero():
+    assert checksum(b'\x12\x34\x56') == checksum(b'\x12\x34\x56\x00')
+
+
+def test_packet_with_its_checksum_sums_to_zero():
+    packet = with_checksum(bytes(range(40)), 2)
+    assert checksum(packet) == 0
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_checksum_update_matches_full_checksum(seed):
+    rng = random.Random(seed)
+    words = [rng.randrange(0x10000) for _ in range(16)]
+    data = struct.pack('!16H', *words)
+    
+    index = rng.randrange(16)
+    new = rng.choice([0, 0xFFFF, rng.randrange(0x10000)])
+    changed = words.copy()
+    changed[index] = new
+    
+    updated = checksum_update(checksum(data), words[index], new)
+    assert updated == checksum(struct.pack('!16H', *changed))
+
+
+class TestPacketTemplate:
+    CHECKSUM_OFFSET = 2
+    
+    def template(self, seed: int) -> PacketTemplate:
+        rng = random.Random(seed)
+        packet = with_checksum(bytes(rng.randrange(256) for _ in range(48)), self.CHECKSUM_OFFSET)
+        return PacketTemplate(packet, self.CHECKSUM_OFFSET)
+    
+    def assert_valid(self, template: PacketTemplate):
+        packet = template.packet()
+        assert packet == with_checksum(packet, self.CHECKSUM_OFFSET)
+    
+    @pytest.mark.parametrize('seed', range(10))
+    def test_patched_fields_keep_checksum_valid(self, seed):
+        rng = random.Random(seed)
+        template = self.template(seed)
+        
+        template.set16(6, rng.randrange(0x10000))
+        self.assert_valid(template)
+        template.set32(8, rng.randrange(1 << 32))
+        self.assert_valid(template)
+        template.set64(16, rng.randrange(1 << 64))
+        self.assert_valid(template)
+        template.set_bytes(24, bytes(rng.randrange(256) for _ in range(8)))
+        self.assert_valid(template)
+    
+    def test_all_ones_and_zero_fields(self):
+        template = self.template(0)
+        for value in (0, 0xFFFF, 0, 0xFFFF):
+            template.set16(6, value)
+            self.assert_valid(template)
+    
+    def test_unchecksummed_fields_leave_checksum_alone(self):
+        template = self.template(0)
+        before = template.packet()
+        
+        template.set16(6, 0xBEEF, checksummed=False)
+        template.set8(10, 7)
+        
+        after = template.packet()
+        assert after[6:8] == b'\xbe\xef' and after[10] == 7
+        assert after[2:4] == before[2:4]
+    
+    def test_packet_is_a_snapshot(self):
+        template = self.template(0)
+        first = template.packet()
+        template.set16(6, 0x0101)
+        assert first != template.packet()
+
+
+def test_template_cache_builds_once_and_evicts_least_recent():
+    built = []
+    
+    def build(key):
+        built.append(key)
+        return PacketTemplate(bytes(4))
+    
+    cache = TemplateCache(build, size=2)
+    a = cache.get('a')
+    cache.get('b')
+    assert cache.get('a') is a
+    cache.get('c')  # evicts 'b'
+    cache.get('b')
+    
+    assert built == ['a', 'b', 'c', 'b']
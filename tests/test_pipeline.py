@@ -0,0 +1,81 @@
+"""
+In-order delivery from the background enrichment pipeline
+"""
+
+import threading
+
+import pytest
+
+from tracelens.batch import plain_hop
+from tracelens.pipeline import EnrichmentPipeline
+from craft import path
+
+
+HOPS = path('10.0.0.1', '10.0.1.1', None, '10.0.3.1', '192.0.2.1')
+
+
+def tagged(hop):
+    enriched = plain_hop(hop)
+    enriched.ptr = f'hop{hop.hop}.example'
+    return enriched
+
+
+def test_hops_are_delivered_in_order_as_they_finish():
+    # Hop 1 finishes last; nothing may be delivered before it
+    release = threading.Event()
+    
+    def enrich(hop):
+        if hop.hop == 1:
+            release.wait(5)
+        return tagged(hop)
+    
+    ready = []
+    pipeline = EnrichmentPipeline(enrich, on_ready=ready.append, workers=4)
+    for hop in HOPS:
+        pipeline.push(hop)
+    
+    assert ready == []
+    release.set()
+    hops = pipeline.close()
+    
+    assert [hop.hop for hop in ready] == [1, 2, 3, 4, 5]
+    assert hops == ready
+    assert [hop.ptr for hop in hops] == [f'hop{n}.example' for n in range(1, 6)]
+
+
+def test_failed_enrichment_delivers_the_plain_hop():
+    def enrich(hop):
+        if hop.hop == 2:
+            raise ValueError('lookup failed')
+        return tagged(hop)
+    
+    with EnrichmentPipeline(enrich) as pipeline:
+        for hop in HOPS:
+            pipeline.push(hop)
+    
+    assert [hop.ptr for hop in pipeline.hops] == [
+        'hop1.example', None, 'hop3.example', 'hop4.example', 'hop5.example'
+    ]
+    assert pipeline.hops[1].ip == '10.0.1.1'
+
+
+def test_error_in_the_block_skips_enrichment_not_yet_started():
+    started = threading.Event()
+    release = threading.Event()
+    
+    def enrich(hop):
+        started.set()
+        release.wait(5)
+        return tagged(hop)
+    
+    with pytest.raises(KeyboardInterrupt):
+        with EnrichmentPipeline(enrich, workers=1) as pipeline:
+            for hop in HOPS:
+                pipeline.push(hop)
+            started.wait(5)
+            threading.Timer(0.05, release.set).start()
+            raise KeyboardInterrupt
+    
+    # Only the hop already being enriched was; the rest are plain
+    assert [hop.hop for hop in pipeline.hops] == [1, 2, 3, 4, 5]
+    assert [hop.ptr for hop in pipeline.hops] == ['hop1.example', None, None, None, None]
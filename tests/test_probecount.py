@@ -0,0 +1,63 @@
+"""
+Adaptive number of probes per hop
+"""
+
+from tracelens.models import ProbeResult
+from tracelens.probe.probecount import AdaptiveProbeCount
+
+
+def answer(rtt_ms: float, ip: str = '203.0.113.1') -> ProbeResult:
+    return ProbeResult(responder_ip=ip, rtt_ms=rtt_ms)
+
+
+SILENT = ProbeResult()
+
+
+def test_minimum_is_always_sent():
+    count = AdaptiveProbeCount(min_probes=2, max_probes=6)
+    assert count.needs_more([])
+    assert count.needs_more([answer(10.0)])
+
+
+def test_consistent_answers_stop_at_minimum():
+    count = AdaptiveProbeCount(min_probes=2, max_probes=6)
+    assert not count.needs_more([answer(10.0), answer(11.0)])
+
+
+def test_different_responders_get_more_probes():
+    count = AdaptiveProbeCount(min_probes=2, max_probes=6)
+    assert count.needs_more([answer(10.0, '203.0.113.1'), answer(10.0, '203.0.113.2')])
+
+
+def test_jitter_gets_more_probes():
+    count = AdaptiveProbeCount(min_probes=2, max_probes=6, jitter_ms=5.0, jitter_ratio=0.2)
+    # 20% of 10 ms is 2 ms, so the 5 ms floor applies
+    assert not count.needs_more([answer(10.0), answer(14.9)])
+    assert count.needs_more([answer(10.0), answer(15.1)])
+    # On a slow hop the ratio is larger than the floor
+    assert not count.needs_more([answer(100.0), answer(119.0)])
+    assert count.needs_more([answer(100.0), answer(121.0)])
+
+
+def test_silence_and_single_answers_stop_at_minimum():
+    count = AdaptiveProbeCount(min_probes=2, max_probes=6)
+    assert not count.needs_more([SILENT, SILENT])
+    assert not count.needs_more([answer(10.0), SILENT])
+
+
+def test_maximum_is_never_exceeded():
+    count = AdaptiveProbeCount(min_probes=2, max_probes=3)
+    results = [answer(10.0, '203.0.113.1'), answer(10.0, '203.0.113.2'), answer(50.0)]
+    assert not count.needs_more(results)
+
+
+def test_minimum_above_maximum_is_lowered():
+    count = AdaptiveProbeCount(min_probes=5, max_probes=3)
+    assert (count.min_probes, count.max_probes) == (3, 3)
+    assert count.needs_more([SILENT, SILENT])
+    assert not count.needs_more([SILENT, SILENT, SILENT])
+
+
+def test_at_least_one_probe():
+    count = AdaptiveProbeCount(min_probes=0, max_probes=0)
+    assert (count.min_probes, count.max_probes) == (1, 1)
@@ -0,0 +1,158 @@
+"""
+EnrichmentService over fake ASN, geo and PTR sources
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('dns.asyncresolver')
+pytest.importorskip('httpx')
+
+from tracelens.cache import Cache
+from tracelens.enrichment.asn_lookup import ASNInfo
+from tracelens.enrichment.service import EnrichmentService
+from tracelens.models import GeoInfo, HopResult
+
+
+PUBLIC = ('8.8.8.8', '1.1.1.1', '9.9.9.9')
+PRIVATE = '10.0.0.1'
+
+
+class FakeSource:
+    """Answers every IP after a short delay and records what it was asked"""
+    
+    def __init__(self, answer, fail: bool = False):
+        self.answer = answer
+        self.fail = fail
+        self.calls: list[str] = []
+        self.batches: list[list[str]] = []
+    
+    async def _one(self, ip: str):
+        self.calls.append(ip)
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise OSError('source down')
+        return self.answer(ip)
+    
+    async def _many(self, ips: list[str]) -> dict:
+        self.batches.append(sorted(ips))
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise OSError('source down')
+        return {ip: self.answer(ip) for ip in ips}
+    
+    lookup = resolve = _one
+    lookup_many = resolve_many = _many
+    
+    async def close(self):
+        pass
+
+
+def hop(ttl: int, ip: str) -> HopResult:
+    return HopResult(hop=ttl, ip=ip, rtts=[float(ttl)], probes_sent=3)
+
+
+@pytest.fixture
+def sources():
+    return {
+        'asn': FakeSource(lambda ip: ASNInfo(asn='AS64500', org='Example Net', country='US')),
+        'geo': FakeSource(lambda ip: GeoInfo(country='Germany', country_code='DE')),
+        'ptr': FakeSource(lambda ip: f'{ip.replace(".", "-")}.example'),
+    }
+
+
+@pytest.fixture
+def make_service(sources):
+    services = []
+    
+    def make(cache=None, fail=()):
+        service = EnrichmentService(cache=cache)
+        for name in fail:
+            sources[name].fail = True
+        service._asn, service._geo, service._ptr = sources['asn'], sources['geo'], sources['ptr']
+        services.append(service)
+        return service
+    
+    yield make
+    for service in services:
+        service.close()
+
+
+class TestEnrich:
+    def test_public_hop_gets_every_lookup(self, make_service):
+        enriched = make_service().enrich(hop(3, PUBLIC[0]))
+        
+        assert (enriched.asn, enriched.org) == ('AS64500', 'Example Net')
+        assert enriched.geo.country_code == 'DE'
+        assert enriched.ptr == '8-8-8-8.example'
+        assert enriched.hop == 3 and enriched.probes_sent == 3
+    
+    def test_private_and_silent_hops_are_not_looked_up(self, make_service, sources):
+        service = make_service()
+        private, silent = service.enrich_many([hop(1, PRIVATE), HopResult(hop=2)])
+        
+        assert private.ip_type == 'private' and private.asn is None
+        assert silent.ip is None
+        assert not any(source.calls for source in sources.values())
+    
+    def test_concurrent_requests_for_one_ip_share_its_lookups(self, make_service, sources):
+        hops = make_service().enrich_many([hop(ttl, PUBLIC[0]) for ttl in (1, 2, 3)])
+        
+        assert [enriched.ptr for enriched in hops] == ['8-8-8-8.example'] * 3
+        assert all(source.calls == [PUBLIC[0]] for source in sources.values())
+    
+    def test_cached_data_is_not_looked_up_again(self, make_service, sources, tmp_path):
+        cache = Cache(path=tmp_path / 'cache.json')
+        service = make_service(cache=cache)
+        service.enrich(hop(1, PUBLIC[0]))
+        
+        enriched = service.enrich(hop(1, PUBLIC[0]))
+        assert enriched.org == 'Example Net' and enriched.ptr == '8-8-8-8.example'
+        assert all(len(source.calls) == 1 for source in sources.values())
+    
+    def test_failed_source_leaves_the_others(self, make_service):
+        enriched = make_service(fail=('geo',)).enrich(hop(1, PUBLIC[0]))
+        
+        assert enriched.asn == 'AS64500' and enriched.ptr == '8-8-8-8.example'
+        # Country falls back to the ASN registration
+        assert enriched.geo == GeoInfo(country_code='US')
+    
+    def test_enrich_async_from_another_loop(self, make_service):
+        service = make_service()
+        enriched = asyncio.run(service.enrich_async(hop(1, PUBLIC[1])))
+        assert enriched.ptr == '1-1-1-1.example'
+
+
+class TestEnrichTrace:
+    def test_traces_within_the_window_share_one_batch(self, make_service, sources):
+        service = make_service()
+        traces = [
+            [hop(1, PRIVATE), hop(2, PUBLIC[0]), hop(3, PUBLIC[1])],
+            [hop(1, PRIVATE), hop(2, PUBLIC[0]), hop(3, PUBLIC[2])],
+        ]
+        
+        async def both():
+            return await asyncio.gather(*(service.enrich_trace_async(t) for t in traces))
+        
+        first, second = asyncio.run(both())
+        
+        assert [enriched.hop for enriched in first] == [1, 2, 3]
+        assert first[2].ptr == '1-1-1-1.example' and second[2].ptr == '9-9-9-9.example'
+        for source in sources.values():
+            assert source.batches == [sorted(PUBLIC)]
+            assert source.calls == []
+    
+    def test_cached_ips_are_left_out_of_the_batch(self, make_service, sources, tmp_path):
+        cache = Cache(path=tmp_path / 'cache.json')
+        service = make_service(cache=cache)
+        service.enrich_trace([hop(1, PUBLIC[0])])
+        
+        enriched = service.enrich_trace([hop(1, PUBLIC[0]), hop(2, PUBLIC[1])])
+        
+        assert enriched[0].org == 'Example Net'
+        assert sources['ptr'].batches == [[PUBLIC[0]], [PUBLIC[1]]]
+    
+    def test_failed_batch_leaves_the_other_sources(self, make_service):
+        enriched = make_service(fail=('ptr',)).enrich_trace([hop(1, PUBLIC[0])])
+        assert enriched[0].asn == 'AS64500' and enriched[0].ptr is None
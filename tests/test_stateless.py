@@ -0,0 +1,78 @@
+"""
+StatelessProbe's reply decoding: target, TTL and send time from the quote
+"""
+
+import socket
+import time
+from collections import deque
+
+import pytest
+
+from tracelens.probe.packets import TemplateCache
+from tracelens.probe.stateless import StatelessProbe
+from craft import LOCAL_IP, ROUTER_IP, TARGET_IP, echo, engine, icmp_error, ip_packet
+
+
+class TestStatelessDecode:
+    INSTANCE = 0x2345
+    SEND_UNITS = 1000
+    
+    @pytest.fixture
+    def probe(self):
+        probe = engine(StatelessProbe, instance=self.INSTANCE, _by_hop={})
+        probe._templates = TemplateCache(probe._build_template)
+        return probe
+    
+    def test_time_exceeded_carries_target_ttl_and_send_time(self, probe):
+        sent = probe._build_packet(TARGET_IP, 7, self.SEND_UNITS)
+        reply = probe.decode(icmp_error(11, 0, sent), ROUTER_IP, self.SEND_UNITS + 250)
+        
+        target_ip, ttl, result = reply
+        assert (target_ip, ttl) == (TARGET_IP, 7)
+        assert result.responder_ip == ROUTER_IP and not result.reached_target
+        assert result.rtt_ms == 25.0
+    
+    def test_send_time_wraps_in_the_sequence(self, probe):
+        send_units = probe.SEQ_WRAP * 3 - 10
+        sent = probe._build_packet(TARGET_IP, 7, send_units)
+        _, _, result = probe.decode(icmp_error(11, 0, sent), ROUTER_IP, send_units + 30)
+        assert result.rtt_ms == 3.0
+    
+    def test_echo_reply_carries_ttl_and_send_time_in_payload(self, probe):
+        sent = probe._build_packet(TARGET_IP, 12, self.SEND_UNITS)
+        payload = sent[28:]
+        data = ip_packet(TARGET_IP, LOCAL_IP, socket.IPPROTO_ICMP,
+                         echo(0, self.INSTANCE, self.SEND_UNITS, payload))
+        
+        target_ip, ttl, result = probe.decode(data, TARGET_IP, self.SEND_UNITS + 400)
+        assert (target_ip, ttl) == (TARGET_IP, 12)
+        assert result.reached_target and result.rtt_ms == 40.0
+    
+    def test_other_instances_and_late_replies_are_ignored(self, probe):
+        sent = probe._build_packet(TARGET_IP, 7, self.SEND_UNITS)
+        data = icmp_error(11, 0, sent)
+        
+        other = engine(StatelessProbe, instance=self.INSTANCE + 1, _by_hop={})
+        assert other.decode(data, ROUTER_IP, self.SEND_UNITS + 250) is None
+        
+        too_late = self.SEND_UNITS + int(probe.timeout * 1000 * probe.UNITS_PER_MS) + 1
+        assert probe.decode(data, ROUTER_IP, too_late) is None
+    
+    def test_truncated_packets_are_ignored(self, probe):
+        sent = probe._build_packet(TARGET_IP, 7, self.SEND_UNITS)
+        data = icmp_error(11, 0, sent)
+        assert probe.decode(data[:-4], ROUTER_IP, self.SEND_UNITS + 250) is None
+        assert probe.decode(data[:24], ROUTER_IP, self.SEND_UNITS + 250) is None
+    
+    def test_match_reply_takes_the_oldest_probe_for_the_hop(self, probe):
+        for key in ('first', 'second'):
+            probe._track(key, TARGET_IP, 7, time.perf_counter())
+            probe._by_hop.setdefault((TARGET_IP, 7), deque()).append(key)
+        
+        sent = probe._build_packet(TARGET_IP, 7, probe._now_units())
+        data = icmp_error(11, 0, sent)
+        
+        assert probe._match_reply(None, data, ROUTER_IP, time.perf_counter())[0] == 'first'
+        assert probe._match_reply(None, data, ROUTER_IP, time.perf_counter())[0] == 'second'
+        assert probe._match_reply(None, data, ROUTER_IP, time.perf_counter()) is None
+        assert not probe._pending
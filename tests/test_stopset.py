@@ -0,0 +1,56 @@
+"""
+Doubletree local stop set
+"""
+
+from tracelens.models import HopResult
+from tracelens.probe.stopset import StopSet
+from craft import path
+
+
+class TestStopSet:
+    def test_near_side_ttls_run_backwards_from_start(self):
+        assert list(StopSet(5).near_side(30)) == [4, 3, 2, 1]
+        assert list(StopSet(5).near_side(2)) == [2, 1]
+        assert StopSet(1).near_side(30) is None
+    
+    def test_records_hops_below_start_ttl(self):
+        stop_set = StopSet(4)
+        stop_set.add(path('10.0.0.1', '10.0.1.1', '10.0.2.1', '10.0.3.1', '192.0.2.1'))
+        
+        assert len(stop_set) == 3
+        assert HopResult(hop=3, ip='10.0.2.1') in stop_set
+        assert HopResult(hop=4, ip='10.0.3.1') not in stop_set
+        # Membership is by (TTL, interface)
+        assert HopResult(hop=2, ip='10.0.2.1') not in stop_set
+    
+    def test_skips_silent_hops_and_the_destination(self):
+        stop_set = StopSet(5)
+        stop_set.add(path('10.0.0.1', None, '192.0.2.1'))
+        
+        assert len(stop_set) == 1
+        assert HopResult(hop=2, ip=None) not in stop_set
+        assert HopResult(hop=3, ip='192.0.2.1') not in stop_set
+    
+    def test_infers_hops_in_front_of_a_known_interface(self):
+        stop_set = StopSet(5)
+        first = path('10.0.0.1', '10.0.1.1', '10.0.2.1', '10.0.3.1', '192.0.2.1')
+        stop_set.add(first)
+        
+        inferred = stop_set.infer(HopResult(hop=3, ip='10.0.2.1'))
+        
+        assert [(hop.hop, hop.ip) for hop in inferred] == [(1, '10.0.0.1'), (2, '10.0.1.1')]
+        assert all(hop.from_stop_set and hop.probes_sent == 0 for hop in inferred)
+        # Copies, not the recorded trace's own hops
+        inferred[0].rtts.append(99.0)
+        assert first[0].rtts == [1.0] and not first[0].from_stop_set
+    
+    def test_first_discovery_is_kept(self):
+        stop_set = StopSet(5)
+        stop_set.add(path('10.0.0.1', '10.0.1.1', '192.0.2.1'))
+        stop_set.add(path('10.9.0.1', '10.0.1.1', '192.0.2.2'))
+        
+        inferred = stop_set.infer(HopResult(hop=2, ip='10.0.1.1'))
+        assert [hop.ip for hop in inferred] == ['10.0.0.1']
+    
+    def test_unknown_hop_infers_nothing(self):
+        assert StopSet().infer(HopResult(hop=2, ip='10.0.1.1')) == []
@@ -0,0 +1,82 @@
+"""
+Matching SYN-ACK/RST and Time Exceeded replies to TCPProbe's SYNs
+"""
+
+import socket
+
+import pytest
+
+from tracelens.probe.tcp import TCPProbe
+from craft import (
+    LOCAL_IP, RECV_TIME, ROUTER_IP, SEND_TIME, TARGET_IP, engine, icmp_error, ip_packet, tcp
+)
+
+
+class TestTCPMatchReply:
+    SRC_PORT = 40000
+    SEQ = 0x01020304
+    
+    @pytest.fixture
+    def probe(self):
+        probe = engine(TCPProbe, port=80, reset=False, _seqs={self.SRC_PORT: self.SEQ},
+                       _tcp_socket=object(), _icmp_socket=object())
+        probe._track(self.SRC_PORT, TARGET_IP, 5, SEND_TIME)
+        return probe
+    
+    def segment(self, flags: int, ack: int = SEQ + 1, src_port: int = 80) -> bytes:
+        return ip_packet(TARGET_IP, LOCAL_IP, socket.IPPROTO_TCP,
+                         tcp(src_port, self.SRC_PORT, seq=777, ack=ack, flags=flags), ttl=60)
+    
+    def time_exceeded(self, seq: int = SEQ, dst_ip: str = TARGET_IP) -> bytes:
+        sent = ip_packet(LOCAL_IP, dst_ip, socket.IPPROTO_TCP, tcp(self.SRC_PORT, 80, seq=seq))
+        return icmp_error(11, 0, sent)
+    
+    @pytest.mark.parametrize('flags', [0x12, 0x14])
+    def test_syn_ack_or_rst_reaches_target(self, probe, flags):
+        key, result = probe._match_reply(probe._tcp_socket, self.segment(flags), TARGET_IP, RECV_TIME)
+        
+        assert key == self.SRC_PORT
+        assert result.reached_target and result.responder_ip == TARGET_IP
+        assert result.rtt_ms == pytest.approx(25.0)
+        assert result.reply_ttl == 60
+    
+    def test_wrong_ack_or_port_is_ignored(self, probe):
+        tcp_socket = probe._tcp_socket
+        assert probe._match_reply(tcp_socket, self.segment(0x12, ack=self.SEQ), TARGET_IP,
+                                  RECV_TIME) is None
+        assert probe._match_reply(tcp_socket, self.segment(0x12, src_port=443), TARGET_IP,
+                                  RECV_TIME) is None
+        assert probe._match_reply(tcp_socket, self.segment(0x02), TARGET_IP, RECV_TIME) is None
+        assert self.SRC_PORT in probe._pending
+    
+    def test_reset_answers_syn_ack(self, probe):
+        resets = []
+        probe.reset = True
+        probe._send_reset = lambda *args: resets.append(args)
+        
+        probe._match_reply(probe._tcp_socket, self.segment(0x12), TARGET_IP, RECV_TIME)
+        assert resets == [(TARGET_IP, self.SRC_PORT, self.SEQ + 1)]
+    
+    def test_reset_not_sent_for_rst(self, probe):
+        resets = []
+        probe.reset = True
+        probe._send_reset = lambda *args: resets.append(args)
+        
+        probe._match_reply(probe._tcp_socket, self.segment(0x14), TARGET_IP, RECV_TIME)
+        assert resets == []
+    
+    def test_time_exceeded_quoting_our_syn(self, probe):
+        key, result = probe._match_reply(probe._icmp_socket, self.time_exceeded(), ROUTER_IP,
+                                         RECV_TIME)
+        
+        assert key == self.SRC_PORT
+        assert result.responder_ip == ROUTER_IP and not result.reached_target
+        assert result.reply_ttl == 250
+        assert self.SRC_PORT not in probe._seqs
+    
+    def test_time_exceeded_for_another_syn_is_ignored(self, probe):
+        icmp_socket = probe._icmp_socket
+        assert probe._match_reply(icmp_socket, self.time_exceeded(seq=self.SEQ + 1), ROUTER_IP,
+                                  RECV_TIME) is None
+        assert probe._match_reply(icmp_socket, self.time_exceeded(dst_ip='192.0.2.99'), ROUTER_IP,
+                                  RECV_TIME) is None
@@ -0,0 +1,85 @@
+"""
+Adaptive probe timeouts from observed RTTs
+"""
+
+import pytest
+
+from tracelens.probe.timeouts import AdaptiveTimeout, RTTEstimator, TimeoutHistory
+from tracelens.probe.tracer import Tracer
+from craft import TARGET_IP, PathProbe
+
+
+class TestRTTEstimator:
+    def test_first_sample(self):
+        estimator = RTTEstimator()
+        assert estimator.rto_ms is None
+        
+        estimator.observe(10.0)
+        assert (estimator.srtt, estimator.rttvar) == (10.0, 5.0)
+        assert estimator.rto_ms == 30.0
+    
+    def test_later_samples_are_smoothed(self):
+        estimator = RTTEstimator()
+        estimator.observe(10.0)
+        estimator.observe(18.0)
+        
+        # RFC 6298: RTTVAR from the old SRTT, then SRTT
+        assert estimator.rttvar == pytest.approx(0.75 * 5.0 + 0.25 * 8.0)
+        assert estimator.srtt == pytest.approx(0.875 * 10.0 + 0.125 * 18.0)
+
+
+class TestAdaptiveTimeout:
+    def test_ceiling_until_an_rtt_is_known(self):
+        timeouts = AdaptiveTimeout(TARGET_IP, ceiling=2.0)
+        assert timeouts.timeout() == 2.0
+        
+        timeouts.observe(None)
+        assert timeouts.timeout() == 2.0
+    
+    def test_follows_rtts_within_floor_and_ceiling(self):
+        timeouts = AdaptiveTimeout(TARGET_IP, ceiling=2.0, floor=0.01)
+        timeouts.observe(100.0)
+        assert timeouts.timeout() == pytest.approx(0.3)
+        
+        fast = AdaptiveTimeout(TARGET_IP, ceiling=2.0, floor=0.2)
+        fast.observe(1.0)
+        assert fast.timeout() == 0.2
+    
+    def test_retries_double_up_to_the_ceiling(self):
+        timeouts = AdaptiveTimeout(TARGET_IP, ceiling=2.0, floor=0.01)
+        timeouts.observe(100.0)
+        
+        assert [timeouts.timeout(retries) for retries in range(4)] == pytest.approx(
+            [0.3, 0.6, 1.2, 2.0]
+        )
+    
+    def test_floor_never_exceeds_ceiling(self):
+        assert AdaptiveTimeout(TARGET_IP, ceiling=0.1, floor=0.5).floor == 0.1
+    
+    def test_history_seeds_later_traces_to_the_prefix(self):
+        history = TimeoutHistory()
+        AdaptiveTimeout(TARGET_IP, ceiling=2.0, floor=0.01, history=history).observe(100.0)
+        
+        same_prefix = AdaptiveTimeout('192.0.2.200', ceiling=2.0, floor=0.01, history=history)
+        other_prefix = AdaptiveTimeout('198.51.100.1', ceiling=2.0, history=history)
+        assert same_prefix.timeout() == pytest.approx(0.3)
+        assert other_prefix.timeout() == 2.0
+
+
+class TimedPathProbe(PathProbe):
+    def __init__(self, *ips):
+        super().__init__(*ips)
+        self.timeouts = []
+    
+    def probe(self, target_ip, ttl, timeout=None):
+        self.timeouts.append(timeout)
+        return super().probe(target_ip, ttl, timeout)
+
+
+def test_tracer_waits_less_once_hops_answer():
+    probe = TimedPathProbe('10.0.0.1', None, TARGET_IP)
+    Tracer(TARGET_IP, probe=probe, timeout=2.0, adaptive_timeout=True, min_timeout=0.01).trace()
+    
+    # Hop 1 starts at the full timeout; the silent hop 2 doubles per retry
+    assert probe.timeouts[0] == 2.0
+    assert probe.timeouts[3:6] == pytest.approx([0.01, 0.02, 0.04], abs=0.005)
@@ -0,0 +1,212 @@
+"""
+Tracer orchestration over an engine that answers from a fixed path
+"""
+
+import asyncio
+
+import pytest
+
+from tracelens.probe.history import PathHistory
+from tracelens.probe.stopset import StopSet
+from tracelens.probe.tracer import Tracer
+from craft import TARGET_IP, PathProbe, path
+
+
+ROUTERS = ('10.0.0.1', '10.0.1.1', '10.0.2.1', '10.0.3.1', '10.0.4.1')
+
+
+def trace(probe: PathProbe, run_async: bool = False, **options):
+    tracer = Tracer(TARGET_IP, probe=probe, **options)
+    if run_async:
+        return asyncio.run(tracer.trace_async())
+    return tracer.trace()
+
+
+class TestPredictedStart:
+    @pytest.fixture
+    def history(self):
+        history = PathHistory()
+        history.add(TARGET_IP, path(*ROUTERS, TARGET_IP))
+        return history
+    
+    @pytest.mark.parametrize('run_async', [False, True])
+    def test_parallel_near_side_keeps_every_probed_hop(self, history, run_async):
+        probe = PathProbe(*ROUTERS, TARGET_IP)
+        hops = trace(probe, run_async, parallel=True, predict_start=True, path_history=history)
+        
+        # The whole near side fits in one window: every hop was measured
+        assert [hop.ip for hop in hops] == [*ROUTERS, TARGET_IP]
+        assert not any(hop.from_history for hop in hops)
+        assert all(hop.probes_sent == 3 for hop in hops)
+        assert probe.sent.count(1) == 3
+    
+    @pytest.mark.parametrize('run_async', [False, True])
+    def test_parallel_near_side_copies_only_below_the_window(self, history, run_async):
+        probe = PathProbe(*ROUTERS, TARGET_IP)
+        hops = trace(probe, run_async, parallel=True, window=2, predict_start=True,
+                     path_history=history)
+        
+        assert [hop.ip for hop in hops] == [*ROUTERS, TARGET_IP]
+        assert [hop.from_history for hop in hops] == [True] * 3 + [False] * 3
+        assert [hop.probes_sent for hop in hops] == [0, 0, 0, 3, 3, 3]
+        assert not {1, 2, 3} & set(probe.sent)
+        assert hops[-1].stop_reason == 'reached'
+    
+    def test_sequential_near_side_stops_at_the_first_known_hop(self, history):
+        probe = PathProbe(*ROUTERS, TARGET_IP)
+        hops = trace(probe, predict_start=True, path_history=history)
+        
+        assert [hop.from_history for hop in hops] == [True] * 4 + [False] * 2
+        assert sorted(probe.sent) == [5] * 3 + [6] * 3
+    
+    def test_new_prefix_starts_at_the_reply_ttl_distance(self):
+        probe = PathProbe(*ROUTERS, TARGET_IP)
+        hops = trace(probe, predict_start=True, max_hops=20)
+        
+        # One probe at max_hops, then backwards from below the destination
+        assert probe.sent[0] == 20
+        assert probe.sent[1:4] == [5, 5, 5]
+        assert [hop.ip for hop in hops] == [*ROUTERS, TARGET_IP]
+
+
+class TestStopSetNearSide:
+    @pytest.mark.parametrize('run_async', [False, True])
+    def test_parallel_near_side_copies_only_below_the_window(self, run_async):
+        stop_set = StopSet(start_ttl=5)
+        stop_set.add(path(*ROUTERS, '192.0.2.99'))
+        
+        probe = PathProbe(*ROUTERS, TARGET_IP)
+        hops = trace(probe, run_async, parallel=True, window=2, stop_set=stop_set)
+        
+        assert [hop.ip for hop in hops] == [*ROUTERS, TARGET_IP]
+        assert [hop.from_stop_set for hop in hops] == [True] * 2 + [False] * 4
+        assert [hop.probes_sent for hop in hops] == [0, 0, 3, 3, 3, 3]
+        assert not {1, 2} & set(probe.sent)
+
+
+class InFlightPathProbe(PathProbe):
+    """Records the most probes ever awaiting poll() at once"""
+    
+    def __init__(self, *ips):
+        super().__init__(*ips)
+        self.max_in_flight = 0
+    
+    def send(self, target_ip, ttl, timeout=None):
+        key = super().send(target_ip, ttl, timeout)
+        self.max_in_flight = max(self.max_in_flight, len(self._answers))
+        return key
+
+
+class TestParallel:
+    @staticmethod
+    def summary(hops):
+        return [(hop.hop, hop.ip, hop.probes_sent, hop.stop_reason) for hop in hops]
+    
+    @pytest.mark.parametrize('run_async', [False, True])
+    def test_same_hops_as_sequential(self, run_async):
+        sequential = trace(PathProbe(*ROUTERS, TARGET_IP))
+        parallel = trace(PathProbe(*ROUTERS, TARGET_IP), run_async, parallel=True)
+        
+        assert self.summary(parallel) == self.summary(sequential)
+        assert parallel[-1].stop_reason == 'reached'
+    
+    def test_hops_are_reported_in_order(self):
+        seen = []
+        tracer = Tracer(TARGET_IP, probe=PathProbe(*ROUTERS, TARGET_IP), parallel=True)
+        tracer.trace(on_hop=seen.append)
+        assert [hop.hop for hop in seen] == [1, 2, 3, 4, 5, 6]
+    
+    def test_window_caps_probes_in_flight(self):
+        probe = InFlightPathProbe(*ROUTERS, TARGET_IP)
+        trace(probe, parallel=True, window=2)
+        assert probe.max_in_flight == 2 * 3
+    
+    def test_window_fits_the_engines_in_flight_cap(self):
+        probe = InFlightPathProbe(*ROUTERS, TARGET_IP)
+        probe.MAX_INFLIGHT = 7
+        trace(probe, parallel=True)
+        assert probe.max_in_flight == 2 * 3
+    
+    def test_nothing_is_probed_past_max_hops(self):
+        probe = PathProbe(*ROUTERS, TARGET_IP)
+        hops = trace(probe, parallel=True, max_hops=4)
+        
+        assert max(probe.sent) == 4
+        assert len(hops) == 4 and hops[-1].stop_reason == 'max_hops'
+
+
+class TestGapLimit:
+    SILENT_TAIL = ('10.0.0.1', '10.0.1.1', None)  # the destination never answers
+    
+    @pytest.mark.parametrize('parallel', [False, True])
+    def test_stops_after_the_silent_run(self, parallel):
+        hops = trace(PathProbe(*self.SILENT_TAIL), parallel=parallel, gap_limit=3)
+        
+        assert len(hops) == 5
+        assert hops[-1].stop_reason == 'gap_limit'
+        assert all(hop.stop_reason is None for hop in hops[:-1])
+    
+    def test_off_by_default(self):
+        hops = trace(PathProbe(*self.SILENT_TAIL), max_hops=12)
+        assert len(hops) == 12 and hops[-1].stop_reason == 'max_hops'
+    
+    @pytest.mark.parametrize('parallel', [False, True])
+    def test_an_answer_resets_the_run(self, parallel):
+        probe = PathProbe('10.0.0.1', None, None, '10.0.3.1', None, None, TARGET_IP)
+        hops = trace(probe, parallel=parallel, gap_limit=3)
+        assert hops[-1].stop_reason == 'reached'
+    
+    @pytest.mark.parametrize('run_async', [False, True])
+    def test_async_traces_stop_the_same_way(self, run_async):
+        hops = trace(PathProbe(*self.SILENT_TAIL), run_async, gap_limit=2)
+        assert [hop.stop_reason for hop in hops] == [None, None, None, 'gap_limit']
+
+
+class TestStopSetSequential:
+    def test_second_trace_copies_the_known_near_side(self):
+        stop_set = StopSet(start_ttl=4)
+        first = PathProbe(*ROUTERS, TARGET_IP)
+        trace(first, stop_set=stop_set)
+        
+        second = PathProbe(*ROUTERS, TARGET_IP)
+        hops = trace(second, stop_set=stop_set)
+        
+        assert [hop.ip for hop in hops] == [*ROUTERS, TARGET_IP]
+        assert [hop.from_stop_set for hop in hops] == [True] * 2 + [False] * 4
+        assert not {1, 2} & set(second.sent)
+        assert len(second.sent) < len(first.sent)
+    
+    def test_unknown_near_side_is_probed_to_ttl_one(self):
+        stop_set = StopSet(start_ttl=4)
+        stop_set.add(path('10.9.0.1', '10.9.1.1', '10.9.2.1', '192.0.2.99'))
+        
+        probe = PathProbe(*ROUTERS, TARGET_IP)
+        hops = trace(probe, stop_set=stop_set)
+        
+        assert not any(hop.from_stop_set for hop in hops)
+        assert {1, 2, 3} <= set(probe.sent)
+
+
+class BalancedPathProbe(PathProbe):
+    """Alternates between two routers at TTL 2 (a per-packet load balancer)"""
+    
+    BALANCED = ('10.0.1.1', '10.0.1.2')
+    
+    def answer(self, ttl):
+        result = super().answer(ttl)
+        if ttl == 2:
+            result.responder_ip = self.BALANCED[self.sent.count(2) % 2]
+        return result
+
+
+class TestAdaptiveProbes:
+    @pytest.mark.parametrize('parallel', [False, True])
+    def test_probe_count_follows_the_answers(self, parallel):
+        hops = trace(BalancedPathProbe(*ROUTERS, TARGET_IP), parallel=parallel,
+                     adaptive_probes=True, min_probes=2, probes_per_hop=5)
+        
+        assert [hop.probes_sent for hop in hops] == [2, 5, 2, 2, 2, 2]
+    
+    def test_fixed_count_without_adaptive_probes(self):
+        hops = trace(BalancedPathProbe(*ROUTERS, TARGET_IP), probes_per_hop=5)
+        assert {hop.probes_sent for hop in hops} == {5}
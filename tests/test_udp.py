@@ -0,0 +1,71 @@
+"""
+Matching ICMP errors to UDPProbe's datagrams
+"""
+
+import socket
+
+import pytest
+
+from tracelens.probe.udp import UDPProbe
+from craft import (
+    LOCAL_IP, RECV_TIME, ROUTER_IP, SEND_TIME, TARGET_IP, engine, icmp_error, ip_packet, udp
+)
+
+
+class TestUDPMatchReply:
+    SRC_PORT = 50000
+    DST_PORT = 33434
+    
+    @pytest.fixture
+    def probe(self):
+        probe = engine(UDPProbe, src_port=self.SRC_PORT, base_port=self.DST_PORT,
+                       port_offset=0, _udp_socket=None, _icmp_socket=None)
+        probe._track(self.DST_PORT, TARGET_IP, 5, SEND_TIME)
+        return probe
+    
+    def error(self, icmp_type: int, code: int, src_port: int = SRC_PORT,
+              router: str = ROUTER_IP, options: bytes = b'') -> bytes:
+        sent = ip_packet(LOCAL_IP, TARGET_IP, socket.IPPROTO_UDP,
+                         udp(src_port, self.DST_PORT, b'payload!'), options=options)
+        return icmp_error(icmp_type, code, sent, router=router)
+    
+    def test_time_exceeded(self, probe):
+        key, result = probe._match_reply(None, self.error(11, 0), ROUTER_IP, RECV_TIME)
+        
+        assert key == self.DST_PORT
+        assert result.responder_ip == ROUTER_IP and not result.reached_target
+        assert result.rtt_ms == pytest.approx(25.0)
+    
+    def test_port_unreachable_reaches_target(self, probe):
+        data = self.error(3, 3, router=TARGET_IP)
+        _, result = probe._match_reply(None, data, TARGET_IP, RECV_TIME)
+        assert result.reached_target
+    
+    def test_other_unreachable_codes_do_not_reach_target(self, probe):
+        _, result = probe._match_reply(None, self.error(3, 1), ROUTER_IP, RECV_TIME)
+        assert not result.reached_target
+    
+    def test_another_sockets_probe_is_ignored(self, probe):
+        assert probe._match_reply(None, self.error(11, 0, src_port=50001), ROUTER_IP,
+                                  RECV_TIME) is None
+        assert self.DST_PORT in probe._pending
+    
+    def test_quote_too_short_for_the_udp_ports_is_ignored(self, probe):
+        # A 60-byte inner header leaves no room for the quoted ports
+        data = self.error(11, 0, options=bytes(40))[:20 + 8 + 60]
+        assert probe._match_reply(None, data, ROUTER_IP, RECV_TIME) is None
+    
+    def test_blocking_probe_skips_ports_in_flight(self, probe):
+        waited = []
+        probe._wait = lambda key, timeout: waited.append(key)
+        
+        probe.probe(TARGET_IP, 6)
+        probe.send(TARGET_IP, 7)
+        assert waited == [self.DST_PORT + 1]
+        assert sorted(probe._pending) == [self.DST_PORT, self.DST_PORT + 1, self.DST_PORT + 2]
+    
+    def test_ports_run_out_at_the_range(self, probe):
+        for _ in range(probe.PORT_RANGE - 1):
+            probe.send(TARGET_IP, 6)
+        with pytest.raises(RuntimeError, match='UDP probe ports are in flight'):
+            probe.send(TARGET_IP, 6)
@@ -19,20 +19,29 @@ hiddenimports = [
     'tracelens.probe.tcp',
     'tracelens.probe.udp',
     'tracelens.probe.tracer',
+    'tracelens.probe.demux',
+    'tracelens.probe.stateless',
+    'tracelens.probe.timeouts',
+    'tracelens.probe.stopset',
     'tracelens.enrichment',
     'tracelens.enrichment.ip_classifier',
     'tracelens.enrichment.ptr_resolver',
     'tracelens.enrichment.asn_lookup',
     'tracelens.enrichment.geo_lookup',
+    'tracelens.enrichment.service',
     'tracelens.output',
     'tracelens.output.console',
     'tracelens.output.json_export',
     'tracelens.diagnostics',
+    'tracelens.batch',
     'tracelens.cache',
     'tracelens.models',
     # Dependencies
     'dns',
     'dns.resolver',
+    'dns.asyncresolver',
+    'dns.asyncbackend',
+    'dns._asyncio_backend',
     'dns.rdatatype',
     'httpx',
     'httpx._transports',
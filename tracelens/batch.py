@@ -0,0 +1,370 @@
+"""
+Multi-target batch tracing
+"""
+
+import asyncio
+import itertools
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional
+
+from .models import EnrichedHop, HopResult, ProbeResult, TraceResult
+from .probe import (
+    AdaptiveProbeCount, AdaptiveTimeout, BaseProbe, PathHistory, StopSet, TimeoutHistory,
+    Tracer, create_probe
+)
+
+
+def read_targets(source: str) -> Iterator[str]:
+    """
+    Read targets from a file, one per line.
+    
+    Blank lines and ``#`` comments are skipped. ``-`` reads from stdin.
+    Lines are read lazily, so very large target lists are fine.
+    
+    Args:
+        source: File path or ``-``
+    """
+    stream = sys.stdin if source == '-' else open(source, encoding='utf-8')
+    try:
+        for line in stream:
+            target = line.split('#', 1)[0].strip()
+            if target:
+                yield target
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def plain_hop(hop: HopResult) -> EnrichedHop:
+    """Convert a HopResult without any enrichment"""
+    return EnrichedHop(
+        hop=hop.hop,
+        ip=hop.ip,
+        rtts=hop.rtts,
+        reached_target=hop.reached_target,
+        stop_reason=hop.stop_reason,
+        from_stop_set=hop.from_stop_set,
+        from_history=hop.from_history,
+        probes_sent=hop.probes_sent
+    )
+
+
+class BatchTracer:
+    """
+    Trace many targets concurrently from one process.
+    
+    All traces share a single probe engine (and therefore its sockets)
+    and a single enrichment pool. A global cap bounds the number of
+    probes in flight across all traces. Finished TraceResults are
+    streamed out in completion order. With ``adaptive_timeout`` the
+    per-prefix RTT history is shared by all traces of the batch, and
+    with ``stop_set`` the near-side hops discovered by earlier traces
+    are not probed again (Doubletree). With ``predict_start`` each trace
+    starts at the distance where an earlier trace to the same /24 found
+    its destination.
+    
+    Enrichment is supplied by the caller as a blocking ``enrich(hop)``
+    function; it runs on a bounded thread pool while probing continues,
+    and lookups for the same IP from different traces are not repeated
+    concurrently. Alternatively ``enrich_trace(hops)`` is a coroutine
+    function that enriches each finished trace in one call, so that its
+    lookups can be batched (see ``EnrichmentService.enrich_trace``).
+    
+    With ``unprivileged`` the shared engine uses datagram sockets and the
+    socket error queue instead of raw sockets (Linux, ICMP/UDP only).
+    With ``tcp_reset`` the shared TCP engine answers SYN-ACKs with a RST.
+    
+    With ``protocol='stateless'`` targets are not traced one by one:
+    every (target, TTL) pair of up to ``SWEEP_TARGETS`` targets at a
+    time is probed in random order by ``StatelessProbe.sweep()``,
+    without waiting for any reply, and each trace is rebuilt from the
+    replies once the sweep is over (yarrp-style). The per-trace options
+    (parallel, adaptive timeouts and probe counts, stop set, predicted
+    start) do not apply there.
+    """
+    
+    SWEEP_TARGETS = 4096  # Targets probed together in one stateless sweep
+    
+    def __init__(
+        self,
+        protocol: str = 'icmp',
+        max_hops: int = 30,
+        probes_per_hop: int = 3,
+        timeout: float = 2.0,
+        adaptive_timeout: bool = False,
+        min_timeout: float = AdaptiveTimeout.DEFAULT_FLOOR,
+        gap_limit: Optional[int] = None,
+        stop_set: bool = False,
+        start_ttl: int = StopSet.DEFAULT_START_TTL,
+        port: int = 80,
+        parallel: bool = False,
+        window: Optional[int] = None,
+        concurrency: int = 64,
+        max_inflight: Optional[int] = 1024,
+        enrich: Optional[Callable[[HopResult], EnrichedHop]] = None,
+        enrich_workers: int = 16,
+        unprivileged: bool = False,
+        adaptive_probes: bool = False,
+        min_probes: int = AdaptiveProbeCount.DEFAULT_MIN,
+        predict_start: bool = False,
+        enrich_trace: Optional[Callable[[list[HopResult]], Awaitable[list[EnrichedHop]]]] = None,
+        tcp_reset: bool = False
+    ):
+        self.protocol = protocol.lower()
+        self.max_hops = max_hops
+        self.probes_per_hop = probes_per_hop
+        self.timeout = timeout
+        self.adaptive_timeout = adaptive_timeout
+        self.min_timeout = min_timeout
+        self.timeout_history = TimeoutHistory()
+        self.gap_limit = gap_limit
+        self.stop_set = StopSet(start_ttl) if stop_set else None
+        self.port = port
+        self.parallel = parallel
+        self.window = window
+        self.concurrency = concurrency
+        self.max_inflight = max_inflight
+        self.enrich = enrich
+        self.enrich_workers = enrich_workers
+        self.enrich_trace = enrich_trace
+        self.unprivileged = unprivileged
+        self.adaptive_probes = adaptive_probes
+        self.min_probes = min_probes
+        self.predict_start = predict_start
+        self.path_history = PathHistory() if predict_start else None
+        self.tcp_reset = tcp_reset
+        self._probe: Optional[BaseProbe] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._enriching: dict[str, asyncio.Future] = {}
+    
+    async def run(self, targets: Iterable[str]) -> AsyncIterator[TraceResult]:
+        """
+        Trace every target, yielding each TraceResult as it finishes.
+        
+        Args:
+            targets: Hostnames or IP addresses (consumed lazily)
+        """
+        if self.protocol == 'stateless':
+            async for result in self._sweep(targets):
+                yield result
+            return
+        
+        with create_probe(self.protocol, timeout=self.timeout, port=self.port,
+                          unprivileged=self.unprivileged,
+                          tcp_reset=self.tcp_reset) as probe:
+            probe.limit_inflight(self.max_inflight)
+            self._probe = probe
+            if self.enrich:
+                self._executor = ThreadPoolExecutor(max_workers=self.enrich_workers)
+            
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+            target_iter = iter(targets)
+            done = object()
+            
+            async def worker():
+                try:
+                    for target in target_iter:
+                        await queue.put(await self._trace_one(target))
+                except Exception as e:
+                    # e.g. the target file became unreadable; re-raised below
+                    await queue.put(e)
+                await queue.put(done)
+            
+            workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+            
+            try:
+                remaining = len(workers)
+                while remaining:
+                    item = await queue.get()
+                    if item is done:
+                        remaining -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                
+                self._probe = None
+                if self._executor:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+    
+    def run_sync(self, targets: Iterable[str],
+                 on_result: Callable[[TraceResult], None]):
+        """Blocking wrapper around ``run()`` calling ``on_result`` per trace"""
+        async def consume():
+            async for result in self.run(targets):
+                on_result(result)
+        
+        asyncio.run(consume())
+    
+    async def _sweep(self, targets: Iterable[str]) -> AsyncIterator[TraceResult]:
+        """``run()`` for stateless probing: sweep the targets in chunks"""
+        loop = asyncio.get_running_loop()
+        target_iter = iter(targets)
+        
+        with create_probe(self.protocol, timeout=self.timeout) as probe:
+            if self.enrich:
+                self._executor = ThreadPoolExecutor(max_workers=self.enrich_workers)
+            
+            try:
+                while chunk := list(itertools.islice(target_iter, self.SWEEP_TARGETS)):
+                    started = datetime.now()
+                    tracers = [self._tracer(target) for target in chunk]
+                    errors = await asyncio.gather(*(
+                        loop.run_in_executor(None, tracer.resolve_target) for tracer in tracers
+                    ), return_exceptions=True)
+                    
+                    ips = sorted({tracer.target_ip for tracer in tracers if tracer.target_ip})
+                    replies = await loop.run_in_executor(None, self._collect_sweep, probe, ips)
+                    
+                    results = await asyncio.gather(*(
+                        self._sweep_result(tracer, replies, started, error)
+                        for tracer, error in zip(tracers, errors)
+                    ))
+                    for result in results:
+                        yield result
+            finally:
+                if self._executor:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+    
+    def _collect_sweep(self, probe: BaseProbe,
+                       ips: list[str]) -> dict[tuple[str, int], list[ProbeResult]]:
+        """Run one sweep over ``ips``; replies grouped by (target, TTL)"""
+        replies: dict[tuple[str, int], list[ProbeResult]] = {}
+        if not ips:
+            return replies
+        
+        for target_ip, ttl, result in probe.sweep(ips, max_ttl=self.max_hops,
+                                                  probes=self.probes_per_hop):
+            answers = replies.setdefault((target_ip, ttl), [])
+            if len(answers) < self.probes_per_hop:
+                answers.append(result)
+        return replies
+    
+    async def _sweep_result(self, tracer: Tracer, replies: dict, started: datetime,
+                            error: Optional[BaseException]) -> TraceResult:
+        """TraceResult for one swept target"""
+        if isinstance(error, Exception):
+            return self._result(tracer, started, error=str(error))
+        
+        results = {
+            ttl: replies.get((tracer.target_ip, ttl), [])
+            for ttl in range(1, self.max_hops + 1)
+        }
+        hops = await self._enrich_all_hops(tracer.hops_from_results(results))
+        return self._result(tracer, started, hops)
+    
+    def _tracer(self, target: str) -> Tracer:
+        """Tracer for one target, sharing the batch's engine and history"""
+        return Tracer(
+            target=target,
+            protocol=self.protocol,
+            max_hops=self.max_hops,
+            probes_per_hop=self.probes_per_hop,
+            timeout=self.timeout,
+            port=self.port,
+            parallel=self.parallel,
+            window=self.window,
+            probe=self._probe,
+            adaptive_timeout=self.adaptive_timeout,
+            min_timeout=self.min_timeout,
+            timeout_history=self.timeout_history,
+            gap_limit=self.gap_limit,
+            stop_set=self.stop_set,
+            adaptive_probes=self.adaptive_probes,
+            min_probes=self.min_probes,
+            predict_start=self.predict_start,
+            path_history=self.path_history,
+            tcp_reset=self.tcp_reset
+        )
+    
+    async def _trace_one(self, target: str) -> TraceResult:
+        """Trace one target over the shared engine"""
+        tracer = self._tracer(target)
+        started = datetime.now()
+        
+        try:
+            if self.enrich_trace:
+                hops = await self._enrich_trace([hop async for hop in tracer.iter_hops()])
+            else:
+                # Enrich each hop while later hops are still being probed
+                pending = [
+                    asyncio.ensure_future(self._enrich_hop(hop))
+                    async for hop in tracer.iter_hops()
+                ]
+                hops = list(await asyncio.gather(*pending))
+        except Exception as e:
+            # Unresolvable target, or the engine refused a probe: report it
+            # for this target and carry on with the rest
+            return self._result(tracer, started, error=str(e))
+        
+        return self._result(tracer, started, hops)
+    
+    def _result(self, tracer: Tracer, started: datetime,
+                hops: Optional[list[EnrichedHop]] = None,
+                error: Optional[str] = None) -> TraceResult:
+        """TraceResult for a finished (or failed) trace"""
+        if error is not None:
+            return TraceResult(
+                target=tracer.target,
+                resolved_ip=tracer.target_ip or '',
+                protocol=self.protocol,
+                port=self._result_port(),
+                timestamp=started,
+                error=error
+            )
+        
+        return TraceResult(
+            target=tracer.target,
+            resolved_ip=tracer.target_ip,
+            protocol=self.protocol,
+            port=self._result_port(),
+            timestamp=started,
+            hops=hops,
+            reachable=bool(hops) and hops[-1].reached_target,
+            total_hops=len(hops)
+        )
+    
+    async def _enrich_all_hops(self, hops: list[HopResult]) -> list[EnrichedHop]:
+        """Enrich a finished trace, in one call if ``enrich_trace`` is set"""
+        if self.enrich_trace:
+            return await self._enrich_trace(hops)
+        return list(await asyncio.gather(*(self._enrich_hop(hop) for hop in hops)))
+    
+    async def _enrich_hop(self, hop: HopResult) -> EnrichedHop:
+        """Enrich a hop on the shared pool, one lookup per IP at a time"""
+        if not self.enrich:
+            return plain_hop(hop)
+        
+        # Another trace is enriching this IP; wait so we hit its cache entry
+        if hop.ip in self._enriching:
+            await asyncio.wait([self._enriching[hop.ip]])
+        
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self.enrich, hop)
+        
+        if hop.ip and hop.ip not in self._enriching:
+            self._enriching[hop.ip] = future
+            future.add_done_callback(lambda _, ip=hop.ip: self._enriching.pop(ip, None))
+        
+        try:
+            return await future
+        except Exception:
+            return plain_hop(hop)
+    
+    async def _enrich_trace(self, hops: list[HopResult]) -> list[EnrichedHop]:
+        """Enrich a finished trace in one call, unenriched if that fails"""
+        try:
+            return await self.enrich_trace(hops)
+        except Exception:
+            return [plain_hop(hop) for hop in hops]
+    
+    def _result_port(self) -> Optional[int]:
+        return self.port if self.protocol in ('tcp', 'udp') else None
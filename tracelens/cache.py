@@ -9,7 +9,7 @@ from typing import Optional, Any
 from dataclasses import asdict
 
 from .models import GeoInfo
-from .enrichment.asn_lookup import ASNInfo
+from .enrichment.asn_lookup import ASNInfo, ASNOrg
 
 
 class Cache:
@@ -18,15 +18,24 @@ class Cache:
     
     Stores enrichment data in ~/.tracelens/cache.json with TTL support.
     No database required - just a JSON file.
+    
+    Per-IP entries hold what is specific to an address (AS number,
+    prefix, geo, PTR). What an AS number is registered to lives in a
+    separate ASN table with its own, longer TTL, so it is stored and
+    looked up once per AS rather than once per IP.
     """
     
     DEFAULT_PATH = Path.home() / '.tracelens' / 'cache.json'
     DEFAULT_TTL = 7 * 24 * 3600  # 7 days in seconds
+    DEFAULT_ASN_TTL = 30 * 24 * 3600  # AS registrations rarely change
     
-    def __init__(self, path: Optional[Path] = None, ttl: Optional[int] = None):
+    def __init__(self, path: Optional[Path] = None, ttl: Optional[int] = None,
+                 asn_ttl: Optional[int] = None):
         self.path = path or self.DEFAULT_PATH
         self.ttl = ttl or self.DEFAULT_TTL
+        self.asn_ttl = asn_ttl or self.DEFAULT_ASN_TTL
         self._data: dict[str, dict] = {}
+        self._asns: dict[str, dict] = {}
         self._dirty = False
         self._load()
     
@@ -35,10 +44,29 @@ class Cache:
         if self.path.exists():
             try:
                 content = self.path.read_text(encoding='utf-8')
-                self._data = json.loads(content)
+                data = json.loads(content)
+                if 'ips' in data:
+                    self._data = data['ips']
+                    self._asns = data.get('asns', {})
+                else:
+                    self._data = data
+                    self._migrate()
                 self._cleanup_expired()
             except (json.JSONDecodeError, IOError):
                 self._data = {}
+                self._asns = {}
+    
+    def _migrate(self):
+        """Move org names out of IP entries written by older versions"""
+        for entry in self._data.values():
+            if 'org' not in entry:
+                continue
+            
+            org = entry.pop('org')
+            asn = entry.get('asn')
+            if asn and org and asn not in self._asns:
+                self._asns[asn] = {'org': org, '_ts': entry.get('_ts', 0)}
+            self._dirty = True
     
     def _save(self):
         """Save cache to file"""
@@ -47,7 +75,8 @@ class Cache:
         
         try:
             self.path.parent.mkdir(parents=True, exist_ok=True)
-            content = json.dumps(self._data, indent=2, ensure_ascii=False)
+            data = {'ips': self._data, 'asns': self._asns}
+            content = json.dumps(data, indent=2, ensure_ascii=False)
             self.path.write_text(content, encoding='utf-8')
             self._dirty = False
         except IOError:
@@ -56,21 +85,22 @@ class Cache:
     def _cleanup_expired(self):
         """Remove expired entries"""
         now = time.time()
-        expired = [
-            ip for ip, entry in self._data.items()
-            if now - entry.get('_ts', 0) > self.ttl
-        ]
-        
-        for ip in expired:
-            del self._data[ip]
-        
-        if expired:
-            self._dirty = True
+        for table, ttl in ((self._data, self.ttl), (self._asns, self.asn_ttl)):
+            expired = [
+                key for key, entry in table.items()
+                if now - entry.get('_ts', 0) > ttl
+            ]
+            
+            for key in expired:
+                del table[key]
+            
+            if expired:
+                self._dirty = True
     
-    def _is_valid(self, entry: dict) -> bool:
+    def _is_valid(self, entry: dict, ttl: Optional[int] = None) -> bool:
         """Check if cache entry is still valid"""
         ts = entry.get('_ts', 0)
-        return time.time() - ts < self.ttl
+        return time.time() - ts < (ttl or self.ttl)
     
     def get(self, ip: str) -> Optional[dict]:
         """
@@ -88,17 +118,51 @@ class Cache:
         return None
     
     def get_asn(self, ip: str) -> Optional[ASNInfo]:
-        """Get cached ASN info"""
+        """
+        Get cached ASN info.
+        
+        None unless the IP's AS is also in the ASN table, so that an
+        expired registration is refreshed along with the IP. An AS with
+        no known registration is a hit with no org.
+        """
         entry = self.get(ip)
-        if entry and 'asn' in entry:
-            return ASNInfo(
-                asn=entry.get('asn'),
+        if not entry or 'asn' not in entry:
+            return None
+        
+        org = self.get_asn_org(entry['asn'])
+        if org is None:
+            return None
+        
+        return ASNInfo(
+            asn=entry.get('asn'),
+            org=org.org,
+            prefix=entry.get('prefix'),
+            country=entry.get('asn_country'),
+            registry=org.registry
+        )
+    
+    def get_asn_org(self, asn: str) -> Optional[ASNOrg]:
+        """Get cached registration details of an AS number (org None if it has none)"""
+        entry = self._asns.get(asn)
+        if entry and self._is_valid(entry, self.asn_ttl):
+            return ASNOrg(
+                asn=asn,
                 org=entry.get('org'),
-                prefix=entry.get('prefix'),
-                country=entry.get('asn_country')
+                country=entry.get('country'),
+                registry=entry.get('registry')
             )
         return None
     
+    def set_asn_org(self, org: ASNOrg):
+        """Set registration details of an AS number"""
+        self._asns[org.asn] = {
+            '_ts': time.time(),
+            'org': org.org,
+            'country': org.country,
+            'registry': org.registry
+        }
+        self._dirty = True
+    
     def get_geo(self, ip: str) -> Optional[GeoInfo]:
         """Get cached geo info"""
         entry = self.get(ip)
@@ -128,7 +192,7 @@ class Cache:
         
         Args:
             ip: IP address
-            asn: ASN info
+            asn: ASN info; its org goes to the ASN table if not there yet
             geo: Geo info
             ptr: PTR hostname
         """
@@ -137,9 +201,10 @@ class Cache:
         
         if asn:
             entry['asn'] = asn.asn
-            entry['org'] = asn.org
             entry['prefix'] = asn.prefix
             entry['asn_country'] = asn.country
+            if asn.org and not self.get_asn_org(asn.asn):
+                self.set_asn_org(ASNOrg(asn=asn.asn, org=asn.org, registry=asn.registry))
         
         if geo:
             entry['geo_country'] = geo.country
@@ -165,6 +230,7 @@ class Cache:
     def clear(self):
         """Clear all cache entries"""
         self._data = {}
+        self._asns = {}
         self._dirty = True
         self._save()
     
@@ -1,6 +1,7 @@
-import asyncio
+import json
 import sys
 import os
+import time
 from pathlib import Path
 from typing import Optional
 from datetime import datetime
@@ -9,9 +10,11 @@ import click
 from rich.console import Console
 
 from . import __version__
-from .models import EnrichedHop, HopResult, TraceResult, Diagnosis, GeoInfo
-from .probe import Tracer
-from .enrichment import IPClassifier, PTRResolver, ASNLookup, GeoLookup
+from .models import EnrichedHop, TraceResult, Diagnosis
+from .probe import Tracer, Pacer, StopSet, set_shared_pacer
+from .batch import BatchTracer, read_targets
+from .pipeline import EnrichmentPipeline
+from .enrichment import EnrichmentService
 from .cache import Cache
 from .diagnostics import Diagnostics
 from .output import ConsoleOutput, JsonExporter
@@ -33,155 +36,121 @@ def is_admin() -> bool:
         return os.geteuid() == 0
 
 
-def enrich_hop_sync(hop: HopResult, cache: Cache, 
-                    enable_ptr: bool = True, enable_geo: bool = True) -> EnrichedHop:
+def run_batch(source: str, output: ConsoleOutput, enrichment: EnrichmentService,
+              json_path: Optional[str], **tracer_options) -> int:
     """
-    Synchronously enrich a single hop.
-    Uses cache when available, with fallback to ASN country for geo.
-    """
-    from .models import GeoInfo
-    
-    enriched = EnrichedHop(
-        hop=hop.hop,
-        ip=hop.ip,
-        rtts=hop.rtts,
-        reached_target=hop.reached_target
-    )
-    
-    if not hop.ip:
-        return enriched
-    
-    # IP classification
-    ip_type = IPClassifier.classify(hop.ip).value
-    enriched.ip_type = ip_type
-    
-    # Add tag for non-public IPs
-    tag = IPClassifier.get_tag(hop.ip)
-    if tag:
-        enriched.tags.append(tag)
-    
-    # Skip enrichment for non-public IPs
-    if not IPClassifier.should_enrich(hop.ip):
-        return enriched
-    
-    # Try cache first
-    cached_asn = cache.get_asn(hop.ip)
-    cached_geo = cache.get_geo(hop.ip) if enable_geo else None
-    cached_ptr = cache.get_ptr(hop.ip) if enable_ptr else None
-    
-    asn_info = cached_asn  # Track ASN info for geo fallback
-    
-    if cached_asn:
-        enriched.asn = cached_asn.asn
-        enriched.org = cached_asn.org
-    
-    if cached_geo:
-        enriched.geo = cached_geo
+    Trace every target listed in a file (or stdin) over one shared engine.
     
-    if cached_ptr:
-        enriched.ptr = cached_ptr
+    Results are printed one line per target as they finish; with a JSON
+    path, each result is also written as one line of JSON.
     
-    # If we have all cached data, skip network lookup
-    need_asn = not cached_asn
-    need_geo = enable_geo and not cached_geo
-    need_ptr = enable_ptr and not cached_ptr
+    Returns:
+        Number of targets traced
+    """
+    diagnostics = Diagnostics()
+    exporter = JsonExporter()
+    exporter.add_data_source("team_cymru")
+    if enrichment.enable_geo:
+        exporter.add_data_source("ip-api.com")
     
-    if not need_asn and not need_geo and not need_ptr:
-        # Apply geo fallback from cached ASN if needed
-        if not enriched.geo and asn_info and asn_info.country:
-            enriched.geo = GeoInfo(
-                country_code=asn_info.country,
-                country=None, city=None, lat=None, lon=None
-            )
-        return enriched
+    # Finished traces are enriched together so geo lookups go out in batches
+    batch = BatchTracer(enrich_trace=enrichment.enrich_trace_async, **tracer_options)
+    json_file = open(json_path, 'w', encoding='utf-8') if json_path else None
+    count = 0
     
-    # Fetch fresh data
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        async def fetch_enrichment():
-            results = {}
-            
-            # ASN lookup
-            if need_asn:
-                asn_lookup = ASNLookup(timeout=3.0)
-                try:
-                    results['asn'] = await asn_lookup.lookup(hop.ip)
-                finally:
-                    asn_lookup.close()
-            
-            # Geo lookup
-            if need_geo:
-                async with GeoLookup(timeout=3.0) as geo_lookup:
-                    results['geo'] = await geo_lookup.lookup(hop.ip)
-            
-            # PTR lookup
-            if need_ptr:
-                resolver = PTRResolver(timeout=2.0)
-                try:
-                    results['ptr'] = await resolver.resolve(hop.ip)
-                finally:
-                    resolver.close()
-            
-            return results
-        
-        results = loop.run_until_complete(fetch_enrichment())
-        loop.close()
-        
-        # Apply results
-        if results.get('asn'):
-            asn_info = results['asn']
-            enriched.asn = asn_info.asn
-            enriched.org = asn_info.org
-            cache.set(hop.ip, asn=asn_info)
-        
-        if results.get('geo'):
-            enriched.geo = results['geo']
-            cache.set(hop.ip, geo=results['geo'])
+    def on_result(result: TraceResult):
+        nonlocal count
+        count += 1
         
-        if results.get('ptr'):
-            enriched.ptr = results['ptr']
-            cache.set(hop.ip, ptr=results['ptr'])
+        diagnostics.add_tags(result.hops)
+        diagnosis = diagnostics.analyze(result.hops)
+        output.print_batch_result(result, diagnosis)
         
-    except Exception:
-        pass
+        if json_file:
+            data = exporter.export(result, diagnosis)
+            json_file.write(json.dumps(data, ensure_ascii=False) + '\n')
     
-    # Fallback: use country from ASN data when GeoIP is missing
-    if not enriched.geo and asn_info and asn_info.country:
-        enriched.geo = GeoInfo(
-            country_code=asn_info.country,
-            country=None, city=None, lat=None, lon=None
-        )
+    try:
+        batch.run_sync(read_targets(source), on_result)
+    finally:
+        if json_file:
+            json_file.close()
     
-    return enriched
+    return count
 
 
 @click.command()
-@click.argument('target')
+@click.argument('target', required=False)
 @click.option('-p', '--protocol', default='icmp', 
-              type=click.Choice(['icmp', 'tcp', 'udp'], case_sensitive=False),
+              type=click.Choice(['icmp', 'tcp', 'udp', 'stateless'], case_sensitive=False),
               help='Probe protocol (default: icmp)')
 @click.option('--port', default=80, type=int,
               help='Port for TCP/UDP probes (default: 80)')
+@click.option('--tcp-reset', is_flag=True,
+              help='Answer SYN-ACKs with a RST so no half-open connection is left (TCP only)')
 @click.option('-m', '--max-hops', default=30, type=int,
               help='Maximum hops (default: 30)')
 @click.option('-q', '--probes', default=3, type=int,
               help='Probes per hop (default: 3)')
 @click.option('-w', '--timeout', default=2.0, type=float,
               help='Timeout per probe in seconds (default: 2)')
+@click.option('--adaptive-timeout', is_flag=True,
+              help='Derive per-probe timeouts from observed RTTs, up to --timeout')
+@click.option('--min-timeout', default=0.2, type=float,
+              help='Lower bound for --adaptive-timeout in seconds (default: 0.2)')
+@click.option('--adaptive-probes', is_flag=True,
+              help='Stop probing a hop early once its answers agree, up to --probes')
+@click.option('--min-probes', default=2, type=click.IntRange(min=1),
+              help='Lower bound for --adaptive-probes (default: 2)')
+@click.option('--gap-limit', default=0, type=click.IntRange(min=0),
+              help='Stop after N consecutive silent hops (default: 0 = never)')
+@click.option('--stop-set', is_flag=True,
+              help='With --targets, skip near-side hops already seen (Doubletree)')
+@click.option('--start-ttl', default=None, type=click.IntRange(min=1),
+              help='First TTL probed forward with --stop-set (default: 5)')
+@click.option('--predict-start', is_flag=True,
+              help='Start at the predicted distance of the target (from its reply TTL, or '
+                   'with --targets from earlier traces to the same /24)')
 @click.option('--dns/--no-dns', default=True,
               help='Enable/disable PTR lookups (default: enabled)')
 @click.option('--geo/--no-geo', default=True,
               help='Enable/disable geo lookups (default: enabled)')
+@click.option('--batch-enrich', is_flag=True,
+              help='Enrich all hops together once the trace ends, with batched lookups')
 @click.option('--json', 'json_path', type=click.Path(),
               help='Export results to JSON file')
 @click.option('--no-cache', is_flag=True,
               help='Disable cache (always fetch fresh data)')
+@click.option('--parallel', is_flag=True,
+              help='Keep probes for many TTLs in flight at once')
+@click.option('--window', default=None, type=click.IntRange(min=1),
+              help='TTLs in flight at once with --parallel (default: all)')
+@click.option('-f', '--targets', 'targets_path', type=click.Path(allow_dash=True),
+              help='Trace every target in FILE (one per line, - for stdin)')
+@click.option('--concurrency', default=64, type=click.IntRange(min=1),
+              help='Traces run at once with --targets (default: 64)')
+@click.option('--max-inflight', default=1024, type=click.IntRange(min=1),
+              help='Probes in flight across all traces with --targets '
+                   '(default: 1024; at most 30 with -p udp)')
+@click.option('--unprivileged', is_flag=True,
+              help='Probe without root via datagram sockets (Linux, ICMP/UDP; '
+                   'automatic when not root)')
+@click.option('--pps', default=None, type=click.FloatRange(min=0, min_open=True),
+              help='Limit probes per second across all traces (default: unlimited)')
+@click.option('--burst', default=1, type=click.IntRange(min=1),
+              help='Probes sent back to back within --pps (default: 1)')
+@click.option('--prefix-pps', default=None, type=click.FloatRange(min=0, min_open=True),
+              help='Also limit probes per second to each destination /24')
 @click.version_option(version=__version__)
-def main(target: str, protocol: str, port: int, max_hops: int,
-         probes: int, timeout: float, dns: bool, geo: bool,
-         json_path: Optional[str], no_cache: bool):
+def main(target: Optional[str], protocol: str, port: int, tcp_reset: bool,
+         max_hops: int, probes: int, timeout: float, adaptive_timeout: bool,
+         min_timeout: float, adaptive_probes: bool, min_probes: int,
+         gap_limit: int, stop_set: bool, start_ttl: Optional[int],
+         predict_start: bool, dns: bool, geo: bool, batch_enrich: bool,
+         json_path: Optional[str], no_cache: bool, parallel: bool,
+         window: Optional[int], targets_path: Optional[str],
+         concurrency: int, max_inflight: int, unprivileged: bool,
+         pps: Optional[float], burst: int, prefix_pps: Optional[float]):
     """
     TraceLens - Enhanced traceroute with network intelligence.
     
@@ -195,9 +164,35 @@ def main(target: str, protocol: str, port: int, max_hops: int,
         tracelens google.com -p tcp --port 443
         
         tracelens 1.1.1.1 --json output.json
+        
+        tracelens 1.1.1.1 --parallel
+        
+        tracelens --targets hosts.txt --json results.jsonl
     """
+    if not target and not targets_path:
+        raise click.UsageError("Missing argument 'TARGET' (or use --targets FILE).")
+    
+    # The stop set is shared between the traces of one batch
+    if stop_set and not targets_path:
+        raise click.UsageError("--stop-set requires --targets.")
+    if start_ttl is not None and not stop_set:
+        raise click.UsageError("--start-ttl requires --stop-set.")
+    if tcp_reset and protocol != 'tcp':
+        raise click.UsageError("--tcp-reset requires -p tcp.")
+    
+    # Without root, Linux can still probe ICMP/UDP over datagram sockets
+    can_run_unprivileged = (
+        sys.platform.startswith('linux') and protocol in Tracer.UNPRIVILEGED_PROTOCOLS
+    )
+    if unprivileged and not can_run_unprivileged:
+        raise click.UsageError(
+            "--unprivileged is only supported for ICMP and UDP on Linux."
+        )
+    
     # Check admin privileges
-    if not is_admin():
+    if not is_admin() and can_run_unprivileged:
+        unprivileged = True
+    elif not is_admin():
         if sys.platform == 'win32':
             console.print(
                 "[bold red]Error:[/] Administrator privileges required.\n"
@@ -206,14 +201,71 @@ def main(target: str, protocol: str, port: int, max_hops: int,
         else:
             console.print(
                 "[bold red]Error:[/] Root privileges required.\n"
-                "[dim]Please run with sudo.[/]"
+                "[dim]Please run with sudo, or use -p icmp / -p udp, "
+                "which work without root.[/]"
             )
         sys.exit(1)
     
+    # One pacer for every engine in the process
+    pacer = None
+    if pps or prefix_pps:
+        pacer = Pacer(pps or float('inf'), burst, prefix_pps=prefix_pps)
+        set_shared_pacer(pacer)
+    
     output = ConsoleOutput()
     cache = Cache() if not no_cache else Cache(ttl=0)
+    # One resolver, HTTP pool and event loop for every hop of every trace
+    enrichment = EnrichmentService(cache, enable_ptr=dns, enable_geo=geo)
     enriched_hops: list[EnrichedHop] = []
     
+    if targets_path:
+        started = time.perf_counter()
+        try:
+            count = run_batch(
+                targets_path, output, enrichment, json_path,
+                protocol=protocol,
+                max_hops=max_hops,
+                probes_per_hop=probes,
+                timeout=timeout,
+                adaptive_timeout=adaptive_timeout,
+                min_timeout=min_timeout,
+                adaptive_probes=adaptive_probes,
+                min_probes=min_probes,
+                gap_limit=gap_limit or None,
+                stop_set=stop_set,
+                start_ttl=start_ttl or StopSet.DEFAULT_START_TTL,
+                predict_start=predict_start,
+                port=port,
+                tcp_reset=tcp_reset,
+                parallel=parallel,
+                window=window,
+                concurrency=concurrency,
+                max_inflight=max_inflight,
+                unprivileged=unprivileged
+            )
+        except (PermissionError, OSError) as e:
+            output.print_error(str(e))
+            sys.exit(1)
+        except KeyboardInterrupt:
+            console.print("\n[yellow]Interrupted[/]")
+            sys.exit(130)
+        finally:
+            enrichment.close()
+            if not no_cache:
+                cache.save()
+        
+        elapsed = time.perf_counter() - started
+        console.print(f"\n[dim]Traced {count} targets in {elapsed:.1f}s[/]")
+        if pacer and pacer.stats.delayed:
+            stats = pacer.stats
+            console.print(
+                f"[dim]Pacing delayed {stats.delayed}/{stats.probes} probes "
+                f"(mean {stats.mean_wait * 1000:.1f}ms, max {stats.max_wait * 1000:.1f}ms)[/]"
+            )
+        if json_path:
+            console.print(f"[dim]Results exported to:[/] {Path(json_path).absolute()}")
+        return
+    
     try:
         # Create tracer
         tracer = Tracer(
@@ -222,7 +274,17 @@ def main(target: str, protocol: str, port: int, max_hops: int,
             max_hops=max_hops,
             probes_per_hop=probes,
             timeout=timeout,
-            port=port
+            port=port,
+            tcp_reset=tcp_reset,
+            parallel=parallel,
+            window=window,
+            adaptive_timeout=adaptive_timeout,
+            min_timeout=min_timeout,
+            adaptive_probes=adaptive_probes,
+            min_probes=min_probes,
+            gap_limit=gap_limit or None,
+            predict_start=predict_start,
+            unprivileged=unprivileged
         )
         
         # Resolve target
@@ -242,17 +304,19 @@ def main(target: str, protocol: str, port: int, max_hops: int,
             port=port if protocol in ('tcp', 'udp') else None
         )
         
-        # Real-time tracing with per-hop output
-        def on_hop(hop: HopResult):
-            # Enrich this hop immediately
-            enriched = enrich_hop_sync(hop, cache, enable_ptr=dns, enable_geo=geo)
+        # Real-time tracing: hops are enriched in the background while
+        # probing continues, and printed in order as they become ready
+        def on_ready(enriched: EnrichedHop):
             enriched_hops.append(enriched)
-            
-            # Print immediately
             output.print_hop_realtime(enriched)
         
         # Execute trace
-        hops = tracer.trace(on_hop=on_hop)
+        if batch_enrich:
+            for enriched in enrichment.enrich_trace(tracer.trace()):
+                on_ready(enriched)
+        else:
+            with EnrichmentPipeline(enrichment.enrich, on_ready) as pipeline:
+                tracer.trace(on_hop=pipeline.push)
         
         # Print separator
         output.print_separator()
@@ -313,6 +377,8 @@ def main(target: str, protocol: str, port: int, max_hops: int,
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        enrichment.close()
 
 
 if __name__ == '__main__':
@@ -4,7 +4,7 @@ Diagnostic analysis for traceroute results
 
 from dataclasses import dataclass, field
 from typing import Optional
-from .models import EnrichedHop, Diagnosis
+from .models import EnrichedHop, Diagnosis, STOP_GAP_LIMIT
 
 
 # Configurable thresholds
@@ -21,6 +21,7 @@ class Diagnostics:
     
     Detects:
     - ICMP filtering (middle timeout with later response)
+    - Traces cut short by the gap limit (silent tail)
     - Latency jumps (significant RTT increase)
     - International egress (large latency jump suggesting undersea cable)
     - High jitter (RTT variance within hop)
@@ -60,6 +61,7 @@ class Diagnostics:
         last_hop = hops[-1]
         diagnosis.reachable = last_hop.reached_target
         diagnosis.total_hops = len(hops)
+        diagnosis.stop_reason = last_hop.stop_reason
         
         if last_hop.rtt_avg:
             diagnosis.avg_rtt = last_hop.rtt_avg
@@ -97,6 +99,13 @@ class Diagnostics:
         # Third pass: detect jitter and spikes
         self._tag_jitter(hops)
         
+        # Mark hops copied from the stop set rather than probed
+        for hop in hops:
+            if hop.from_stop_set and 'stop_set' not in hop.tags:
+                hop.tags.append('stop_set')
+            if hop.from_history and 'history' not in hop.tags:
+                hop.tags.append('history')
+        
         # Mark destination
         if hops and hops[-1].reached_target:
             if 'destination' not in hops[-1].tags:
@@ -125,6 +134,9 @@ class Diagnostics:
                     # Last hop timeout = unreachable
                     if 'unreachable' not in hop.tags:
                         hop.tags.append('unreachable')
+                    # Probing gave up early rather than running out of TTLs
+                    if hop.stop_reason == STOP_GAP_LIMIT and 'gap_limit' not in hop.tags:
+                        hop.tags.append('gap_limit')
     
     def _tag_latency(self, hops: list[EnrichedHop]):
         """Tag latency jumps and egress points"""
@@ -211,6 +223,11 @@ class Diagnostics:
         if not diagnosis.reachable:
             diagnosis.issues.append("Target unreachable")
         
+        if diagnosis.stop_reason == STOP_GAP_LIMIT:
+            diagnosis.issues.append(
+                "Trace stopped early: no replies from the last hops (gap limit)"
+            )
+        
         if diagnosis.filtered_hops:
             hops_str = ', '.join(str(h) for h in diagnosis.filtered_hops[:5])
             if len(diagnosis.filtered_hops) > 5:
@@ -224,7 +241,7 @@ class Diagnostics:
                 )
             else:
                 diagnosis.issues.append(f"Latency jump +{delta}ms at hop {hop}")
-
+    
     def _detect_route_type(self, hops: list[EnrichedHop], diagnosis: Diagnosis):
         """Detect route type based on ASNs"""
         networks = set()
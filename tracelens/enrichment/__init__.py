@@ -6,5 +6,7 @@ from .ip_classifier import IPClassifier, IPType
 from .ptr_resolver import PTRResolver
 from .asn_lookup import ASNLookup
 from .geo_lookup import GeoLookup
+from .service import EnrichmentService
 
-__all__ = ['IPClassifier', 'IPType', 'PTRResolver', 'ASNLookup', 'GeoLookup']
+__all__ = ['IPClassifier', 'IPType', 'PTRResolver', 'ASNLookup', 'GeoLookup',
+           'EnrichmentService']
@@ -3,13 +3,15 @@ ASN lookup via Team Cymru DNS service
 """
 
 import asyncio
-import socket
 from dataclasses import dataclass
-from typing import Optional
-from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+import dns.asyncresolver
 import dns.resolver
 import dns.exception
 
+if TYPE_CHECKING:
+    from ..cache import Cache
+
 
 @dataclass
 class ASNInfo:
@@ -21,6 +23,15 @@ class ASNInfo:
     registry: Optional[str] = None
 
 
+@dataclass
+class ASNOrg:
+    """What an AS number is registered to; shared by every IP it originates"""
+    asn: str  # e.g., "AS15169"
+    org: Optional[str] = None
+    country: Optional[str] = None
+    registry: Optional[str] = None
+
+
 class ASNLookup:
     """
     ASN lookup via Team Cymru DNS service.
@@ -30,16 +41,29 @@ class ASNLookup:
     2. Get org name: AS<asn>.asn.cymru.com
     
     Free, no API key required, reliable.
+    
+    Queries run on the event loop with dnspython's async resolver, each
+    bounded by ``timeout``; at most ``max_concurrency`` are in flight.
+    
+    The second query is made once per AS number, not once per IP:
+    concurrent lookups in the same AS share one query, and with
+    ``cache`` its answer is kept in the cache's ASN table (for the
+    cache's ``asn_ttl``), which is consulted first. An AS with no
+    registration is kept there too, with no org; failed queries are not.
     """
     
     ORIGIN_SUFFIX = "origin.asn.cymru.com"
     ASN_SUFFIX = "asn.cymru.com"
+    MAX_CONCURRENCY = 256
     
-    def __init__(self, timeout: float = 3.0, max_workers: int = 10):
+    def __init__(self, timeout: float = 3.0, max_concurrency: int = MAX_CONCURRENCY,
+                 cache: Optional['Cache'] = None):
         self.timeout = timeout
-        self.max_workers = max_workers
-        self._executor = ThreadPoolExecutor(max_workers=max_workers)
-        self._resolver = dns.resolver.Resolver()
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self._orgs: dict[str, asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._resolver = dns.asyncresolver.Resolver()
         self._resolver.timeout = timeout
         self._resolver.lifetime = timeout
     
@@ -48,16 +72,18 @@ class ASNLookup:
         parts = ip.split('.')
         return '.'.join(reversed(parts))
     
-    def _query_txt(self, domain: str) -> Optional[str]:
-        """Query TXT record"""
+    async def _query_txt(self, domain: str) -> Optional[str]:
+        """Query TXT record; '' if there is none, None if the query failed"""
         try:
-            answers = self._resolver.resolve(domain, 'TXT')
+            async with self._semaphore:
+                answers = await self._resolver.resolve(domain, 'TXT')
             for rdata in answers:
                 # TXT record content
                 txt = str(rdata).strip('"')
                 return txt
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, 
-                dns.resolver.NoNameservers, dns.exception.Timeout):
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return ''
+        except (dns.resolver.NoNameservers, dns.exception.Timeout):
             return None
         except Exception:
             return None
@@ -79,7 +105,7 @@ class ASNLookup:
             return asn, prefix, country
         return None
     
-    def _parse_asn_response(self, txt: str) -> Optional[str]:
+    def _parse_asn_response(self, asn: str, txt: str) -> Optional[ASNOrg]:
         """
         Parse AS<num>.asn.cymru.com response.
         Format: "ASN | CC | Registry | Date | Description"
@@ -89,34 +115,48 @@ class ASNLookup:
         
         parts = [p.strip() for p in txt.split('|')]
         if len(parts) >= 5:
-            return parts[4]  # Description/Org
+            return ASNOrg(
+                asn=asn,
+                org=parts[4],  # Description/Org
+                country=parts[1] or None,
+                registry=parts[2] or None
+            )
         return None
     
-    def _lookup_sync(self, ip: str) -> Optional[ASNInfo]:
-        """Synchronous ASN lookup"""
-        # First query: get ASN from IP
-        reversed_ip = self._reverse_ip(ip)
-        origin_domain = f"{reversed_ip}.{self.ORIGIN_SUFFIX}"
-        
-        origin_txt = self._query_txt(origin_domain)
-        parsed = self._parse_origin_response(origin_txt)
-        
-        if not parsed:
-            return None
+    async def lookup_org(self, asn: str) -> Optional[ASNOrg]:
+        """
+        Registration details of an AS number.
         
-        asn_num, prefix, country = parsed
+        Args:
+            asn: AS number, e.g. "AS15169"
+            
+        Returns:
+            ASNOrg or None
+        """
+        if self.cache:
+            cached = self.cache.get_asn_org(asn)
+            if cached:
+                return cached
         
-        # Second query: get org name from ASN
-        asn_domain = f"AS{asn_num}.{self.ASN_SUFFIX}"
-        asn_txt = self._query_txt(asn_domain)
-        org = self._parse_asn_response(asn_txt)
+        # Concurrent lookups for IPs in the same AS share one query; once
+        # it is done the answer lives in the cache, and failures are retried
+        future = self._orgs.get(asn)
+        if future is None:
+            future = self._orgs[asn] = asyncio.ensure_future(self._query_org(asn))
+            future.add_done_callback(lambda _: self._orgs.pop(asn, None))
         
-        return ASNInfo(
-            asn=f"AS{asn_num}",
-            org=org,
-            prefix=prefix,
-            country=country
-        )
+        return await asyncio.shield(future)
+    
+    async def _query_org(self, asn: str) -> Optional[ASNOrg]:
+        """Second query: org name, country and registry of an AS number"""
+        txt = await self._query_txt(f"{asn}.{self.ASN_SUFFIX}")
+        org = self._parse_asn_response(asn, txt)
+        if org is None and txt is not None:
+            # Answered, but nothing registered: cached too, so it is not asked again
+            org = ASNOrg(asn=asn)
+        if org and self.cache:
+            self.cache.set_asn_org(org)
+        return org
     
     async def lookup(self, ip: str) -> Optional[ASNInfo]:
         """
@@ -131,17 +171,29 @@ class ASNLookup:
         if not ip:
             return None
         
-        loop = asyncio.get_event_loop()
-        try:
-            result = await asyncio.wait_for(
-                loop.run_in_executor(self._executor, self._lookup_sync, ip),
-                timeout=self.timeout * 2  # Allow for two queries
-            )
-            return result
-        except asyncio.TimeoutError:
-            return None
-        except Exception:
+        # First query: get ASN from IP
+        reversed_ip = self._reverse_ip(ip)
+        origin_domain = f"{reversed_ip}.{self.ORIGIN_SUFFIX}"
+        
+        origin_txt = await self._query_txt(origin_domain)
+        parsed = self._parse_origin_response(origin_txt)
+        
+        if not parsed:
             return None
+        
+        asn_num, prefix, country = parsed
+        
+        # Second query, unless the AS is already known: get org name
+        asn = f"AS{asn_num}"
+        org = await self.lookup_org(asn)
+        
+        return ASNInfo(
+            asn=asn,
+            org=org.org if org else None,
+            prefix=prefix,
+            country=country,
+            registry=org.registry if org else None
+        )
     
     async def lookup_many(self, ips: list[str]) -> dict[str, Optional[ASNInfo]]:
         """
@@ -167,8 +219,7 @@ class ASNLookup:
         }
     
     def close(self):
-        """Shutdown thread pool"""
-        self._executor.shutdown(wait=False)
+        """Nothing to release; queries hold no sockets between calls"""
     
     def __enter__(self):
         return self
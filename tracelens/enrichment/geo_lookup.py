@@ -3,11 +3,13 @@ Geographic IP lookup via ip-api.com
 """
 
 import asyncio
+import time
 from dataclasses import dataclass
 from typing import Optional
 import httpx
 
 from ..models import GeoInfo
+from ..probe.pacing import TokenBucket
 
 
 # Country code to flag emoji mapping
@@ -36,17 +38,38 @@ class GeoLookup:
     """
     Geographic IP lookup via ip-api.com.
     
-    Free tier: 45 requests/minute (sufficient for traceroute).
-    No API key required.
+    Free tier: 45 requests/minute for single lookups and 15/minute for
+    batch lookups of up to 100 IPs. No API key required.
+    
+    Requests are paced to stay within both limits: each kind may burst
+    a third of its limit, then continues at two thirds of it, so no
+    60-second window ever holds more than the limit.
     """
     
     API_URL = "http://ip-api.com/json/{ip}"
     BATCH_URL = "http://ip-api.com/batch"
     FIELDS = "status,country,countryCode,city,lat,lon"
+    BATCH_SIZE = 100
+    RATE_LIMIT = 45  # Single lookups per minute
+    BATCH_RATE_LIMIT = 15  # Batch lookups per minute
     
     def __init__(self, timeout: float = 5.0):
         self.timeout = timeout
         self._client: Optional[httpx.AsyncClient] = None
+        self._single_bucket = self._bucket(self.RATE_LIMIT)
+        self._batch_bucket = self._bucket(self.BATCH_RATE_LIMIT)
+    
+    @staticmethod
+    def _bucket(per_minute: int) -> TokenBucket:
+        """Bucket allowing at most ``per_minute`` requests in any minute"""
+        burst = per_minute // 3
+        return TokenBucket((per_minute - burst) / 60, burst)
+    
+    async def _throttle(self, bucket: TokenBucket):
+        """Wait until ``bucket`` allows another request"""
+        delay = bucket.reserve(time.perf_counter())
+        if delay > 0:
+            await asyncio.sleep(delay)
     
     async def _get_client(self) -> httpx.AsyncClient:
         """Get or create HTTP client"""
@@ -71,6 +94,7 @@ class GeoLookup:
             client = await self._get_client()
             url = f"{self.API_URL.format(ip=ip)}?fields={self.FIELDS}"
             
+            await self._throttle(self._single_bucket)
             response = await client.get(url)
             
             if response.status_code != 200:
@@ -107,20 +131,11 @@ class GeoLookup:
         if not unique_ips:
             return {}
         
-        # Batch API supports up to 100 IPs
-        if len(unique_ips) <= 100:
-            return await self._batch_lookup(unique_ips)
-        
-        # Split into chunks
+        # Batch API supports up to 100 IPs; chunks are paced by the batch limit
         results = {}
-        for i in range(0, len(unique_ips), 100):
-            chunk = unique_ips[i:i + 100]
-            chunk_results = await self._batch_lookup(chunk)
-            results.update(chunk_results)
-            
-            # Rate limiting pause between chunks
-            if i + 100 < len(unique_ips):
-                await asyncio.sleep(1)
+        for i in range(0, len(unique_ips), self.BATCH_SIZE):
+            chunk = unique_ips[i:i + self.BATCH_SIZE]
+            results.update(await self._batch_lookup(chunk))
         
         return results
     
@@ -132,8 +147,13 @@ class GeoLookup:
             # Build query
             query = [{"query": ip, "fields": self.FIELDS} for ip in ips]
             
+            await self._throttle(self._batch_bucket)
             response = await client.post(self.BATCH_URL, json=query)
             
+            if response.status_code == 429:
+                # Over the limit; single lookups would only make it worse
+                return {ip: None for ip in ips}
+            
             if response.status_code != 200:
                 # Fallback to individual lookups
                 return await self._individual_lookups(ips)
@@ -3,9 +3,10 @@ PTR (reverse DNS) resolver
 """
 
 import asyncio
-import socket
 from typing import Optional
-from concurrent.futures import ThreadPoolExecutor
+import dns.asyncresolver
+import dns.resolver
+import dns.exception
 
 
 class PTRResolver:
@@ -13,22 +14,19 @@ class PTRResolver:
     Async PTR record resolver.
     
     Performs reverse DNS lookups to get hostnames for IP addresses.
-    Uses thread pool for parallel lookups.
+    Queries run on the event loop with dnspython's async resolver, each
+    bounded by ``timeout``; at most ``max_concurrency`` are in flight.
     """
     
-    def __init__(self, timeout: float = 2.0, max_workers: int = 10):
-        self.timeout = timeout
-        self.max_workers = max_workers
-        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+    MAX_CONCURRENCY = 256
     
-    def _resolve_sync(self, ip: str) -> Optional[str]:
-        """Synchronous PTR lookup"""
-        try:
-            socket.setdefaulttimeout(self.timeout)
-            hostname, _, _ = socket.gethostbyaddr(ip)
-            return hostname
-        except (socket.herror, socket.gaierror, socket.timeout, OSError):
-            return None
+    def __init__(self, timeout: float = 2.0, max_concurrency: int = MAX_CONCURRENCY):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._resolver = dns.asyncresolver.Resolver()
+        self._resolver.timeout = timeout
+        self._resolver.lifetime = timeout
     
     async def resolve(self, ip: str) -> Optional[str]:
         """
@@ -43,17 +41,17 @@ class PTRResolver:
         if not ip:
             return None
         
-        loop = asyncio.get_event_loop()
         try:
-            result = await asyncio.wait_for(
-                loop.run_in_executor(self._executor, self._resolve_sync, ip),
-                timeout=self.timeout
-            )
-            return result
-        except asyncio.TimeoutError:
+            async with self._semaphore:
+                answers = await self._resolver.resolve_address(ip)
+            for rdata in answers:
+                return str(rdata.target).rstrip('.')
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer,
+                dns.resolver.NoNameservers, dns.exception.Timeout):
             return None
         except Exception:
             return None
+        return None
     
     async def resolve_many(self, ips: list[str]) -> dict[str, Optional[str]]:
         """
@@ -79,8 +77,7 @@ class PTRResolver:
         }
     
     def close(self):
-        """Shutdown thread pool"""
-        self._executor.shutdown(wait=False)
+        """Nothing to release; queries hold no state between calls"""
     
     def __enter__(self):
         return self
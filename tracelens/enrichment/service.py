@@ -0,0 +1,277 @@
+"""
+Long-lived enrichment service shared by every trace in a process
+"""
+
+import asyncio
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from ..models import EnrichedHop, GeoInfo, HopResult
+from .asn_lookup import ASNInfo, ASNLookup
+from .geo_lookup import GeoLookup
+from .ip_classifier import IPClassifier
+from .ptr_resolver import PTRResolver
+
+if TYPE_CHECKING:
+    from ..cache import Cache
+
+
+class EnrichmentService:
+    """
+    ASN, geo and PTR enrichment for hops, set up once per process.
+    
+    The service runs one event loop on a background thread. That loop
+    owns a single ASNLookup and PTRResolver (async DNS queries on the
+    loop, no threads) and one GeoLookup (one HTTP connection pool, so
+    no per-hop TCP handshakes). ``enrich()`` and ``enrich_many()``
+    block the calling thread and may be called from any number of
+    threads; ``enrich_async()`` can be awaited from another event loop.
+    
+    Lookups for a public IP run concurrently, consult ``cache`` first
+    and store what they find. Concurrent requests for the same IP share
+    one set of lookups. All cache access happens on the service's loop.
+    
+    ``enrich_trace()`` enriches a whole trace at once instead: the
+    uncached public IPs of every trace handed to it within
+    ``BATCH_WINDOW`` seconds are deduped and resolved together, with
+    one ip-api batch request per 100 IPs and the ASN and PTR lookups
+    fanned out concurrently. This keeps a batch run within ip-api's
+    rate limits where per-hop geo lookups would exceed them.
+    """
+    
+    ASN_TIMEOUT = 3.0
+    GEO_TIMEOUT = 3.0
+    PTR_TIMEOUT = 2.0
+    MAX_QUERIES = 256  # DNS queries in flight, per lookup kind
+    BATCH_WINDOW = 0.5
+    
+    def __init__(self, cache: Optional['Cache'] = None, enable_ptr: bool = True,
+                 enable_geo: bool = True, max_queries: int = MAX_QUERIES):
+        self.cache = cache
+        self.enable_ptr = enable_ptr
+        self.enable_geo = enable_geo
+        self._asn = ASNLookup(timeout=self.ASN_TIMEOUT, max_concurrency=max_queries,
+                              cache=cache)
+        self._geo = GeoLookup(timeout=self.GEO_TIMEOUT)
+        self._ptr = PTRResolver(timeout=self.PTR_TIMEOUT, max_concurrency=max_queries)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._queued: dict[str, asyncio.Future] = {}  # Waiting for the next batch
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name='tracelens-enrichment', daemon=True
+        )
+        self._thread.start()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+    
+    def enrich(self, hop: HopResult) -> EnrichedHop:
+        """Enrich one hop, blocking until its lookups finish"""
+        return asyncio.run_coroutine_threadsafe(self._enrich(hop), self._loop).result()
+    
+    def enrich_many(self, hops: list[HopResult]) -> list[EnrichedHop]:
+        """Enrich several hops concurrently; results are in the same order"""
+        return asyncio.run_coroutine_threadsafe(
+            self._enrich_many(hops), self._loop
+        ).result()
+    
+    async def enrich_async(self, hop: HopResult) -> EnrichedHop:
+        """Enrich one hop from a coroutine running on any event loop"""
+        future = asyncio.run_coroutine_threadsafe(self._enrich(hop), self._loop)
+        return await asyncio.wrap_future(future)
+    
+    def enrich_trace(self, hops: list[HopResult]) -> list[EnrichedHop]:
+        """Enrich every hop of a trace with batched lookups; results are in order"""
+        return asyncio.run_coroutine_threadsafe(
+            self._enrich_trace(hops), self._loop
+        ).result()
+    
+    async def enrich_trace_async(self, hops: list[HopResult]) -> list[EnrichedHop]:
+        """``enrich_trace()`` from a coroutine running on any event loop"""
+        future = asyncio.run_coroutine_threadsafe(self._enrich_trace(hops), self._loop)
+        return await asyncio.wrap_future(future)
+    
+    async def _enrich_many(self, hops: list[HopResult]) -> list[EnrichedHop]:
+        return list(await asyncio.gather(*(self._enrich(hop) for hop in hops)))
+    
+    async def _enrich_trace(self, hops: list[HopResult]) -> list[EnrichedHop]:
+        ips = [hop.ip for hop in hops if hop.ip and IPClassifier.should_enrich(hop.ip)]
+        found = await self._lookup_many(ips)
+        return [self._build(hop, found.get(hop.ip)) for hop in hops]
+    
+    async def _enrich(self, hop: HopResult) -> EnrichedHop:
+        """Classify a hop's IP and attach ASN, geo and PTR data"""
+        found = None
+        if hop.ip and IPClassifier.should_enrich(hop.ip):
+            found = await self._lookup(hop.ip)
+        return self._build(hop, found)
+    
+    def _build(self, hop: HopResult, found: Optional[tuple]) -> EnrichedHop:
+        """EnrichedHop for ``hop`` from the lookup results for its IP"""
+        enriched = EnrichedHop(
+            hop=hop.hop,
+            ip=hop.ip,
+            rtts=hop.rtts,
+            reached_target=hop.reached_target,
+            stop_reason=hop.stop_reason,
+            from_stop_set=hop.from_stop_set,
+            from_history=hop.from_history,
+            probes_sent=hop.probes_sent
+        )
+        
+        if not hop.ip:
+            return enriched
+        
+        enriched.ip_type = IPClassifier.classify(hop.ip).value
+        tag = IPClassifier.get_tag(hop.ip)
+        if tag:
+            enriched.tags.append(tag)
+        
+        # Only public addresses have anything to look up
+        if not found:
+            return enriched
+        
+        asn_info, geo, ptr = found
+        if asn_info:
+            enriched.asn = asn_info.asn
+            enriched.org = asn_info.org
+        enriched.geo = geo
+        enriched.ptr = ptr
+        
+        # Fallback: use country from ASN data when GeoIP is missing
+        if not enriched.geo and asn_info and asn_info.country:
+            enriched.geo = GeoInfo(country_code=asn_info.country)
+        
+        return enriched
+    
+    def _track(self, ip: str, future: asyncio.Future):
+        """Share ``future`` with every lookup for ``ip`` until it is done"""
+        self._inflight[ip] = future
+        future.add_done_callback(lambda _: self._inflight.pop(ip, None))
+    
+    async def _lookup(self, ip: str) -> tuple[Optional[ASNInfo], Optional[GeoInfo], Optional[str]]:
+        """Lookups for ``ip``, shared with any already running for it"""
+        if ip not in self._inflight:
+            self._track(ip, asyncio.ensure_future(self._fetch(ip)))
+        return await asyncio.shield(self._inflight[ip])
+    
+    async def _lookup_many(self, ips: list[str]) -> dict[str, tuple]:
+        """
+        Lookups for every IP in ``ips``, queued for the next batch.
+        
+        IPs already being looked up share those lookups; the rest join
+        the queue, which is flushed ``BATCH_WINDOW`` seconds after its
+        first IP arrives.
+        """
+        ips = list(dict.fromkeys(ips))
+        for ip in ips:
+            if ip not in self._inflight:
+                future = self._queued[ip] = self._loop.create_future()
+                self._track(ip, future)
+        
+        if self._queued and self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.BATCH_WINDOW, self._flush)
+        
+        results = await asyncio.gather(*(asyncio.shield(self._inflight[ip]) for ip in ips))
+        return dict(zip(ips, results))
+    
+    def _flush(self):
+        """Look up every queued IP in one batch"""
+        queued, self._queued = self._queued, {}
+        self._flush_handle = None
+        
+        def resolve(task: asyncio.Task):
+            found = {} if task.cancelled() or task.exception() else task.result()
+            for ip, future in queued.items():
+                if not future.done():
+                    future.set_result(found.get(ip, (None, None, None)))
+        
+        asyncio.ensure_future(self._fetch_many(list(queued))).add_done_callback(resolve)
+    
+    async def _fetch(self, ip: str) -> tuple[Optional[ASNInfo], Optional[GeoInfo], Optional[str]]:
+        """Cached data for ``ip``, with whatever is missing looked up concurrently"""
+        cache = self.cache
+        asn_info = cache.get_asn(ip) if cache else None
+        geo = cache.get_geo(ip) if cache and self.enable_geo else None
+        ptr = cache.get_ptr(ip) if cache and self.enable_ptr else None
+        
+        lookups = {}
+        if not asn_info:
+            lookups['asn'] = self._asn.lookup(ip)
+        if self.enable_geo and not geo:
+            lookups['geo'] = self._geo.lookup(ip)
+        if self.enable_ptr and not ptr:
+            lookups['ptr'] = self._ptr.resolve(ip)
+        
+        if lookups:
+            results = await asyncio.gather(*lookups.values(), return_exceptions=True)
+            found = {
+                name: result for name, result in zip(lookups, results)
+                if result and not isinstance(result, BaseException)
+            }
+            if found and cache is not None:
+                cache.set(ip, **found)
+            
+            asn_info = found.get('asn', asn_info)
+            geo = found.get('geo', geo)
+            ptr = found.get('ptr', ptr)
+        
+        return asn_info, geo, ptr
+    
+    async def _fetch_many(self, ips: list[str]) -> dict[str, tuple]:
+        """
+        ``_fetch()`` for many IPs at once.
+        
+        Whatever the cache lacks is looked up with one ``lookup_many``
+        call per source: batched POSTs for geo, concurrent DNS queries
+        for ASN and PTR.
+        """
+        cache = self.cache
+        known = {
+            ip: {
+                'asn': cache.get_asn(ip) if cache else None,
+                'geo': cache.get_geo(ip) if cache and self.enable_geo else None,
+                'ptr': cache.get_ptr(ip) if cache and self.enable_ptr else None,
+            }
+            for ip in ips
+        }
+        
+        def missing(name: str) -> list[str]:
+            return [ip for ip, data in known.items() if not data[name]]
+        
+        lookups = {'asn': self._asn.lookup_many(missing('asn'))}
+        if self.enable_geo:
+            lookups['geo'] = self._geo.lookup_many(missing('geo'))
+        if self.enable_ptr:
+            lookups['ptr'] = self._ptr.resolve_many(missing('ptr'))
+        
+        results = await asyncio.gather(*lookups.values(), return_exceptions=True)
+        for name, result in zip(lookups, results):
+            if isinstance(result, BaseException):
+                continue
+            
+            for ip, value in result.items():
+                if value and ip in known:
+                    known[ip][name] = value
+                    if cache is not None:
+                        cache.set(ip, **{name: value})
+        
+        return {
+            ip: (data['asn'], data['geo'], data['ptr'])
+            for ip, data in known.items()
+        }
+    
+    def close(self):
+        """Close the HTTP client and stop the loop"""
+        if self._loop.is_closed():
+            return
+        
+        asyncio.run_coroutine_threadsafe(self._geo.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
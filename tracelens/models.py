@@ -7,12 +7,19 @@ from typing import Optional
 from datetime import datetime
 
 
+# Why a trace stopped (set on its last hop)
+STOP_REACHED = 'reached'        # Destination answered
+STOP_GAP_LIMIT = 'gap_limit'    # Too many consecutive silent hops
+STOP_MAX_HOPS = 'max_hops'      # Ran out of TTLs
+
+
 @dataclass
 class ProbeResult:
     """Result of a single probe"""
     responder_ip: Optional[str] = None
     rtt_ms: Optional[float] = None
     reached_target: bool = False
+    reply_ttl: Optional[int] = None  # IP TTL left on the reply, if known
 
 
 @dataclass
@@ -22,6 +29,10 @@ class HopResult:
     ip: Optional[str] = None
     rtts: list[Optional[float]] = field(default_factory=list)
     reached_target: bool = False
+    stop_reason: Optional[str] = None  # STOP_* on the last hop of a trace
+    from_stop_set: bool = False  # Inferred from an earlier trace, not probed
+    from_history: bool = False  # Copied from the last path to the same prefix
+    probes_sent: int = 0  # Probes actually sent to this TTL
     
     @property
     def rtt_min(self) -> Optional[float]:
@@ -66,6 +77,10 @@ class EnrichedHop:
     ip_type: Optional[str] = None  # private, cgnat, public, etc.
     tags: list[str] = field(default_factory=list)
     reached_target: bool = False
+    stop_reason: Optional[str] = None
+    from_stop_set: bool = False
+    from_history: bool = False
+    probes_sent: int = 0
     
     @property
     def rtt_min(self) -> Optional[float]:
@@ -94,6 +109,7 @@ class TraceResult:
     hops: list[EnrichedHop] = field(default_factory=list)
     reachable: bool = False
     total_hops: int = 0
+    error: Optional[str] = None  # Set when the target could not be traced
     
     @property
     def final_rtt(self) -> Optional[float]:
@@ -112,4 +128,5 @@ class Diagnosis:
     latency_jumps: list[tuple[int, float]] = field(default_factory=list)  # (hop, delta_ms)
     egress_hop: Optional[int] = None
     route_type: Optional[str] = None
+    stop_reason: Optional[str] = None
     issues: list[str] = field(default_factory=list)
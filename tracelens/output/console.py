@@ -10,7 +10,7 @@ from rich.text import Text
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
 from rich import box
 
-from ..models import EnrichedHop, TraceResult, Diagnosis, HopResult
+from ..models import EnrichedHop, TraceResult, Diagnosis, HopResult, STOP_GAP_LIMIT
 from ..enrichment.geo_lookup import get_flag
 
 
@@ -22,6 +22,9 @@ TAG_STYLES = {
     'linklocal': ('🔗', 'dim'),
     'icmp_filtered': ('⚠️', 'yellow'),
     'unreachable': ('❌', 'red'),
+    'gap_limit': ('⏹️', 'red'),
+    'stop_set': ('♻️', 'dim'),
+    'history': ('🕘', 'dim'),
     'latency_jump': ('🚀', 'cyan'),
     'international_egress': ('🌏', 'magenta'),
     'high_jitter': ('📈', 'yellow'),
@@ -272,6 +275,8 @@ class ConsoleOutput:
         else:
             content.append("❌ ", style="red")
             content.append("Target Unreachable", style="bold red")
+            if diagnosis.stop_reason == STOP_GAP_LIMIT:
+                content.append(" (stopped by gap limit)", style="dim")
         
         # Route Type
         if diagnosis.route_type:
@@ -312,6 +317,40 @@ class ConsoleOutput:
         self.console.print()
         self.console.print(panel)
     
+    def print_batch_result(self, result: TraceResult, diagnosis: Diagnosis):
+        """Print a one-line summary of a finished trace (batch mode)"""
+        line = Text()
+        
+        if result.error:
+            line.append("❌ ", style="red")
+            line.append(f"{result.target:<24}  ", style="bold")
+            line.append(result.error, style="red")
+            self.console.print(line)
+            return
+        
+        target = result.target
+        if result.resolved_ip and result.resolved_ip != target:
+            target += f" ({result.resolved_ip})"
+        
+        if diagnosis.reachable:
+            line.append("✅ ", style="green")
+        else:
+            line.append("❌ ", style="red")
+        line.append(f"{target:<40}  ", style="bold")
+        line.append(f"{result.total_hops:>2} hops  ", style="dim")
+        
+        if diagnosis.avg_rtt:
+            line.append(f"{diagnosis.avg_rtt:>6.0f}ms", style="dim")
+        else:
+            line.append(f"{'-':>8}", style="dim")
+        
+        if diagnosis.route_type:
+            line.append(f"  {diagnosis.route_type}", style="cyan")
+        if diagnosis.filtered_hops:
+            line.append(f"  ⚠️ filtered: {len(diagnosis.filtered_hops)}", style="yellow")
+        
+        self.console.print(line)
+    
     def print_error(self, message: str):
         """Print error message"""
         self.console.print(f"[bold red]Error:[/] {message}")
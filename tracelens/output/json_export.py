@@ -63,10 +63,14 @@ class JsonExporter:
                     for hop, delta in diagnosis.latency_jumps
                 ],
                 "egress_hop": diagnosis.egress_hop,
+                "stop_reason": diagnosis.stop_reason,
                 "summary": diagnosis.issues
             }
         }
         
+        if result.error:
+            data["error"] = result.error
+        
         if output_path:
             self._write_file(data, output_path)
         
@@ -89,7 +93,11 @@ class JsonExporter:
             "org": hop.org,
             "geo": self._serialize_geo(hop.geo) if hop.geo else None,
             "ip_type": hop.ip_type,
-            "tags": hop.tags
+            "tags": hop.tags,
+            "stop_reason": hop.stop_reason,
+            "from_stop_set": hop.from_stop_set,
+            "from_history": hop.from_history,
+            "probes_sent": hop.probes_sent
         }
     
     def _serialize_geo(self, geo) -> dict:
@@ -0,0 +1,82 @@
+"""
+Background hop enrichment that keeps pace with probing
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from .batch import plain_hop
+from .models import EnrichedHop, HopResult
+
+
+class EnrichmentPipeline:
+    """
+    Enrich hops on a worker pool while the trace keeps probing.
+    
+    ``push(hop)`` queues a HopResult and returns at once, so it can be
+    used directly as ``Tracer.trace``'s ``on_hop`` callback. ``on_ready``
+    receives each EnrichedHop in hop order as soon as it and every hop
+    before it are enriched; it runs on whichever thread finished last,
+    one call at a time. A whole trace then takes about as long as the
+    slower of probing and enrichment rather than their sum.
+    
+    A hop whose enrichment fails (or is cancelled) is delivered without
+    enrichment.
+    """
+    
+    DEFAULT_WORKERS = 8
+    
+    def __init__(self, enrich: Callable[[HopResult], EnrichedHop],
+                 on_ready: Optional[Callable[[EnrichedHop], None]] = None,
+                 workers: int = DEFAULT_WORKERS):
+        self.enrich = enrich
+        self.on_ready = on_ready
+        self.hops: list[EnrichedHop] = []  # Delivered so far, in order
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._queue: deque[tuple[HopResult, Future]] = deque()
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        # On an error or interrupt, skip enrichment that has not started
+        self.close(cancel=exc_type is not None)
+    
+    def push(self, hop: HopResult):
+        """Queue a hop for enrichment"""
+        future = self._executor.submit(self.enrich, hop)
+        with self._lock:
+            self._queue.append((hop, future))
+        future.add_done_callback(lambda _: self._deliver())
+    
+    def _deliver(self):
+        """Hand finished hops at the head of the queue to ``on_ready``"""
+        with self._lock:
+            while self._queue and self._queue[0][1].done():
+                hop, future = self._queue.popleft()
+                try:
+                    enriched = future.result()
+                except Exception:
+                    enriched = plain_hop(hop)
+                
+                self.hops.append(enriched)
+                if self.on_ready:
+                    self.on_ready(enriched)
+    
+    def close(self, cancel: bool = False) -> list[EnrichedHop]:
+        """
+        Wait for queued hops to be enriched and delivered.
+        
+        Args:
+            cancel: Deliver hops whose enrichment has not started
+                without enriching them
+        
+        Returns:
+            Every delivered EnrichedHop, in hop order
+        """
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+        self._deliver()
+        return self.hops
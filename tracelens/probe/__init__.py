@@ -6,6 +6,18 @@ from .base import BaseProbe
 from .icmp import ICMPProbe
 from .tcp import TCPProbe
 from .udp import UDPProbe
-from .tracer import Tracer
+from .stateless import StatelessProbe
+from .errqueue import DgramICMPProbe, DgramUDPProbe
+from .timeouts import AdaptiveTimeout, TimeoutHistory
+from .probecount import AdaptiveProbeCount
+from .stopset import StopSet
+from .history import PathHistory
+from .batchio import BatchIO
+from .ids import IDPool
+from .pacing import Pacer, PacerStats, set_shared_pacer, shared_pacer
+from .tracer import Tracer, create_probe
 
-__all__ = ['BaseProbe', 'ICMPProbe', 'TCPProbe', 'UDPProbe', 'Tracer']
+__all__ = ['BaseProbe', 'ICMPProbe', 'TCPProbe', 'UDPProbe', 'StatelessProbe',
+           'DgramICMPProbe', 'DgramUDPProbe', 'Tracer', 'create_probe',
+           'AdaptiveTimeout', 'TimeoutHistory', 'AdaptiveProbeCount', 'StopSet', 'PathHistory', 'BatchIO', 'IDPool',
+           'Pacer', 'PacerStats', 'set_shared_pacer', 'shared_pacer']
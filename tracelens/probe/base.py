@@ -2,25 +2,91 @@
 Abstract base class for probe implementations
 """
 
+import asyncio
+import itertools
+import select
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Hashable, Optional, Sequence
 from ..models import ProbeResult
+from .batchio import BatchIO
+from .pacing import Pacer, shared_pacer
+
+
+@dataclass
+class PendingProbe:
+    """Bookkeeping for a probe that has been sent but not yet answered"""
+    target_ip: str
+    ttl: int
+    send_time: float
+    deadline: float
 
 
 class BaseProbe(ABC):
-    """Abstract base class for network probes"""
+    """
+    Abstract base class for network probes.
+    
+    Besides the blocking ``probe()`` call, every probe supports an
+    in-flight mode: ``send()`` fires a probe and returns a key, and
+    ``poll()`` reports ``(key, ProbeResult)`` pairs as replies arrive or
+    probes time out. Every key returned by ``send()`` is reported by
+    ``poll()`` exactly once unless it is cancelled.
+    
+    Engines that own their receive sockets override ``send()``,
+    ``_receive_sockets()`` and ``_match_reply()``. Other engines fall back
+    to running ``probe()`` on a small thread pool.
+    
+    ``probe_async()`` is the asyncio counterpart of ``probe()``; it is
+    built on the same in-flight machinery.
+    
+    Replies are drained in batches (``recvmmsg`` on Linux) into
+    preallocated buffers; see ``BatchIO``.
+    
+    Engines wait for ``pace()`` before emitting each probe, so a pacer
+    (the engine's ``pacer``, else the process-wide one) caps the probe
+    rate across every engine and trace that uses it.
+    
+    ``probe()``, ``send()`` and ``probe_async()`` accept a per-probe
+    ``timeout`` that overrides the engine default for that probe only.
+    
+    Engines whose ``probe()`` is ``send()`` plus ``_wait()`` can mix both
+    modes: probes sent earlier that complete while ``probe()`` waits are
+    kept for the next ``poll()``.
+    """
+    
+    FALLBACK_WORKERS = 32
+    MAX_READS_PER_POLL = 256
+    MAX_INFLIGHT: Optional[int] = None  # None = no engine-imposed limit
+    KERNEL_FILTER = True  # attach a BPF reply filter to raw receive sockets (Linux)
     
     def __init__(self, timeout: float = 2.0):
         self.timeout = timeout
+        self._pending: dict[Hashable, PendingProbe] = {}
+        self._completed: dict[Hashable, ProbeResult] = {}  # held for the next poll()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: dict[Hashable, Future] = {}
+        self._keys = itertools.count()
+        self._waiters: dict[Hashable, asyncio.Future] = {}
+        self._reader_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight_limit: Optional[int] = None
+        self._batch_io: dict[int, BatchIO] = {}
+        self.pacer: Optional[Pacer] = None  # None = the shared pacer, if any
+        self._prepaid = 0
     
     @abstractmethod
-    def probe(self, target_ip: str, ttl: int) -> ProbeResult:
+    def probe(self, target_ip: str, ttl: int,
+              timeout: Optional[float] = None) -> ProbeResult:
         """
         Send a probe with given TTL and return result.
         
         Args:
             target_ip: Target IP address (already resolved)
             ttl: Time-to-live value
-            
+            timeout: Wait for this probe, in seconds (default: engine timeout)
+        
         Returns:
             ProbeResult with responder IP and RTT
         """
@@ -31,9 +97,334 @@ class BaseProbe(ABC):
         """Clean up resources"""
         pass
     
+    def send(self, target_ip: str, ttl: int,
+             timeout: Optional[float] = None) -> Hashable:
+        """
+        Send a probe without waiting for the reply.
+        
+        Args:
+            target_ip: Target IP address (already resolved)
+            ttl: Time-to-live value
+            timeout: Wait for this probe, in seconds (default: engine timeout)
+        
+        Returns:
+            Key identifying the probe in later ``poll()`` results
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.FALLBACK_WORKERS)
+        
+        key = next(self._keys)
+        self._futures[key] = self._executor.submit(self.probe, target_ip, ttl, timeout)
+        return key
+    
+    def send_many(self, probes: Sequence[tuple[str, int, Optional[float]]]) -> list[Hashable]:
+        """
+        Send several probes without waiting for any of them.
+        
+        Engines that can put a whole batch on the wire with one syscall
+        do so, unless a pacer is spacing probes out; otherwise each probe
+        goes through ``send()``.
+        
+        Args:
+            probes: (target IP, TTL, timeout) for each probe
+        
+        Returns:
+            Probe keys, in the order of ``probes``
+        """
+        if len(probes) > 1 and not self._prepaid and (self.pacer or shared_pacer()) is None:
+            keys = self._send_batch(probes)
+            if keys is not None:
+                return keys
+        return [self.send(*p) for p in probes]
+    
+    def poll(self, timeout: float) -> list[tuple[Hashable, ProbeResult]]:
+        """
+        Wait for replies to in-flight probes.
+        
+        Returns as soon as at least one probe has completed (answered or
+        timed out), or after ``timeout`` seconds with an empty list.
+        
+        Args:
+            timeout: Maximum time to wait in seconds
+        
+        Returns:
+            List of (key, ProbeResult) for completed probes
+        """
+        if self._completed:
+            # Completed while a blocking probe() was waiting
+            results = list(self._completed.items())
+            self._completed.clear()
+            return results
+        return self._poll(timeout)
+    
+    def _poll(self, timeout: float) -> list[tuple[Hashable, ProbeResult]]:
+        """``poll()`` without the results held back by ``_wait()``"""
+        if self._futures:
+            return self._poll_futures(timeout)
+        
+        if not self._pending:
+            return []
+        
+        now = time.perf_counter()
+        next_deadline = min(p.deadline for p in self._pending.values())
+        wait_time = max(0.0, min(timeout, next_deadline - now))
+        
+        sockets = self._receive_sockets()
+        select.select(sockets, [], [], wait_time)
+        
+        results = self._read_ready()
+        results.extend(self._expire(time.perf_counter()))
+        return results
+    
+    async def probe_async(self, target_ip: str, ttl: int,
+                          timeout: Optional[float] = None) -> ProbeResult:
+        """
+        Send a probe and await its result without blocking the event loop.
+        
+        Replies are read by a ``loop.add_reader`` callback on the engine's
+        receive sockets, so any number of probes (and traces sharing this
+        engine) can be awaited concurrently from one event loop.
+        
+        Args:
+            target_ip: Target IP address (already resolved)
+            ttl: Time-to-live value
+            timeout: Wait for this probe, in seconds (default: engine timeout)
+            
+        Returns:
+            ProbeResult with responder IP and RTT
+        """
+        loop = asyncio.get_running_loop()
+        
+        if not self._receive_sockets():
+            # No sockets to watch; run the blocking probe off the loop
+            return await loop.run_in_executor(None, self.probe, target_ip, ttl, timeout)
+        
+        self._attach_reader(loop)
+        
+        limits = [n for n in (self.MAX_INFLIGHT, self._inflight_limit) if n]
+        if limits:
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(min(limits))
+            await self._slots.acquire()
+        
+        try:
+            await self._pace_async(target_ip)
+            key = self.send(target_ip, ttl, timeout)
+            future = loop.create_future()
+            self._waiters[key] = future
+            timer = loop.call_later(self._timeout(timeout), self._on_async_timeout, key)
+            
+            try:
+                return await future
+            finally:
+                timer.cancel()
+                if self._waiters.pop(key, None) is not None:
+                    # Cancelled while waiting
+                    self.cancel(key)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+    
+    def pace(self, target_ip: str):
+        """Block until the pacer lets a probe to ``target_ip`` go out"""
+        if self._prepaid:
+            # Already waited for in probe_async()
+            self._prepaid -= 1
+            return
+        
+        pacer = self.pacer or shared_pacer()
+        if pacer is not None:
+            pacer.wait(target_ip)
+    
+    async def _pace_async(self, target_ip: str):
+        """Wait for the pacer on the event loop; the next ``pace()`` is free"""
+        pacer = self.pacer or shared_pacer()
+        if pacer is not None:
+            await pacer.wait_async(target_ip)
+            self._prepaid += 1
+    
+    def limit_inflight(self, limit: Optional[int]):
+        """
+        Cap the number of probes awaited concurrently via ``probe_async()``.
+        
+        Set once, before the engine is first used from an event loop.
+        """
+        self._inflight_limit = limit
+        self._slots = None
+    
+    def cancel(self, key: Hashable):
+        """Forget an in-flight probe; its reply will be ignored"""
+        self._pending.pop(key, None)
+        self._completed.pop(key, None)
+        future = self._futures.pop(key, None)
+        if future:
+            future.cancel()
+    
+    def _read_ready(self) -> list[tuple[Hashable, ProbeResult]]:
+        """Read and match the packets already queued on the receive sockets"""
+        results: list[tuple[Hashable, ProbeResult]] = []
+        sockets = self._receive_sockets()
+        
+        for _ in range(self.MAX_READS_PER_POLL):
+            readable, _, _ = select.select(sockets, [], [], 0)
+            if not readable:
+                break
+            
+            for sock in readable:
+                for data, responder_ip, recv_time in self._batch_for(sock).recv_many():
+                    match = self._match_reply(sock, data, responder_ip, recv_time)
+                    if match is not None:
+                        results.append(match)
+        
+        return results
+    
+    def _batch_for(self, sock) -> BatchIO:
+        """Batched reader/writer for one of the engine's sockets"""
+        batch = self._batch_io.get(sock.fileno())
+        if batch is None or batch.sock is not sock:
+            batch = self._batch_io[sock.fileno()] = BatchIO(sock)
+        return batch
+    
+    def _attach_reader(self, loop: asyncio.AbstractEventLoop):
+        """Watch the receive sockets from ``loop``"""
+        if self._reader_loop is loop:
+            return
+        
+        self._detach_reader()
+        for sock in self._receive_sockets():
+            loop.add_reader(sock.fileno(), self._on_readable)
+        self._reader_loop = loop
+    
+    def _detach_reader(self):
+        """Stop watching the receive sockets"""
+        if self._reader_loop is None:
+            return
+        
+        if not self._reader_loop.is_closed():
+            for sock in self._receive_sockets():
+                try:
+                    self._reader_loop.remove_reader(sock.fileno())
+                except (ValueError, OSError):
+                    pass
+        self._reader_loop = None
+    
+    def _on_readable(self):
+        """Event loop callback: resolve the futures of answered probes"""
+        for key, result in self._read_ready():
+            future = self._waiters.pop(key, None)
+            if future is None:
+                # Sent with send(); reported by the next poll()
+                self._completed[key] = result
+            elif not future.done():
+                future.set_result(result)
+    
+    def _on_async_timeout(self, key: Hashable):
+        """Event loop callback: an awaited probe ran out of time"""
+        future = self._waiters.pop(key, None)
+        self.cancel(key)
+        if future is not None and not future.done():
+            future.set_result(ProbeResult())
+    
+    def _wait(self, key: Hashable, timeout: Optional[float] = None) -> ProbeResult:
+        """
+        Block until the in-flight probe ``key`` completes.
+        
+        Other probes that complete meanwhile are held for the next ``poll()``.
+        """
+        while True:
+            for done_key, result in self._poll(self._timeout(timeout)):
+                if done_key == key:
+                    return result
+                self._completed[done_key] = result
+    
+    def _timeout(self, timeout: Optional[float]) -> float:
+        """Per-probe timeout, falling back to the engine default"""
+        return self.timeout if timeout is None else timeout
+    
+    def _track(self, key: Hashable, target_ip: str, ttl: int, send_time: float,
+               timeout: Optional[float] = None):
+        """Register a sent probe so its reply can be matched"""
+        self._pending[key] = PendingProbe(
+            target_ip=target_ip,
+            ttl=ttl,
+            send_time=send_time,
+            deadline=send_time + self._timeout(timeout)
+        )
+    
+    def _complete(self, key: Hashable, responder_ip: str, recv_time: float,
+                  reached_target: bool,
+                  reply_ttl: Optional[int] = None) -> Optional[tuple[Hashable, ProbeResult]]:
+        """Resolve a pending probe from a matched reply"""
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return None
+        
+        rtt_ms = (recv_time - pending.send_time) * 1000
+        return key, ProbeResult(
+            responder_ip=responder_ip,
+            rtt_ms=round(rtt_ms, 2),
+            reached_target=reached_target,
+            reply_ttl=reply_ttl
+        )
+    
+    def _expire(self, now: float) -> list[tuple[Hashable, ProbeResult]]:
+        """Report pending probes whose deadline has passed as timeouts"""
+        expired = [k for k, p in self._pending.items() if p.deadline <= now]
+        for key in expired:
+            del self._pending[key]
+        return [(key, ProbeResult()) for key in expired]
+    
+    def _poll_futures(self, timeout: float) -> list[tuple[Hashable, ProbeResult]]:
+        """Collect results from the thread-pool fallback"""
+        done, _ = wait(list(self._futures.values()), timeout=timeout,
+                       return_when=FIRST_COMPLETED)
+        
+        results = []
+        for key, future in list(self._futures.items()):
+            if future in done:
+                del self._futures[key]
+                try:
+                    results.append((key, future.result()))
+                except Exception:
+                    results.append((key, ProbeResult()))
+        return results
+    
+    def _send_batch(self, probes: Sequence[tuple[str, int, Optional[float]]]
+                    ) -> Optional[list[Hashable]]:
+        """Send unpaced probes with one batched syscall; None if not supported"""
+        return None
+    
+    def _receive_sockets(self) -> list:
+        """Sockets that carry replies for in-flight probes"""
+        return []
+    
+    def _match_reply(self, sock, data: bytes, responder_ip: str,
+                     recv_time: float) -> Optional[tuple[Hashable, ProbeResult]]:
+        """
+        Match a received packet to a pending probe.
+        
+        ``data`` may be a memoryview into a reused receive buffer; it must
+        not be kept past the call.
+        """
+        return None
+    
+    def _shutdown_inflight(self):
+        """Drop in-flight state and stop the fallback thread pool"""
+        self._detach_reader()
+        self._pending.clear()
+        self._completed.clear()
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._batch_io.clear()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
     def __enter__(self):
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self._shutdown_inflight()
         self.close()
         return False
@@ -0,0 +1,435 @@
+"""
+Batched raw-socket I/O with sendmmsg/recvmmsg
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import struct
+import sys
+import time
+from typing import Optional, Sequence
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ('sin_family', ctypes.c_ushort),
+        ('sin_port', ctypes.c_uint16),      # network byte order
+        ('sin_addr', ctypes.c_uint8 * 4),
+        ('sin_zero', ctypes.c_uint8 * 8),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_IOVec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', _MsgHdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+
+def _load_libc():
+    """libc with sendmmsg/recvmmsg bound, or None where they are unavailable"""
+    if not sys.platform.startswith('linux'):
+        return None
+    
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        sendmmsg = libc.sendmmsg
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint,
+                         ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return libc
+
+
+_libc = _load_libc()
+MMSG_AVAILABLE = _libc is not None
+
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+# Kernel receive timestamps (Linux); Python does not export the constant
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+_TIMESPEC = struct.Struct('@ll')
+_CMSG_HDR = struct.Struct('@Nii')  # cmsg_len, cmsg_level, cmsg_type
+_CMSG_SPACE = socket.CMSG_SPACE(_TIMESPEC.size) if hasattr(socket, 'CMSG_SPACE') else 0
+_CMSG_DATA = socket.CMSG_LEN(0) if hasattr(socket, 'CMSG_LEN') else 0
+
+# Stamps older than this are assumed to come from a stepped clock
+MAX_STAMP_AGE = 60.0
+
+
+def enable_rx_timestamps(sock: socket.socket) -> bool:
+    """
+    Ask the kernel to stamp every packet received on ``sock``.
+    
+    Returns:
+        True if the socket now delivers SO_TIMESTAMPNS stamps
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        return True
+    except OSError:
+        return False
+
+
+_TTL = struct.Struct('@i')
+_TTL_CMSG_SPACE = socket.CMSG_SPACE(_TTL.size) if hasattr(socket, 'CMSG_SPACE') else 0
+_ttl_cmsg_supported = hasattr(socket.socket, 'sendmsg')
+
+
+def send_with_ttl(sock: socket.socket, data: bytes, address: tuple, ttl: int):
+    """
+    Send one datagram with its own TTL.
+    
+    The TTL travels as an ``IP_TTL`` control message, so probes for
+    different TTLs can share one socket without a ``setsockopt`` per
+    packet. Where the kernel (or platform) rejects that, falls back to
+    setting the socket TTL before ``sendto``.
+    
+    Raises:
+        OSError: If the datagram could not be sent
+    """
+    global _ttl_cmsg_supported
+    
+    if _ttl_cmsg_supported:
+        try:
+            sock.sendmsg([data], [(socket.IPPROTO_IP, socket.IP_TTL, _TTL.pack(ttl))], 0, address)
+            return
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+            _ttl_cmsg_supported = False
+    
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+    sock.sendto(data, address)
+
+
+def stamp_to_perf(stamp_ns: Optional[int], now_ns: Optional[int] = None,
+                  now_perf: Optional[float] = None) -> float:
+    """
+    Convert a kernel (CLOCK_REALTIME) receive stamp to ``perf_counter`` time.
+    
+    Send times are taken with ``perf_counter``, so the stamp is moved into
+    that clock by its age. Without a usable stamp, returns the current
+    ``perf_counter`` reading.
+    """
+    if now_perf is None:
+        now_perf = time.perf_counter()
+    if stamp_ns is None:
+        return now_perf
+    if now_ns is None:
+        now_ns = time.time_ns()
+    
+    age = (now_ns - stamp_ns) / 1e9
+    if not 0 <= age <= MAX_STAMP_AGE:
+        return now_perf
+    return now_perf - age
+
+
+def _stamp_from_ancdata(ancdata: list) -> Optional[int]:
+    """Kernel receive stamp in ns from ``recvmsg`` ancillary data, if present"""
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= _TIMESPEC.size:
+            sec, nsec = _TIMESPEC.unpack_from(data)
+            return sec * 1_000_000_000 + nsec
+    return None
+
+
+def recv_timestamped(sock: socket.socket, bufsize: int = 1024) -> tuple[bytes, tuple, float]:
+    """
+    ``recvfrom`` that also reports when the kernel received the packet.
+    
+    Returns:
+        (data, address, receive time in ``perf_counter`` seconds); the time
+        falls back to the moment of the call if the socket has no stamps
+    """
+    if _CMSG_SPACE and hasattr(sock, 'recvmsg'):
+        data, ancdata, _, addr = sock.recvmsg(bufsize, _CMSG_SPACE)
+        return data, addr, stamp_to_perf(_stamp_from_ancdata(ancdata))
+    
+    data, addr = sock.recvfrom(bufsize)
+    return data, addr, time.perf_counter()
+
+
+class BatchIO:
+    """
+    Send and receive many packets per syscall on one socket.
+    
+    On Linux, ``send_many()`` hands a whole batch to ``sendmmsg`` (with
+    an ``IP_TTL`` control message per packet when the kernel builds the
+    IP header) and ``recv_many()`` drains the queue with one ``recvmmsg``
+    into a preallocated ring of buffers. Received packets are returned as
+    ``memoryview`` slices of that ring, so parsing copies nothing; a view
+    is only valid until the next ``recv_many()`` call. Each packet comes
+    with its kernel receive time when the socket has timestamps enabled
+    (see ``enable_rx_timestamps()``).
+    
+    Elsewhere (or if libc lacks the calls) the same interface falls back
+    to one ``sendto`` / ``recvfrom_into`` per packet, still reading into
+    the ring.
+    """
+    
+    DEFAULT_BATCH = 64
+    BUFFER_SIZE = 1024
+    
+    def __init__(self, sock: socket.socket, batch: int = DEFAULT_BATCH,
+                 buffer_size: int = BUFFER_SIZE):
+        self.sock = sock
+        self.batch = batch
+        self.buffer_size = buffer_size
+        
+        self._ring = bytearray(batch * buffer_size)
+        self._view = memoryview(self._ring)
+        
+        # perf_counter() time each packet of the last send_many() went out
+        self.send_times: list[float] = []
+        
+        self._use_mmsg = MMSG_AVAILABLE
+        if self._use_mmsg:
+            self._init_mmsg()
+    
+    def _init_mmsg(self):
+        """Preallocate the message headers for both directions"""
+        n = self.batch
+        self._ring_c = (ctypes.c_char * len(self._ring)).from_buffer(self._ring)
+        ring_addr = ctypes.addressof(self._ring_c)
+        
+        self._recv_iov = (_IOVec * n)()
+        self._recv_addrs = (_SockAddrIn * n)()
+        self._recv_msgs = (_MMsgHdr * n)()
+        self._recv_control = (ctypes.c_char * (n * _CMSG_SPACE))()
+        control_addr = ctypes.addressof(self._recv_control)
+        for i in range(n):
+            self._recv_iov[i].iov_base = ring_addr + i * self.buffer_size
+            self._recv_iov[i].iov_len = self.buffer_size
+            hdr = self._recv_msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._recv_addrs[i])
+            hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            hdr.msg_iov = ctypes.pointer(self._recv_iov[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_control = control_addr + i * _CMSG_SPACE
+            hdr.msg_controllen = _CMSG_SPACE
+        
+        self._send_iov = (_IOVec * n)()
+        self._send_addrs = (_SockAddrIn * n)()
+        self._send_msgs = (_MMsgHdr * n)()
+        self._send_control = (ctypes.c_char * (n * _TTL_CMSG_SPACE))()
+        for i in range(n):
+            self._send_addrs[i].sin_family = socket.AF_INET
+            hdr = self._send_msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._send_addrs[i])
+            hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            hdr.msg_iov = ctypes.pointer(self._send_iov[i])
+            hdr.msg_iovlen = 1
+    
+    def send_many(self, packets: Sequence[tuple[bytes, str]], port: int = 0,
+                  ttls: Optional[Sequence[int]] = None) -> int:
+        """
+        Send ``(packet, destination IP)`` pairs, in order.
+        
+        A packet the kernel refuses (e.g. no route) is skipped; the rest
+        of the batch is still sent. ``send_times`` then holds, per packet,
+        the time of the syscall that carried it.
+        
+        Args:
+            packets: (packet, destination IP) pairs
+            port: Destination port for every packet
+            ttls: IP TTL for each packet, for sockets where the kernel
+                builds the IP header (None = leave the socket's TTL)
+        
+        Returns:
+            Number of packets sent
+        """
+        self.send_times = [time.perf_counter()] * len(packets)
+        if not self._use_mmsg or (ttls is not None and not _ttl_cmsg_supported):
+            return self._send_fallback(packets, port, ttls)
+        
+        sent = 0
+        for start in range(0, len(packets), self.batch):
+            chunk = packets[start:start + self.batch]
+            chunk_ttls = ttls[start:start + self.batch] if ttls is not None else None
+            sent += self._sendmmsg(chunk, port, chunk_ttls, start)
+        return sent
+    
+    def _sendmmsg(self, chunk: Sequence[tuple[bytes, str]], port: int,
+                  ttls: Optional[Sequence[int]] = None, start: int = 0) -> int:
+        global _ttl_cmsg_supported
+        
+        n = len(chunk)
+        net_port = socket.htons(port)
+        control_addr = ctypes.addressof(self._send_control)
+        
+        # Hold the packet buffers until the call returns
+        buffers = []
+        for i, (packet, dest_ip) in enumerate(chunk):
+            buf = ctypes.c_char_p(packet)
+            buffers.append(buf)
+            self._send_iov[i].iov_base = ctypes.cast(buf, ctypes.c_void_p)
+            self._send_iov[i].iov_len = len(packet)
+            addr = self._send_addrs[i]
+            addr.sin_port = net_port
+            ctypes.memmove(addr.sin_addr, socket.inet_aton(dest_ip), 4)
+            
+            hdr = self._send_msgs[i].msg_hdr
+            if ttls is None:
+                hdr.msg_control = None
+                hdr.msg_controllen = 0
+            else:
+                offset = i * _TTL_CMSG_SPACE
+                _CMSG_HDR.pack_into(self._send_control, offset, socket.CMSG_LEN(_TTL.size),
+                                    socket.IPPROTO_IP, socket.IP_TTL)
+                _TTL.pack_into(self._send_control, offset + _CMSG_DATA, ttls[i])
+                hdr.msg_control = control_addr + offset
+                hdr.msg_controllen = _TTL_CMSG_SPACE
+        
+        sent = 0
+        fd = self.sock.fileno()
+        msg_size = ctypes.sizeof(_MMsgHdr)
+        
+        offset = 0
+        while offset < n:
+            self.send_times[start + offset:start + n] = [time.perf_counter()] * (n - offset)
+            count = _libc.sendmmsg(
+                fd, ctypes.byref(self._send_msgs, offset * msg_size), n - offset, 0
+            )
+            if count < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                if err == errno.EPERM:
+                    raise PermissionError(err, "Root privileges required. Please run with sudo.")
+                if err == errno.EINVAL and ttls is not None:
+                    # No per-packet TTLs here; send the rest one by one
+                    _ttl_cmsg_supported = False
+                    rest = chunk[offset:]
+                    return sent + self._send_fallback(rest, port, ttls[offset:],
+                                                      start + offset)
+                # The message at ``offset`` failed; skip it and carry on
+                offset += 1
+                continue
+            sent += count
+            offset += count
+        
+        return sent
+    
+    def _send_fallback(self, packets: Sequence[tuple[bytes, str]], port: int,
+                       ttls: Optional[Sequence[int]] = None, start: int = 0) -> int:
+        sent = 0
+        for i, (packet, dest_ip) in enumerate(packets):
+            self.send_times[start + i] = time.perf_counter()
+            try:
+                if ttls is None:
+                    self.sock.sendto(packet, (dest_ip, port))
+                else:
+                    send_with_ttl(self.sock, packet, (dest_ip, port), ttls[i])
+                sent += 1
+            except PermissionError:
+                raise
+            except OSError:
+                pass
+        return sent
+    
+    def recv_many(self) -> list[tuple[memoryview, str, float]]:
+        """
+        Read the packets already queued on the socket, without waiting.
+        
+        Returns:
+            Up to ``batch`` (packet view, responder IP, receive time) tuples;
+            receive times are in ``perf_counter`` seconds
+        """
+        if not self._use_mmsg:
+            return self._recv_fallback()
+        
+        while True:
+            count = _libc.recvmmsg(
+                self.sock.fileno(), ctypes.byref(self._recv_msgs), self.batch, _MSG_DONTWAIT, None
+            )
+            if count >= 0:
+                break
+            if ctypes.get_errno() != errno.EINTR:
+                return []
+        
+        now_ns = time.time_ns()
+        now_perf = time.perf_counter()
+        
+        packets = []
+        size = self.buffer_size
+        for i in range(count):
+            msg = self._recv_msgs[i]
+            start = i * size
+            responder_ip = socket.inet_ntoa(bytes(self._recv_addrs[i].sin_addr))
+            recv_time = stamp_to_perf(self._control_stamp(i, msg), now_ns, now_perf)
+            packets.append((self._view[start:start + msg.msg_len], responder_ip, recv_time))
+            # recvmmsg shrinks the name and control lengths to what it wrote
+            msg.msg_hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            msg.msg_hdr.msg_controllen = _CMSG_SPACE
+        
+        return packets
+    
+    def _control_stamp(self, i: int, msg: _MMsgHdr) -> Optional[int]:
+        """Kernel receive stamp in ns from message ``i``'s control buffer"""
+        if msg.msg_hdr.msg_controllen < _CMSG_DATA + _TIMESPEC.size:
+            return None
+        
+        offset = i * _CMSG_SPACE
+        _, level, kind = _CMSG_HDR.unpack_from(self._recv_control, offset)
+        if level != socket.SOL_SOCKET or kind != SO_TIMESTAMPNS:
+            return None
+        
+        sec, nsec = _TIMESPEC.unpack_from(self._recv_control, offset + _CMSG_DATA)
+        return sec * 1_000_000_000 + nsec
+    
+    def _recv_fallback(self) -> list[tuple[memoryview, str, float]]:
+        stamped = _CMSG_SPACE and hasattr(self.sock, 'recvmsg_into')
+        packets = []
+        size = self.buffer_size
+        for i in range(self.batch):
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            if not readable:
+                break
+            
+            start = i * size
+            buffer = self._view[start:start + size]
+            try:
+                if stamped:
+                    length, ancdata, _, addr = self.sock.recvmsg_into([buffer], _CMSG_SPACE)
+                    recv_time = stamp_to_perf(_stamp_from_ancdata(ancdata))
+                else:
+                    length, addr = self.sock.recvfrom_into(buffer, size)
+                    recv_time = time.perf_counter()
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break
+            packets.append((self._view[start:start + length], addr[0], recv_time))
+        
+        return packets
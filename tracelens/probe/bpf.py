@@ -0,0 +1,181 @@
+"""
+Classic BPF reply filters for raw ICMP receive sockets
+"""
+
+import ctypes
+import socket
+import struct
+import sys
+from typing import Optional, Union
+
+
+SO_ATTACH_FILTER = getattr(socket, 'SO_ATTACH_FILTER', 26)
+
+# Instruction classes, sizes, modes and operations (linux/filter.h)
+BPF_LD, BPF_LDX, BPF_ALU, BPF_JMP, BPF_RET, BPF_MISC = 0x00, 0x01, 0x04, 0x05, 0x06, 0x07
+BPF_H, BPF_B = 0x08, 0x10
+BPF_IND, BPF_MSH = 0x40, 0xA0
+BPF_ADD, BPF_AND, BPF_LSH = 0x00, 0x50, 0x60
+BPF_JEQ, BPF_JGE, BPF_JSET = 0x10, 0x30, 0x40
+BPF_K, BPF_X = 0x00, 0x08
+BPF_TAX = 0x00
+
+ACCEPT = 0x40000
+REJECT = 0
+
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACHABLE = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_TIME_EXCEEDED = 11
+
+TCP_SYN, TCP_RST, TCP_ACK = 0x02, 0x04, 0x10
+
+_INSN = struct.Struct('@HBBI')
+
+# An instruction is (code, k), or (code, k, jump-if-true, jump-if-false)
+# for conditional jumps; jump targets are label names
+Insn = Union[tuple[int, int], tuple[int, int, str, str]]
+
+
+def assemble(program: list[Union[Insn, str]]) -> list[tuple[int, int, int, int]]:
+    """
+    Resolve labels in ``program`` into a list of (code, jt, jf, k).
+    
+    Strings in ``program`` are labels for the instruction that follows.
+    """
+    labels: dict[str, int] = {}
+    insns: list[Insn] = []
+    for item in program:
+        if isinstance(item, str):
+            labels[item] = len(insns)
+        else:
+            insns.append(item)
+    
+    out = []
+    for pc, insn in enumerate(insns):
+        if len(insn) == 4:
+            code, k, jt, jf = insn
+            out.append((code, labels[jt] - pc - 1, labels[jf] - pc - 1, k))
+        else:
+            code, k = insn
+            out.append((code, 0, 0, k))
+    return out
+
+
+def _quoted_header(protocol: int) -> list[Union[Insn, str]]:
+    """
+    Accept only Time Exceeded / Unreachable quoting a ``protocol`` packet.
+    
+    Leaves X pointing so that the quoted transport header starts at X + 8.
+    Expects X = outer IP header length and A = ICMP type on entry.
+    """
+    return [
+        (BPF_JMP | BPF_JEQ | BPF_K, ICMP_TIME_EXCEEDED, 'quoted', 'unreach'),
+        'unreach',
+        (BPF_JMP | BPF_JEQ | BPF_K, ICMP_DEST_UNREACHABLE, 'quoted', 'reject'),
+        'quoted',
+        (BPF_LD | BPF_B | BPF_IND, 8 + 9),          # quoted IP protocol
+        (BPF_JMP | BPF_JEQ | BPF_K, protocol, 'inner', 'reject'),
+        'inner',
+        (BPF_LD | BPF_B | BPF_IND, 8),              # quoted IP version/IHL
+        (BPF_ALU | BPF_AND | BPF_K, 0x0F),
+        (BPF_ALU | BPF_LSH | BPF_K, 2),
+        (BPF_ALU | BPF_ADD | BPF_X, 0),
+        (BPF_MISC | BPF_TAX, 0),
+    ]
+
+
+def _prologue() -> list[Union[Insn, str]]:
+    """X = IP header length, A = ICMP type"""
+    return [
+        (BPF_LDX | BPF_B | BPF_MSH, 0),
+        (BPF_LD | BPF_B | BPF_IND, 0),
+    ]
+
+
+def _epilogue() -> list[Union[Insn, str]]:
+    return ['accept', (BPF_RET | BPF_K, ACCEPT), 'reject', (BPF_RET | BPF_K, REJECT)]
+
+
+def echo_filter(identifier: int) -> list[tuple[int, int, int, int]]:
+    """
+    Pass Echo Replies and quoted Echo Requests carrying ``identifier``.
+    """
+    return assemble(_prologue() + [
+        (BPF_JMP | BPF_JEQ | BPF_K, ICMP_ECHO_REPLY, 'echo', 'error'),
+        'echo',
+        (BPF_LD | BPF_H | BPF_IND, 4),
+        (BPF_JMP | BPF_JEQ | BPF_K, identifier, 'accept', 'reject'),
+        'error',
+    ] + _quoted_header(socket.IPPROTO_ICMP) + [
+        (BPF_LD | BPF_B | BPF_IND, 8),              # quoted ICMP type
+        (BPF_JMP | BPF_JEQ | BPF_K, ICMP_ECHO_REQUEST, 'ident', 'reject'),
+        'ident',
+        (BPF_LD | BPF_H | BPF_IND, 8 + 4),          # quoted identifier
+        (BPF_JMP | BPF_JEQ | BPF_K, identifier, 'accept', 'reject'),
+    ] + _epilogue())
+
+
+def port_filter(protocol: int, first_port: int,
+                last_port: Optional[int] = None) -> list[tuple[int, int, int, int]]:
+    """
+    Pass ICMP errors quoting a ``protocol`` (TCP/UDP) packet sent to a
+    destination port in ``first_port..last_port``.
+    """
+    if last_port is None:
+        last_port = first_port
+    
+    return assemble(_prologue() + _quoted_header(protocol) + [
+        (BPF_LD | BPF_H | BPF_IND, 8 + 2),          # quoted destination port
+        (BPF_JMP | BPF_JGE | BPF_K, first_port, 'low', 'reject'),
+        'low',
+        (BPF_JMP | BPF_JGE | BPF_K, last_port + 1, 'reject', 'accept'),
+    ] + _epilogue())
+
+
+def tcp_reply_filter(remote_port: int, first_port: int,
+                     last_port: int) -> list[tuple[int, int, int, int]]:
+    """
+    For a raw TCP socket: pass SYN-ACK and RST segments from
+    ``remote_port`` to a local port in ``first_port..last_port``.
+    """
+    return assemble([
+        (BPF_LDX | BPF_B | BPF_MSH, 0),
+        (BPF_LD | BPF_H | BPF_IND, 0),              # source port
+        (BPF_JMP | BPF_JEQ | BPF_K, remote_port, 'dport', 'reject'),
+        'dport',
+        (BPF_LD | BPF_H | BPF_IND, 2),              # destination port
+        (BPF_JMP | BPF_JGE | BPF_K, first_port, 'low', 'reject'),
+        'low',
+        (BPF_JMP | BPF_JGE | BPF_K, last_port + 1, 'reject', 'flags'),
+        'flags',
+        (BPF_LD | BPF_B | BPF_IND, 13),
+        (BPF_JMP | BPF_JSET | BPF_K, TCP_RST, 'accept', 'synack'),
+        'synack',
+        (BPF_ALU | BPF_AND | BPF_K, TCP_SYN | TCP_ACK),
+        (BPF_JMP | BPF_JEQ | BPF_K, TCP_SYN | TCP_ACK, 'accept', 'reject'),
+    ] + _epilogue())
+
+
+def attach_filter(sock: socket.socket, program: list[tuple[int, int, int, int]]) -> bool:
+    """
+    Attach a classic BPF program to ``sock`` (Linux only).
+    
+    The filter only saves work: replies are still verified in Python, so
+    failing to attach it is harmless.
+    
+    Returns:
+        True if the kernel accepted the filter
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    
+    code = b''.join(_INSN.pack(*insn) for insn in program)
+    buffer = ctypes.create_string_buffer(code, len(code))
+    fprog = struct.pack('@HP', len(program), ctypes.addressof(buffer))
+    
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+        return True
+    except OSError:
+        return False
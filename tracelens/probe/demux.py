@@ -0,0 +1,214 @@
+"""
+Reply demultiplexer for a shared raw ICMP socket
+"""
+
+import select
+import socket
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Hashable, Iterable, Optional
+from .batchio import BatchIO
+
+
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACHABLE = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_TIME_EXCEEDED = 11
+
+
+@dataclass
+class ICMPReply:
+    """An ICMP message attributed to one of our Echo Requests"""
+    identifier: int
+    sequence: int
+    icmp_type: int
+    icmp_code: int
+    responder_ip: str
+    recv_time: float
+    reply_ttl: Optional[int] = None
+    
+    @property
+    def key(self) -> tuple[int, int]:
+        return self.identifier, self.sequence
+
+
+def parse_icmp_reply(data: bytes, responder_ip: str,
+                     recv_time: float) -> Optional[ICMPReply]:
+    """
+    Parse a raw IPv4 + ICMP packet into an ICMPReply.
+    
+    Echo Replies carry the identifier and sequence directly; Time Exceeded
+    and Destination Unreachable carry them in the quoted Echo Request.
+    
+    Returns:
+        ICMPReply, or None if the packet does not answer an Echo Request
+    """
+    if len(data) < 20:
+        return None
+    
+    ip_header_len = (data[0] & 0x0F) * 4
+    icmp_data = data[ip_header_len:]
+    
+    if len(icmp_data) < 8:
+        return None
+    
+    icmp_type = icmp_data[0]
+    icmp_code = icmp_data[1]
+    
+    if icmp_type == ICMP_ECHO_REPLY:
+        ident, seq = struct.unpack('!HH', icmp_data[4:8])
+    
+    elif icmp_type in (ICMP_TIME_EXCEEDED, ICMP_DEST_UNREACHABLE):
+        if len(icmp_data) < 36:
+            return None
+        
+        inner_ip_start = 8
+        inner_ip_header_len = (icmp_data[inner_ip_start] & 0x0F) * 4
+        inner_icmp_start = inner_ip_start + inner_ip_header_len
+        
+        if len(icmp_data) < inner_icmp_start + 8:
+            return None
+        
+        if icmp_data[inner_icmp_start] != ICMP_ECHO_REQUEST:
+            return None
+        
+        ident, seq = struct.unpack(
+            '!HH', icmp_data[inner_icmp_start + 4:inner_icmp_start + 8]
+        )
+    
+    else:
+        return None
+    
+    return ICMPReply(
+        identifier=ident,
+        sequence=seq,
+        icmp_type=icmp_type,
+        icmp_code=icmp_code,
+        responder_ip=responder_ip,
+        recv_time=recv_time,
+        reply_ttl=data[8]
+    )
+
+
+class ICMPDemux:
+    """
+    Route replies arriving on one raw ICMP socket to the probes awaiting them.
+    
+    Probes register the (identifier, sequence) key they sent with
+    ``expect()``. Whichever caller is reading the socket files every reply
+    for an expected key into a mailbox, so replies that arrive while a
+    different probe is waiting are kept rather than dropped. Only one
+    thread reads the socket at a time; the others sleep until it has
+    dispatched what it read.
+    """
+    
+    MAX_READS = 256
+    
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._batch = BatchIO(sock)
+        self._cond = threading.Condition()
+        self._expected: set[Hashable] = set()
+        self._mailbox: dict[Hashable, ICMPReply] = {}
+        self._reading = False
+    
+    def expect(self, key: Hashable):
+        """Start collecting replies for a key"""
+        with self._cond:
+            self._expected.add(key)
+    
+    def expecting(self, key: Hashable) -> bool:
+        """Whether replies for a key are still being collected"""
+        return key in self._expected
+    
+    def forget(self, key: Hashable):
+        """Stop collecting replies for a key and drop any unread reply"""
+        with self._cond:
+            self._expected.discard(key)
+            self._mailbox.pop(key, None)
+    
+    def dispatch(self, data: bytes, responder_ip: str, recv_time: float) -> bool:
+        """
+        File one received packet under its key.
+        
+        ``data`` may be a view into a reused receive buffer; only the
+        parsed reply is kept.
+        
+        Returns:
+            True if the packet answered an expected probe
+        """
+        reply = parse_icmp_reply(data, responder_ip, recv_time)
+        if reply is None:
+            return False
+        
+        with self._cond:
+            if reply.key not in self._expected:
+                return False
+            self._expected.discard(reply.key)
+            self._mailbox[reply.key] = reply
+            self._cond.notify_all()
+        return True
+    
+    def pump(self, timeout: float):
+        """
+        Read and dispatch packets for up to ``timeout`` seconds.
+        
+        Returns after the first batch of packets has been dispatched. If
+        another thread is already reading, waits for it instead.
+        """
+        with self._cond:
+            if self._reading:
+                self._cond.wait(timeout)
+                return
+            self._reading = True
+        
+        try:
+            wait_time = max(0.0, timeout)
+            for _ in range(self.MAX_READS):
+                readable, _, _ = select.select([self.sock], [], [], wait_time)
+                if not readable:
+                    break
+                
+                for data, responder_ip, recv_time in self._batch.recv_many():
+                    self.dispatch(data, responder_ip, recv_time)
+                
+                # Keep draining only what is already queued
+                wait_time = 0.0
+        finally:
+            with self._cond:
+                self._reading = False
+                self._cond.notify_all()
+    
+    def wait(self, key: Hashable, timeout: float) -> Optional[ICMPReply]:
+        """
+        Block until the reply for ``key`` arrives or ``timeout`` expires.
+        
+        Returns:
+            ICMPReply, or None on timeout
+        """
+        deadline = time.perf_counter() + timeout
+        
+        while True:
+            with self._cond:
+                reply = self._mailbox.pop(key, None)
+                if reply is not None:
+                    return reply
+            
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                self.forget(key)
+                return None
+            
+            self.pump(remaining)
+    
+    def collect(self, keys: Iterable[Hashable]) -> list[ICMPReply]:
+        """Take the replies that have arrived for any of ``keys``"""
+        with self._cond:
+            replies = []
+            for key in keys:
+                reply = self._mailbox.pop(key, None)
+                if reply is not None:
+                    replies.append(reply)
+            return replies
@@ -0,0 +1,304 @@
+"""
+Unprivileged probing via IP_RECVERR error-queue sockets (Linux)
+"""
+
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Hashable, Optional
+from ..models import ProbeResult
+from .base import BaseProbe
+from .batchio import SO_TIMESTAMPNS, enable_rx_timestamps, send_with_ttl, stamp_to_perf
+
+
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)
+IP_RECVTTL = getattr(socket, 'IP_RECVTTL', 12)
+MSG_ERRQUEUE = getattr(socket, 'MSG_ERRQUEUE', 0x2000)
+SO_EE_ORIGIN_ICMP = 2
+
+# struct sock_extended_err, followed by the offender's sockaddr_in
+_EXTENDED_ERR = struct.Struct('=IBBBBII')
+_OFFENDER = struct.Struct('=HH4s')
+
+_TIMESPEC = struct.Struct('@ll')
+_TTL = struct.Struct('@i')
+_ANCBUFSIZE = (
+    socket.CMSG_SPACE(_EXTENDED_ERR.size + 16) + socket.CMSG_SPACE(_TIMESPEC.size)
+    + socket.CMSG_SPACE(_TTL.size)
+    if hasattr(socket, 'CMSG_SPACE') else 0
+)
+
+
+@dataclass
+class QueuedError:
+    """An ICMP error the kernel queued for one of our packets"""
+    icmp_type: int
+    icmp_code: int
+    offender_ip: Optional[str]
+
+
+def parse_ancillary(ancdata: list
+                    ) -> tuple[Optional[QueuedError], Optional[int], Optional[int]]:
+    """
+    Pull the queued ICMP error, kernel receive stamp and IP TTL of the
+    reply out of ``recvmsg`` ancillary data.
+    
+    Returns:
+        (QueuedError or None, receive stamp in ns or None, TTL or None)
+    """
+    error = None
+    stamp = None
+    reply_ttl = None
+    for level, kind, data in ancdata:
+        if level == socket.IPPROTO_IP and kind == IP_RECVERR and len(data) >= _EXTENDED_ERR.size:
+            _, origin, icmp_type, icmp_code, _, _, _ = _EXTENDED_ERR.unpack_from(data)
+            if origin != SO_EE_ORIGIN_ICMP:
+                continue
+            
+            offender_ip = None
+            if len(data) >= _EXTENDED_ERR.size + _OFFENDER.size:
+                family, _, addr = _OFFENDER.unpack_from(data, _EXTENDED_ERR.size)
+                if family == socket.AF_INET:
+                    offender_ip = socket.inet_ntoa(addr)
+            error = QueuedError(icmp_type, icmp_code, offender_ip)
+        
+        elif level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= _TIMESPEC.size:
+            sec, nsec = _TIMESPEC.unpack_from(data)
+            stamp = sec * 1_000_000_000 + nsec
+        
+        elif level == socket.IPPROTO_IP and kind == socket.IP_TTL and len(data) >= _TTL.size:
+            reply_ttl = _TTL.unpack_from(data)[0]
+    
+    return error, stamp, reply_ttl
+
+
+class ErrQueueProbe(BaseProbe):
+    """
+    Base for unprivileged engines that read ICMP errors from ``MSG_ERRQUEUE``.
+    
+    The socket is an ordinary datagram socket with ``IP_RECVERR`` set, so
+    no CAP_NET_RAW is needed. The kernel matches every Time Exceeded or
+    Unreachable to the socket whose packet it quotes, then queues it with
+    the offending router's address. Each engine only ever sees replies to
+    its own probes.
+    
+    With ``IP_RECVTTL`` the kernel also reports the TTL left on each
+    reply, on both queues (for a queued error, that of the ICMP message
+    itself), and it is passed on as ``reply_ttl``.
+    
+    Subclasses open ``self._sock`` and implement ``send()``,
+    ``_match_error()`` and, for replies on the normal queue,
+    ``_match_reply()``.
+    """
+    
+    ICMP_TIME_EXCEEDED = 11
+    ICMP_DEST_UNREACHABLE = 3
+    
+    BUFFER_SIZE = 1024
+    
+    def __init__(self, timeout: float = 2.0):
+        super().__init__(timeout)
+        self._sock: Optional[socket.socket] = None
+    
+    def _setup_socket(self, sock: socket.socket):
+        """Enable error-queue delivery and receive stamps on a new socket"""
+        sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+        sock.setsockopt(socket.IPPROTO_IP, IP_RECVTTL, 1)
+        sock.setblocking(False)
+        enable_rx_timestamps(sock)
+    
+    def _sendto(self, data: bytes, target_ip: str, port: int, ttl: int) -> bool:
+        """
+        Send one datagram with the given TTL (per packet, via ``sendmsg``).
+        
+        A queued ICMP error is also reported once as a failure of the next
+        socket call, so a failed send is retried once.
+        """
+        for _ in range(2):
+            try:
+                send_with_ttl(self._sock, data, (target_ip, port), ttl)
+                return True
+            except (BlockingIOError, InterruptedError):
+                return False
+            except OSError:
+                continue
+        return False
+    
+    def probe(self, target_ip: str, ttl: int,
+              timeout: Optional[float] = None) -> ProbeResult:
+        """Send a probe with given TTL and wait for its result"""
+        return self._wait(self.send(target_ip, ttl, timeout), timeout)
+    
+    def _receive_sockets(self) -> list:
+        return [self._sock] if self._sock else []
+    
+    def _read_ready(self) -> list[tuple[Hashable, ProbeResult]]:
+        """Drain the error queue, then the normal receive queue"""
+        results = []
+        for flags in (MSG_ERRQUEUE, 0):
+            for _ in range(self.MAX_READS_PER_POLL):
+                try:
+                    data, ancdata, _, addr = self._sock.recvmsg(
+                        self.BUFFER_SIZE, _ANCBUFSIZE, flags
+                    )
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    # A pending error reported on the normal queue; it is
+                    # also on the error queue, which has been read already
+                    continue
+                
+                error, stamp, reply_ttl = parse_ancillary(ancdata)
+                recv_time = stamp_to_perf(stamp)
+                
+                if flags == MSG_ERRQUEUE:
+                    match = self._match_error(data, addr, error, recv_time) if error else None
+                else:
+                    match = self._match_reply(self._sock, data, addr[0], recv_time)
+                
+                if match is not None:
+                    match[1].reply_ttl = reply_ttl
+                    results.append(match)
+        
+        return results
+    
+    def _match_error(self, data: bytes, addr: tuple, error: QueuedError,
+                     recv_time: float) -> Optional[tuple[Hashable, ProbeResult]]:
+        """
+        Match a queued ICMP error to a pending probe.
+        
+        Args:
+            data: The payload of the probe that triggered the error
+            addr: The probe's original destination address
+            error: ICMP type, code and the router that sent it
+            recv_time: When the error arrived (``perf_counter`` seconds)
+        """
+        return None
+    
+    def close(self):
+        """Close the socket"""
+        if self._sock:
+            try:
+                self._sock.close()
+            except:
+                pass
+            self._sock = None
+
+
+class DgramICMPProbe(ErrQueueProbe):
+    """
+    Unprivileged ICMP Echo probe over a Linux ping socket.
+    
+    ``SOCK_DGRAM``/``IPPROTO_ICMP`` sockets are open to the groups in
+    ``net.ipv4.ping_group_range``. The kernel sets the Echo identifier
+    to the socket's own ID and fills in the checksum; probes are keyed
+    by sequence number. Echo Replies arrive on the normal queue, Time
+    Exceeded and Unreachable on the error queue.
+    """
+    
+    ICMP_ECHO_REQUEST = 8
+    ICMP_ECHO_REPLY = 0
+    
+    MAX_INFLIGHT = 1 << 16  # One in-flight probe per sequence number
+    
+    def __init__(self, timeout: float = 2.0):
+        super().__init__(timeout)
+        self.sequence = 0
+        try:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        except PermissionError:
+            raise PermissionError(
+                "Unprivileged ICMP sockets are disabled. "
+                "Allow your group in net.ipv4.ping_group_range, or run with sudo."
+            )
+        self._setup_socket(self._sock)
+    
+    def send(self, target_ip: str, ttl: int, timeout: Optional[float] = None) -> int:
+        """Send ICMP Echo Request without waiting; keyed by sequence number"""
+        self.pace(target_ip)
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        seq = self.sequence
+        packet = struct.pack('!BBHHHd', self.ICMP_ECHO_REQUEST, 0, 0, 0, seq, time.time())
+        
+        send_time = time.perf_counter()
+        self._track(seq, target_ip, ttl, send_time, timeout)
+        # Unsent probes stay pending; poll() reports them as timeouts
+        self._sendto(packet, target_ip, 0, ttl)
+        return seq
+    
+    def _match_reply(self, sock, data: bytes, responder_ip: str, recv_time: float):
+        """Echo Reply; the kernel strips the IP header on ping sockets"""
+        if len(data) < 8 or data[0] != self.ICMP_ECHO_REPLY:
+            return None
+        
+        seq = struct.unpack('!H', data[6:8])[0]
+        return self._complete(seq, responder_ip, recv_time, reached_target=True)
+    
+    def _match_error(self, data: bytes, addr: tuple, error: QueuedError, recv_time: float):
+        """The error queue returns the Echo Request that was answered"""
+        if len(data) < 8 or error.offender_ip is None:
+            return None
+        
+        seq = struct.unpack('!H', data[6:8])[0]
+        return self._complete(
+            seq, error.offender_ip, recv_time,
+            reached_target=(error.icmp_type != self.ICMP_TIME_EXCEEDED)
+        )
+
+
+class DgramUDPProbe(ErrQueueProbe):
+    """
+    Unprivileged UDP probe (Unix-style traceroute) using ``IP_RECVERR``.
+    
+    Same destination ports as UDPProbe, and the same in-flight limit. The
+    error queue hands back the probe's original destination, so probes
+    are keyed by destination port without parsing any quoted headers.
+    """
+    
+    ICMP_PORT_UNREACHABLE = 3  # Code within DEST_UNREACHABLE
+    
+    PORT_RANGE = 30
+    MAX_INFLIGHT = PORT_RANGE  # One in-flight probe per destination port
+    
+    def __init__(self, base_port: int = 33434, timeout: float = 2.0):
+        super().__init__(timeout)
+        self.base_port = base_port
+        self.port_offset = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._setup_socket(self._sock)
+    
+    def _next_free_port(self) -> int:
+        """Next destination port that has no probe in flight"""
+        for _ in range(self.PORT_RANGE):
+            dst_port = self.base_port + self.port_offset
+            self.port_offset = (self.port_offset + 1) % self.PORT_RANGE
+            if dst_port not in self._pending:
+                return dst_port
+        
+        raise RuntimeError(
+            f"All {self.PORT_RANGE} UDP probe ports are in flight"
+        )
+    
+    def send(self, target_ip: str, ttl: int, timeout: Optional[float] = None) -> int:
+        """Send UDP probe without waiting; the probe is keyed by its destination port"""
+        self.pace(target_ip)
+        dst_port = self._next_free_port()
+        payload = struct.pack('!HHI', dst_port, ttl, int(time.time()) & 0xFFFFFFFF)
+        
+        send_time = time.perf_counter()
+        self._track(dst_port, target_ip, ttl, send_time, timeout)
+        # Unsent probes stay pending; poll() reports them as timeouts
+        self._sendto(payload, target_ip, dst_port, ttl)
+        return dst_port
+    
+    def _match_error(self, data: bytes, addr: tuple, error: QueuedError, recv_time: float):
+        """Match by the original destination the kernel reports"""
+        target_ip, dst_port = addr[0], addr[1]
+        pending = self._pending.get(dst_port)
+        if pending is None or pending.target_ip != target_ip or error.offender_ip is None:
+            return None
+        
+        reached = (error.icmp_type == self.ICMP_DEST_UNREACHABLE and
+                   error.icmp_code == self.ICMP_PORT_UNREACHABLE)
+        return self._complete(dst_port, error.offender_ip, recv_time, reached)
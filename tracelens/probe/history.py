@@ -0,0 +1,96 @@
+"""
+Path history per destination prefix, for predicting where a trace starts
+"""
+
+import dataclasses
+import ipaddress
+from collections import OrderedDict
+from typing import Optional
+from ..models import HopResult
+
+
+# Initial TTLs used by common IP stacks
+INITIAL_TTLS = (32, 64, 128, 255)
+
+
+def distance_from_reply_ttl(reply_ttl: int) -> int:
+    """
+    Hop distance of a host, from the TTL left on its reply.
+    
+    The sender's initial TTL is assumed to be the smallest common one
+    not below ``reply_ttl``. Paths can be asymmetric, so this is an
+    estimate.
+    """
+    initial = next((ttl for ttl in INITIAL_TTLS if ttl >= reply_ttl), 255)
+    return initial - reply_ttl + 1
+
+
+class PathHistory:
+    """
+    The last complete path traced towards each destination prefix.
+    
+    A trace towards a prefix seen before starts at the TTL where the
+    destination was found last time. The near side is then probed
+    backwards until a hop answers from the same (TTL, interface) as on
+    the recorded path; the hops below it are copied from that path,
+    marked with ``from_history``.
+    """
+    
+    PREFIX_LEN = 24
+    MAX_PREFIXES = 4096
+    
+    def __init__(self, prefix_len: int = PREFIX_LEN, size: int = MAX_PREFIXES):
+        self.prefix_len = prefix_len
+        self.size = size
+        self._paths: OrderedDict[str, list[HopResult]] = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._paths)
+    
+    def prefix(self, ip: str) -> str:
+        """Prefix that ``ip`` is tracked under"""
+        network = ipaddress.ip_network(f"{ip}/{self.prefix_len}", strict=False)
+        return str(network)
+    
+    def get(self, ip: str) -> Optional[list[HopResult]]:
+        return self._paths.get(self.prefix(ip))
+    
+    def distance(self, ip: str) -> Optional[int]:
+        """Hop distance of the destination on the last path to ``ip``'s prefix"""
+        path = self.get(ip)
+        return path[-1].hop if path else None
+    
+    def known(self, ip: str, hop: HopResult) -> bool:
+        """Whether ``hop`` answered from the same interface as last time"""
+        path = self.get(ip)
+        return (
+            path is not None and hop.ip is not None and
+            hop.hop < len(path) and path[hop.hop - 1].ip == hop.ip
+        )
+    
+    def infer(self, ip: str, hop: HopResult) -> list[HopResult]:
+        """
+        Hops in front of a known interface, as inferred copies.
+        
+        Returns:
+            HopResults for TTLs 1..hop.hop-1, or [] if ``hop`` is not known
+        """
+        if not self.known(ip, hop):
+            return []
+        
+        return [
+            dataclasses.replace(known, rtts=list(known.rtts), stop_reason=None,
+                                from_history=True, probes_sent=0)
+            for known in self.get(ip)[:hop.hop - 1]
+        ]
+    
+    def add(self, ip: str, hops: list[HopResult]):
+        """Record a finished trace towards ``ip`` if it reached the destination"""
+        if not hops or not hops[-1].reached_target:
+            return
+        
+        key = self.prefix(ip)
+        self._paths[key] = hops
+        self._paths.move_to_end(key)
+        if len(self._paths) > self.size:
+            self._paths.popitem(last=False)
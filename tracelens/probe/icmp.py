@@ -9,9 +9,16 @@ import sys
 import socket
 import struct
 import time
-import os
+import threading
+from typing import Optional
 from ..models import ProbeResult
 from .base import BaseProbe
+from .batchio import enable_rx_timestamps
+from .bpf import attach_filter, echo_filter
+from .demux import ICMPDemux, ICMPReply
+from .ids import ICMP_IDENTIFIERS
+from .packets import PacketTemplate, checksum
+from .pacing import Pacer
 
 
 def create_icmp_probe(timeout: float = 2.0) -> BaseProbe:
@@ -92,13 +99,16 @@ class WindowsICMPProbe(BaseProbe):
         except Exception as e:
             raise RuntimeError(f"Failed to load Windows ICMP API: {e}")
     
-    def probe(self, target_ip: str, ttl: int) -> ProbeResult:
+    def probe(self, target_ip: str, ttl: int,
+              timeout: Optional[float] = None) -> ProbeResult:
         """Send ICMP ping with specified TTL"""
         import ctypes
         
         if not self._icmp:
             return ProbeResult()
         
+        self.pace(target_ip)
+        
         # Status codes
         IP_SUCCESS = 0
         IP_TTL_EXPIRED_TRANSIT = 11013
@@ -126,7 +136,7 @@ class WindowsICMPProbe(BaseProbe):
             reply_size = ctypes.sizeof(self._ICMP_ECHO_REPLY) + request_size + 8
             reply_buffer = ctypes.create_string_buffer(reply_size)
             
-            timeout_ms = int(self.timeout * 1000)
+            timeout_ms = int(self._timeout(timeout) * 1000)
             
             result = self._icmp_dll.IcmpSendEcho(
                 self._icmp,
@@ -154,7 +164,8 @@ class WindowsICMPProbe(BaseProbe):
                 return ProbeResult(
                     responder_ip=responder_ip,
                     rtt_ms=float(rtt),
-                    reached_target=True
+                    reached_target=True,
+                    reply_ttl=reply.Options.Ttl
                 )
             elif status == IP_TTL_EXPIRED_TRANSIT:
                 return ProbeResult(
@@ -189,6 +200,12 @@ class LinuxICMPProbe(BaseProbe):
     """
     ICMP probe using raw sockets for Linux/macOS.
     Raw sockets work correctly on Linux for receiving ICMP Time Exceeded.
+    
+    One raw socket is opened per probe engine and kept for its lifetime.
+    An ICMPDemux routes each reply to the probe waiting for its
+    (identifier, sequence), so many probes can be outstanding at once.
+    Each engine holds its own identifier from ICMP_IDENTIFIERS, so
+    engines in one process never see each other's replies.
     """
     
     ICMP_ECHO_REQUEST = 8
@@ -196,29 +213,48 @@ class LinuxICMPProbe(BaseProbe):
     ICMP_TIME_EXCEEDED = 11
     ICMP_DEST_UNREACHABLE = 3
     
+    MAX_INFLIGHT = 1 << 16  # One in-flight probe per sequence number
+    
+    # Field offsets in the Echo Request template
+    SEQUENCE_OFFSET = 6
+    PAYLOAD_OFFSET = 8
+    CHECKSUM_OFFSET = 2
+    
     def __init__(self, timeout: float = 2.0):
         super().__init__(timeout)
-        self.identifier = os.getpid() & 0xFFFF
+        self.identifier = ICMP_IDENTIFIERS.acquire(self)
         self.sequence = 0
+        self._template = self._build_template()
+        self._send_lock = threading.Lock()
+        try:
+            self._sock = self._open_socket()
+        except OSError:
+            ICMP_IDENTIFIERS.release(self.identifier, self)
+            raise
+        self._demux = ICMPDemux(self._sock)
+    
+    def _open_socket(self) -> socket.socket:
+        """Open the long-lived raw ICMP socket"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        except PermissionError:
+            raise PermissionError(
+                "Root privileges required. Please run with sudo."
+            )
+        
+        # RTTs are taken from kernel receive stamps, not from when we read
+        enable_rx_timestamps(sock)
+        if self.KERNEL_FILTER:
+            # Drop other hosts' ICMP in the kernel instead of in _parse_response
+            attach_filter(sock, echo_filter(self.identifier))
+        return sock
     
     def _checksum(self, data: bytes) -> int:
         """Calculate ICMP checksum (RFC 1071)"""
-        if len(data) % 2:
-            data += b'\x00'
-        
-        s = 0
-        for i in range(0, len(data), 2):
-            w = (data[i] << 8) + data[i + 1]
-            s += w
-        
-        s = (s >> 16) + (s & 0xFFFF)
-        s += s >> 16
-        return ~s & 0xFFFF
+        return checksum(data)
     
-    def _build_packet(self) -> bytes:
-        """Build ICMP Echo Request packet"""
-        self.sequence = (self.sequence + 1) & 0xFFFF
-        
+    def _build_template(self) -> PacketTemplate:
+        """Build and checksum the Echo Request once; sequence and payload vary"""
         header = struct.pack(
             '!BBHHH',
             self.ICMP_ECHO_REQUEST,
@@ -228,7 +264,7 @@ class LinuxICMPProbe(BaseProbe):
             self.sequence
         )
         
-        payload = struct.pack('!d', time.time())
+        payload = struct.pack('!d', 0.0)
         cs = self._checksum(header + payload)
         
         header = struct.pack(
@@ -240,133 +276,139 @@ class LinuxICMPProbe(BaseProbe):
             self.sequence
         )
         
-        return header + payload
+        return PacketTemplate(header + payload, self.CHECKSUM_OFFSET)
     
-    def probe(self, target_ip: str, ttl: int) -> ProbeResult:
-        """Send ICMP Echo Request with given TTL"""
-        sock = None
-        
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
-            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
-            sock.settimeout(self.timeout)
-            
-            packet = self._build_packet()
-            current_seq = self.sequence
-            send_time = time.perf_counter()
-            
-            sock.sendto(packet, (target_ip, 0))
-            
-            deadline = send_time + self.timeout
-            
-            while True:
-                remaining = deadline - time.perf_counter()
-                if remaining <= 0:
-                    return ProbeResult()
-                
-                sock.settimeout(remaining)
-                
-                try:
-                    data, addr = sock.recvfrom(1024)
-                    recv_time = time.perf_counter()
-                except socket.timeout:
-                    return ProbeResult()
-                
-                result = self._parse_response(
-                    data, addr[0], target_ip,
-                    send_time, recv_time, current_seq
-                )
-                if result is not None:
-                    return result
-            
-        except PermissionError:
-            raise PermissionError(
-                "Root privileges required. Please run with sudo."
+    def _build_packet(self) -> bytes:
+        """Build ICMP Echo Request packet on the next sequence not in flight"""
+        for _ in range(self.MAX_INFLIGHT):
+            self.sequence = (self.sequence + 1) & 0xFFFF
+            if not self._demux.expecting((self.identifier, self.sequence)):
+                break
+        else:
+            raise RuntimeError(
+                f"All {self.MAX_INFLIGHT} ICMP sequence numbers are in flight"
             )
-        except socket.timeout:
-            return ProbeResult()
-        except Exception:
-            return ProbeResult()
-        finally:
-            if sock:
-                try:
-                    sock.close()
-                except:
-                    pass
-    
-    def _parse_response(self, data: bytes, responder_ip: str, target_ip: str,
-                        send_time: float, recv_time: float,
-                        expected_seq: int) -> ProbeResult | None:
-        """Parse ICMP response"""
-        if len(data) < 20:
-            return None
-        
-        ip_header_len = (data[0] & 0x0F) * 4
         
-        if len(data) < ip_header_len + 8:
-            return None
-        
-        icmp_data = data[ip_header_len:]
-        icmp_type = icmp_data[0]
-        
-        rtt_ms = (recv_time - send_time) * 1000
+        self._template.set16(self.SEQUENCE_OFFSET, self.sequence)
+        self._template.set_bytes(self.PAYLOAD_OFFSET, struct.pack('!d', time.time()))
+        return self._template.packet()
+    
+    def _send_echo(self, target_ip: str, ttl: int) -> tuple[tuple[int, int], Optional[float]]:
+        """
+        Send one Echo Request.
         
-        if icmp_type == self.ICMP_ECHO_REPLY:
-            if len(icmp_data) >= 8:
-                ident = struct.unpack('!H', icmp_data[4:6])[0]
-                seq = struct.unpack('!H', icmp_data[6:8])[0]
-                if ident == self.identifier and seq == expected_seq:
-                    return ProbeResult(
-                        responder_ip=responder_ip,
-                        rtt_ms=round(rtt_ms, 2),
-                        reached_target=True
-                    )
-            return None
+        Returns:
+            (identifier, sequence) key and send time; the send time is
+            None if the packet could not be sent
+        """
+        self.pace(target_ip)
         
-        elif icmp_type == self.ICMP_TIME_EXCEEDED:
-            if self._is_our_packet(icmp_data, expected_seq):
-                return ProbeResult(
-                    responder_ip=responder_ip,
-                    rtt_ms=round(rtt_ms, 2),
-                    reached_target=False
+        # TTL is a socket option, so setting it and sending must not interleave
+        with self._send_lock:
+            packet = self._build_packet()
+            key = (self.identifier, self.sequence)
+            self._demux.expect(key)
+            
+            send_time = time.perf_counter()
+            try:
+                self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+                self._sock.sendto(packet, (target_ip, 0))
+            except PermissionError:
+                raise PermissionError(
+                    "Root privileges required. Please run with sudo."
                 )
-            return None
+            except OSError:
+                self._demux.forget(key)
+                return key, None
         
-        elif icmp_type == self.ICMP_DEST_UNREACHABLE:
-            if self._is_our_packet(icmp_data, expected_seq):
-                return ProbeResult(
-                    responder_ip=responder_ip,
-                    rtt_ms=round(rtt_ms, 2),
-                    reached_target=True
-                )
-            return None
+        return key, send_time
+    
+    def probe(self, target_ip: str, ttl: int,
+              timeout: Optional[float] = None) -> ProbeResult:
+        """Send ICMP Echo Request with given TTL"""
+        key, send_time = self._send_echo(target_ip, ttl)
+        if send_time is None:
+            return ProbeResult()
+        
+        remaining = send_time + self._timeout(timeout) - time.perf_counter()
+        reply = self._demux.wait(key, remaining)
+        if reply is None:
+            return ProbeResult()
         
-        return None
+        return self._parse_response(reply, send_time)
     
-    def _is_our_packet(self, icmp_data: bytes, expected_seq: int) -> bool:
-        """Check if embedded packet belongs to us"""
-        if len(icmp_data) < 36:
-            return False
+    def send(self, target_ip: str, ttl: int,
+             timeout: Optional[float] = None) -> tuple[int, int]:
+        """Send ICMP Echo Request without waiting; keyed by (identifier, sequence)"""
+        key, send_time = self._send_echo(target_ip, ttl)
         
-        inner_ip_start = 8
-        inner_ip_header_len = (icmp_data[inner_ip_start] & 0x0F) * 4
-        inner_icmp_start = inner_ip_start + inner_ip_header_len
+        # Unsent probes are still tracked so poll() reports them as timeouts
+        self._track(key, target_ip, ttl, send_time or time.perf_counter(), timeout)
+        return key
+    
+    def _send_batch(self, probes):
+        """Send Echo Requests in one batch, each with its TTL as a control message"""
+        sender = self._batch_for(self._sock)
+        keys, packets, ttls = [], [], []
+        with self._send_lock:
+            for target_ip, ttl, _ in probes:
+                packets.append((self._build_packet(), target_ip))
+                key = (self.identifier, self.sequence)
+                self._demux.expect(key)
+                keys.append(key)
+                ttls.append(ttl)
+            
+            sender.send_many(packets, ttls=ttls)
         
-        if len(icmp_data) < inner_icmp_start + 8:
-            return False
+        # Unsent probes are still tracked so poll() reports them as timeouts
+        for key, send_time, (target_ip, ttl, timeout) in zip(keys, sender.send_times, probes):
+            self._track(key, target_ip, ttl, send_time, timeout)
+        return keys
+    
+    def _receive_sockets(self) -> list:
+        return [self._sock] if self._sock else []
+    
+    def _read_ready(self) -> list[tuple[tuple[int, int], ProbeResult]]:
+        """Dispatch queued replies through the demultiplexer"""
+        self._demux.pump(0)
         
-        inner_icmp = icmp_data[inner_icmp_start:inner_icmp_start + 8]
-        inner_type = inner_icmp[0]
-        inner_ident = struct.unpack('!H', inner_icmp[4:6])[0]
-        inner_seq = struct.unpack('!H', inner_icmp[6:8])[0]
+        results = []
+        for reply in self._demux.collect(list(self._pending)):
+            pending = self._pending.pop(reply.key)
+            results.append((reply.key, self._parse_response(reply, pending.send_time)))
+        return results
+    
+    def cancel(self, key):
+        super().cancel(key)
+        self._demux.forget(key)
+    
+    def _expire(self, now: float):
+        expired = super()._expire(now)
+        for key, _ in expired:
+            self._demux.forget(key)
+        return expired
+    
+    def _parse_response(self, reply: ICMPReply, send_time: float) -> ProbeResult:
+        """Turn a demultiplexed reply into a ProbeResult"""
+        rtt_ms = (reply.recv_time - send_time) * 1000
         
-        return (inner_type == self.ICMP_ECHO_REQUEST and
-                inner_ident == self.identifier and
-                inner_seq == expected_seq)
+        return ProbeResult(
+            responder_ip=reply.responder_ip,
+            rtt_ms=round(rtt_ms, 2),
+            # Echo Reply or Dest Unreachable both mean we got there
+            reached_target=(reply.icmp_type != self.ICMP_TIME_EXCEEDED),
+            reply_ttl=reply.reply_ttl
+        )
     
     def close(self):
-        """No persistent resources"""
-        pass
+        """Close the raw socket and give back the identifier"""
+        if self._sock:
+            try:
+                self._sock.close()
+            except:
+                pass
+            self._sock = None
+        ICMP_IDENTIFIERS.release(self.identifier, self)
 
 
 # Alias for backward compatibility
@@ -374,14 +416,47 @@ class ICMPProbe(BaseProbe):
     """
     Cross-platform ICMP probe.
     Automatically selects the correct implementation based on OS.
+    
+    The in-flight cap, ``limit_inflight()`` and ``pacer`` are those of
+    the implementation, which does the actual work.
     """
     
     def __init__(self, timeout: float = 2.0):
-        super().__init__(timeout)
         self._impl = create_icmp_probe(timeout)
+        super().__init__(timeout)
+        self.MAX_INFLIGHT = self._impl.MAX_INFLIGHT
+    
+    @property
+    def pacer(self) -> Optional[Pacer]:
+        return self._impl.pacer
+    
+    @pacer.setter
+    def pacer(self, pacer: Optional[Pacer]):
+        self._impl.pacer = pacer
+    
+    def limit_inflight(self, limit: Optional[int]):
+        self._impl.limit_inflight(limit)
+    
+    def probe(self, target_ip: str, ttl: int,
+              timeout: Optional[float] = None) -> ProbeResult:
+        return self._impl.probe(target_ip, ttl, timeout)
+    
+    def send(self, target_ip: str, ttl: int, timeout: Optional[float] = None):
+        return self._impl.send(target_ip, ttl, timeout)
+    
+    def send_many(self, probes):
+        return self._impl.send_many(probes)
+    
+    def poll(self, timeout: float):
+        return self._impl.poll(timeout)
+    
+    def cancel(self, key):
+        self._impl.cancel(key)
     
-    def probe(self, target_ip: str, ttl: int) -> ProbeResult:
-        return self._impl.probe(target_ip, ttl)
+    async def probe_async(self, target_ip: str, ttl: int,
+                          timeout: Optional[float] = None) -> ProbeResult:
+        return await self._impl.probe_async(target_ip, ttl, timeout)
     
     def close(self):
+        self._impl._shutdown_inflight()
         self._impl.close()
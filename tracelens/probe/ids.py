@@ -0,0 +1,79 @@
+"""
+Process-wide allocation of the IDs that tell probes apart on the wire
+"""
+
+import random
+import threading
+from typing import Any, Optional
+
+
+class IDPool:
+    """
+    A range of probe IDs (ICMP identifiers, source ports, ...) shared by
+    every probe engine in the process.
+    
+    ``acquire()`` hands out an ID that no other holder has, and
+    ``owner()`` looks up who holds one. Allocation starts at a random
+    point and moves round the range, so other processes drawing from the
+    same range (or a released ID's late replies) are unlikely to clash.
+    Thread-safe.
+    """
+    
+    def __init__(self, first: int, last: int, name: str = 'probe ID'):
+        self.first = first
+        self.last = last
+        self.name = name
+        self._owners: dict[int, Any] = {}
+        self._next = random.randint(first, last)
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        """Number of IDs currently held"""
+        return len(self._owners)
+    
+    @property
+    def size(self) -> int:
+        return self.last - self.first + 1
+    
+    def acquire(self, owner: Any) -> int:
+        """
+        Take a free ID for ``owner``.
+        
+        Raises:
+            RuntimeError: If every ID in the range is held
+        """
+        with self._lock:
+            if len(self._owners) >= self.size:
+                raise RuntimeError(f"All {self.size} {self.name}s are in use")
+            
+            value = self._next
+            while value in self._owners:
+                value = value + 1 if value < self.last else self.first
+            
+            self._next = value + 1 if value < self.last else self.first
+            self._owners[value] = owner
+            return value
+    
+    def release(self, value: int, owner: Any = None):
+        """Give ``value`` back; with ``owner``, only if that owner holds it"""
+        with self._lock:
+            if owner is None or self._owners.get(value) is owner:
+                self._owners.pop(value, None)
+    
+    def release_all(self, owner: Any):
+        """Give back every ID held by ``owner``"""
+        with self._lock:
+            for value in [v for v, o in self._owners.items() if o is owner]:
+                del self._owners[value]
+    
+    def owner(self, value: int) -> Optional[Any]:
+        """Holder of ``value``, or None if it is free"""
+        return self._owners.get(value)
+
+
+# ICMP Echo identifiers: one per raw-socket ICMP engine (LinuxICMPProbe,
+# StatelessProbe), which then numbers its own probes by sequence
+ICMP_IDENTIFIERS = IDPool(1, 0xFFFF, 'ICMP identifier')
+
+# TCP source ports: one per in-flight TCPProbe SYN
+TCP_SOURCE_PORTS = IDPool(32768, 65535, 'TCP source port')
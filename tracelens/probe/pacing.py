@@ -0,0 +1,146 @@
+"""
+Probe pacing: a token-bucket rate limiter shared by probe engines
+"""
+
+import asyncio
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Token bucket of ``rate`` tokens per second holding up to ``burst``.
+    
+    Implemented as virtual scheduling (GCRA): ``reserve()`` always takes
+    a token, possibly one that only becomes available in the future, and
+    returns how long the caller must wait for it.
+    """
+    
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._interval = 1.0 / rate
+        self._tolerance = (self.burst - 1) * self._interval
+        self._tat = 0.0  # theoretical arrival time of the next token
+    
+    def reserve(self, now: float) -> float:
+        """Take one token; returns seconds to wait before using it"""
+        tat = max(self._tat, now)
+        self._tat = tat + self._interval
+        return max(0.0, tat - self._tolerance - now)
+
+
+@dataclass
+class PacerStats:
+    """How much pacing has delayed probes"""
+    probes: int = 0
+    delayed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    
+    @property
+    def mean_wait(self) -> float:
+        """Mean wait per probe, in seconds"""
+        return self.total_wait / self.probes if self.probes else 0.0
+
+
+class Pacer:
+    """
+    Process-wide probe rate limiter.
+    
+    Every probe waits for a token from a global bucket (``pps`` probes per
+    second, bursts of up to ``burst``) and, with ``prefix_pps``, from a
+    bucket for its destination prefix as well, so no single network sees
+    more than its share of the probes. Time spent waiting is recorded in
+    ``stats``.
+    
+    One pacer is usually installed for the whole process with
+    ``set_shared_pacer()``; engines use it unless given their own.
+    """
+    
+    MAX_PREFIXES = 65536
+    
+    def __init__(
+        self,
+        pps: float,
+        burst: int = 1,
+        prefix_pps: Optional[float] = None,
+        prefix_burst: Optional[int] = None,
+        prefix_len: int = 24
+    ):
+        self.pps = pps
+        self.burst = burst
+        self.prefix_pps = prefix_pps
+        self.prefix_burst = prefix_burst or burst
+        self.prefix_len = prefix_len
+        self.stats = PacerStats()
+        self._bucket = TokenBucket(pps, burst)
+        self._prefixes: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _prefix(self, target_ip: str) -> str:
+        return str(ipaddress.ip_network(f"{target_ip}/{self.prefix_len}", strict=False))
+    
+    def _prefix_bucket(self, target_ip: str) -> TokenBucket:
+        prefix = self._prefix(target_ip)
+        bucket = self._prefixes.get(prefix)
+        if bucket is not None:
+            self._prefixes.move_to_end(prefix)
+            return bucket
+        
+        # An evicted bucket has long been idle, so recreating it is harmless
+        bucket = self._prefixes[prefix] = TokenBucket(self.prefix_pps, self.prefix_burst)
+        if len(self._prefixes) > self.MAX_PREFIXES:
+            self._prefixes.popitem(last=False)
+        return bucket
+    
+    def reserve(self, target_ip: str) -> float:
+        """
+        Reserve a send slot for one probe to ``target_ip``.
+        
+        Returns:
+            Seconds the caller must wait before sending
+        """
+        with self._lock:
+            now = time.perf_counter()
+            delay = self._bucket.reserve(now)
+            if self.prefix_pps:
+                delay = max(delay, self._prefix_bucket(target_ip).reserve(now))
+            
+            stats = self.stats
+            stats.probes += 1
+            if delay > 0:
+                stats.delayed += 1
+                stats.total_wait += delay
+                stats.max_wait = max(stats.max_wait, delay)
+        return delay
+    
+    def wait(self, target_ip: str):
+        """Block until a probe to ``target_ip`` may be sent"""
+        delay = self.reserve(target_ip)
+        if delay > 0:
+            time.sleep(delay)
+    
+    async def wait_async(self, target_ip: str):
+        """Wait, without blocking the event loop, until a probe may be sent"""
+        delay = self.reserve(target_ip)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_shared_pacer: Optional[Pacer] = None
+
+
+def set_shared_pacer(pacer: Optional[Pacer]):
+    """Install (or with None, remove) the pacer used by every probe engine"""
+    global _shared_pacer
+    _shared_pacer = pacer
+
+
+def shared_pacer() -> Optional[Pacer]:
+    """The process-wide pacer, if one is installed"""
+    return _shared_pacer
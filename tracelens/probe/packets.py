@@ -0,0 +1,120 @@
+"""
+Packet templates with incremental checksum updates
+"""
+
+import struct
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+def checksum(data: bytes) -> int:
+    """Internet checksum (RFC 1071)"""
+    if len(data) % 2:
+        data += b'\x00'
+    
+    s = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    return ~s & 0xFFFF
+
+
+def checksum_update(cksum: int, old: int, new: int) -> int:
+    """
+    Update a checksum for 16-bit data changing from ``old`` to ``new``.
+    
+    RFC 1624, eqn. 3: HC' = ~(~HC + ~m + m'). ``old`` and ``new`` may also
+    be folded sums of several words, so a whole field is updated at once.
+    """
+    s = (~cksum & 0xFFFF) + (~old & 0xFFFF) + new
+    s = (s & 0xFFFF) + (s >> 16)
+    s = (s & 0xFFFF) + (s >> 16)
+    return ~s & 0xFFFF
+
+
+class PacketTemplate:
+    """
+    A prebuilt packet whose variable fields are patched in place.
+    
+    The packet is built (and checksummed) once. Each probe then only
+    overwrites the fields that change - TTL, ports, sequence, timestamp -
+    and fixes the checksum incrementally from the old and new values
+    instead of summing the whole packet again.
+    
+    ``checksum_offset`` is the byte offset of the checksum covering the
+    patched fields. Patched 16-bit words must be aligned with the start
+    of the checksummed region (true for every header field we patch).
+    """
+    
+    def __init__(self, packet: bytes, checksum_offset: Optional[int] = None):
+        self.buffer = bytearray(packet)
+        self.checksum_offset = checksum_offset
+    
+    def set8(self, offset: int, value: int):
+        """Patch a byte outside the checksummed region (e.g. IP TTL)"""
+        self.buffer[offset] = value
+    
+    def set16(self, offset: int, value: int, checksummed: bool = True):
+        """Patch a 16-bit big-endian field"""
+        self._set(offset, value, 2, checksummed)
+    
+    def set32(self, offset: int, value: int, checksummed: bool = True):
+        """Patch a 32-bit big-endian field"""
+        self._set(offset, value, 4, checksummed)
+    
+    def set64(self, offset: int, value: int, checksummed: bool = True):
+        """Patch a 64-bit big-endian field"""
+        self._set(offset, value, 8, checksummed)
+    
+    def set_bytes(self, offset: int, data: bytes, checksummed: bool = True):
+        """Patch an even-length run of bytes, e.g. a packed payload field"""
+        self._set(offset, int.from_bytes(data, 'big'), len(data), checksummed)
+    
+    def _set(self, offset: int, value: int, size: int, checksummed: bool):
+        buffer = self.buffer
+        end = offset + size
+        old = int.from_bytes(buffer[offset:end], 'big')
+        buffer[offset:end] = value.to_bytes(size, 'big')
+        
+        cks = self.checksum_offset
+        if checksummed and old != value and cks is not None:
+            # 2**16 = 1 (mod 0xFFFF), so a big-endian value mod 0xFFFF is
+            # the ones' complement sum of its 16-bit words
+            cksum = checksum_update(
+                int.from_bytes(buffer[cks:cks + 2], 'big'),
+                old % 0xFFFF,
+                value % 0xFFFF
+            )
+            buffer[cks:cks + 2] = cksum.to_bytes(2, 'big')
+    
+    def packet(self) -> bytes:
+        """Snapshot of the current packet, ready to send"""
+        return bytes(self.buffer)
+
+
+class TemplateCache:
+    """
+    Least-recently-used cache of packet templates (e.g. one per target).
+    """
+    
+    DEFAULT_SIZE = 4096
+    
+    def __init__(self, build: Callable[[Hashable], PacketTemplate],
+                 size: int = DEFAULT_SIZE):
+        self._build = build
+        self.size = size
+        self._templates: OrderedDict[Hashable, PacketTemplate] = OrderedDict()
+    
+    def get(self, key: Hashable) -> PacketTemplate:
+        """Template for ``key``, built on first use"""
+        template = self._templates.get(key)
+        if template is not None:
+            self._templates.move_to_end(key)
+            return template
+        
+        template = self._templates[key] = self._build(key)
+        if len(self._templates) > self.size:
+            self._templates.popitem(last=False)
+        return template
+    
+    def clear(self):
+        self._templates.clear()
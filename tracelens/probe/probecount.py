@@ -0,0 +1,50 @@
+"""
+Adaptive number of probes per hop
+"""
+
+from ..models import ProbeResult
+
+
+class AdaptiveProbeCount:
+    """
+    Decides after each probe whether a hop needs another one.
+    
+    Every hop gets at least ``min_probes`` and at most ``max_probes``
+    (a minimum above the maximum is lowered to it). In between, probing
+    stops as soon as the answers agree: one responder with RTTs within
+    ``jitter_ms`` (or ``jitter_ratio`` of the fastest RTT, whichever is
+    larger) of each other. Probing continues while different routers
+    answer (a load balancer splits the path) or while the RTTs are spread
+    out. A hop that stays silent gets no more than the minimum.
+    """
+    
+    DEFAULT_MIN = 2
+    JITTER_MS = 5.0
+    JITTER_RATIO = 0.2
+    
+    def __init__(self, min_probes: int = DEFAULT_MIN, max_probes: int = 6,
+                 jitter_ms: float = JITTER_MS, jitter_ratio: float = JITTER_RATIO):
+        self.max_probes = max(1, max_probes)
+        self.min_probes = max(1, min(min_probes, self.max_probes))
+        self.jitter_ms = jitter_ms
+        self.jitter_ratio = jitter_ratio
+    
+    def needs_more(self, results: list[ProbeResult]) -> bool:
+        """Whether a hop with these probe results should be probed again"""
+        if len(results) < self.min_probes:
+            return True
+        if len(results) >= self.max_probes:
+            return False
+        
+        responders = {result.responder_ip for result in results if result.responder_ip}
+        if len(responders) > 1:
+            return True
+        
+        rtts = [result.rtt_ms for result in results if result.rtt_ms is not None]
+        if len(rtts) < 2:
+            # Silent, or a single answer that more probes cannot confirm
+            # any better than the loss already seen
+            return False
+        
+        fastest = min(rtts)
+        return max(rtts) - fastest > max(self.jitter_ms, self.jitter_ratio * fastest)
@@ -0,0 +1,123 @@
+"""
+Cache of the source address the kernel picks for each destination
+"""
+
+import socket
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+# rtnetlink multicast groups (linux/rtnetlink.h)
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+
+def lookup_source_ip(target_ip: str) -> str:
+    """
+    Ask the kernel which local address it would use to reach ``target_ip``.
+    
+    Connecting a UDP socket sends nothing; it only runs the route lookup.
+    """
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.connect((target_ip, 80))
+            return s.getsockname()[0]
+        finally:
+            s.close()
+    except OSError:
+        return '0.0.0.0'
+
+
+class SourceAddressCache:
+    """
+    Per-destination source addresses, resolved once and reused.
+    
+    On Linux a netlink socket subscribed to IPv4 route and address
+    changes invalidates the whole cache when the routing table moves.
+    The owner calls ``refresh()`` on its hot path; it reads the netlink
+    socket at most every ``check_interval`` seconds, so a lookup is
+    normally a dict hit with no syscalls. Elsewhere entries simply live
+    until evicted.
+    """
+    
+    DEFAULT_SIZE = 4096
+    CHECK_INTERVAL = 1.0
+    
+    def __init__(self, size: int = DEFAULT_SIZE, check_interval: float = CHECK_INTERVAL):
+        self.size = size
+        self.check_interval = check_interval
+        self._addresses: OrderedDict[str, str] = OrderedDict()
+        self._next_check = 0.0
+        self._netlink = self._open_netlink()
+    
+    @staticmethod
+    def _open_netlink() -> Optional[socket.socket]:
+        """Subscribe to route/address changes; None where netlink is unavailable"""
+        if not hasattr(socket, 'AF_NETLINK'):
+            return None
+        
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_IPV4_ROUTE | RTMGRP_IPV4_IFADDR))
+            sock.setblocking(False)
+            return sock
+        except OSError:
+            return None
+    
+    def get(self, target_ip: str) -> str:
+        """Source address for ``target_ip``, looked up on first use"""
+        src_ip = self._addresses.get(target_ip)
+        if src_ip is not None:
+            self._addresses.move_to_end(target_ip)
+            return src_ip
+        
+        src_ip = self._addresses[target_ip] = lookup_source_ip(target_ip)
+        if len(self._addresses) > self.size:
+            self._addresses.popitem(last=False)
+        return src_ip
+    
+    def refresh(self) -> bool:
+        """
+        Drop every entry if routes or addresses changed since the last check.
+        
+        Returns:
+            True if the cache was invalidated
+        """
+        if self._netlink is None:
+            return False
+        
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        
+        changed = False
+        while True:
+            try:
+                if not self._netlink.recv(65536):
+                    break
+                changed = True
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # Overrun: we missed notifications, so assume a change
+                changed = True
+                break
+        
+        if changed:
+            self._addresses.clear()
+        return changed
+    
+    def clear(self):
+        self._addresses.clear()
+    
+    def close(self):
+        """Close the netlink socket"""
+        if self._netlink:
+            try:
+                self._netlink.close()
+            except OSError:
+                pass
+            self._netlink = None
@@ -0,0 +1,421 @@
+"""
+Stateless randomized ICMP probing (yarrp-style)
+"""
+
+import itertools
+import random
+import select
+import socket
+import struct
+import time
+from collections import deque
+from typing import Hashable, Iterator, Optional, Sequence
+from ..models import ProbeResult
+from .base import BaseProbe
+from .batchio import enable_rx_timestamps
+from .bpf import attach_filter, echo_filter
+from .ids import ICMP_IDENTIFIERS
+from .packets import PacketTemplate, TemplateCache, checksum
+from .pacing import shared_pacer
+
+
+class StatelessProbe(BaseProbe):
+    """
+    Stateless ICMP Echo probe for very large target sets (Linux only).
+    
+    Everything needed to interpret a reply travels in the probe itself,
+    in fields that routers quote back in Time Exceeded / Unreachable:
+    
+    - IP ID: the probe's TTL
+    - ICMP identifier: this engine's instance tag (from ICMP_IDENTIFIERS)
+    - ICMP sequence: send time in 100 µs units (mod 2^16, ~6.5 s)
+    
+    Echo Replies do not quote our headers, so the TTL and full send time
+    are repeated in the payload, which the destination echoes back.
+    
+    ``sweep()`` sends a random permutation of (target, TTL) pairs at a
+    fixed packet rate and reconstructs hop identity and RTT from replies
+    alone, without waiting for any probe; BatchTracer uses it for
+    ``protocol='stateless'``. The engine also implements the normal
+    probe interface so it can be used by Tracer.
+    """
+    
+    ICMP_ECHO_REQUEST = 8
+    ICMP_ECHO_REPLY = 0
+    ICMP_TIME_EXCEEDED = 11
+    ICMP_DEST_UNREACHABLE = 3
+    
+    DEFAULT_PPS = 1000
+    SEND_BATCH = 64  # most probes handed to one sendmmsg
+    MAGIC = b'TLsp'
+    PAYLOAD = struct.Struct('!4sBxxxQ')  # magic, ttl, send time (100 µs units)
+    UNITS_PER_MS = 10
+    SEQ_WRAP = 1 << 16
+    
+    # Field offsets in the IP + ICMP packet template
+    IP_ID_OFFSET = 4
+    IP_TTL_OFFSET = 8
+    ICMP_CHECKSUM_OFFSET = 22
+    ICMP_SEQ_OFFSET = 26
+    PAYLOAD_TTL_OFFSET = 32
+    PAYLOAD_TIME_OFFSET = 36
+    
+    def __init__(self, timeout: float = 2.0, pps: int = DEFAULT_PPS):
+        super().__init__(timeout)
+        self.pps = pps
+        self.instance = ICMP_IDENTIFIERS.acquire(self)
+        self._by_hop: dict[tuple[str, int], deque] = {}
+        self._templates = TemplateCache(self._build_template)
+        self._send_socket = None
+        self._recv_socket = None
+        try:
+            self._init_sockets()
+        except OSError:
+            ICMP_IDENTIFIERS.release(self.instance, self)
+            raise
+    
+    def _init_sockets(self):
+        """Raw sockets: IP_HDRINCL for sending (to set IP ID), ICMP for receiving"""
+        try:
+            self._send_socket = socket.socket(
+                socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW
+            )
+            self._send_socket.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+            
+            self._recv_socket = socket.socket(
+                socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP
+            )
+            enable_rx_timestamps(self._recv_socket)
+            if self.KERNEL_FILTER:
+                attach_filter(self._recv_socket, echo_filter(self.instance))
+        except PermissionError:
+            raise PermissionError(
+                "Root privileges required for stateless probing. "
+                "Please run with sudo."
+            )
+    
+    @classmethod
+    def _now_units(cls) -> int:
+        return time.monotonic_ns() // 100_000
+    
+    @classmethod
+    def _perf_to_units(cls, perf_time: float) -> int:
+        """Probe clock units at a past ``perf_counter`` time"""
+        age_units = int((time.perf_counter() - perf_time) * cls.UNITS_PER_MS * 1000)
+        return cls._now_units() - age_units
+    
+    def _checksum(self, data: bytes) -> int:
+        """Calculate ICMP checksum (RFC 1071)"""
+        return checksum(data)
+    
+    def _build_template(self, target_ip: str) -> PacketTemplate:
+        """Build and checksum the probe for a target once (TTL 0, time 0)"""
+        payload = self.PAYLOAD.pack(self.MAGIC, 0, 0)
+        
+        header = struct.pack('!BBHHH', self.ICMP_ECHO_REQUEST, 0, 0, self.instance, 0)
+        cs = self._checksum(header + payload)
+        icmp = struct.pack('!BBHHH', self.ICMP_ECHO_REQUEST, 0, cs, self.instance, 0)
+        icmp += payload
+        
+        # Source address and IP checksum are left to the kernel
+        ip_header = struct.pack(
+            '!BBHHHBBH4s4s',
+            (4 << 4) + 5,
+            0,
+            20 + len(icmp),
+            0,
+            0,
+            0,
+            socket.IPPROTO_ICMP,
+            0,
+            b'\x00\x00\x00\x00',
+            socket.inet_aton(target_ip)
+        )
+        
+        return PacketTemplate(ip_header + icmp, self.ICMP_CHECKSUM_OFFSET)
+    
+    def _build_packet(self, target_ip: str, ttl: int, send_units: int) -> bytes:
+        """Build IP + ICMP Echo Request with TTL and send time encoded"""
+        template = self._templates.get(target_ip)
+        template.set16(self.IP_ID_OFFSET, ttl, checksummed=False)  # IP ID carries the TTL
+        template.set8(self.IP_TTL_OFFSET, ttl)
+        template.set16(self.ICMP_SEQ_OFFSET, send_units % self.SEQ_WRAP)
+        template.set16(self.PAYLOAD_TTL_OFFSET, ttl << 8)
+        template.set64(self.PAYLOAD_TIME_OFFSET, send_units)
+        return template.packet()
+    
+    def _send_raw(self, target_ip: str, ttl: int) -> bool:
+        """Fire one probe; returns False if it could not be sent"""
+        packet = self._build_packet(target_ip, ttl, self._now_units())
+        try:
+            self._send_socket.sendto(packet, (target_ip, 0))
+            return True
+        except OSError:
+            return False
+    
+    def decode(self, data: bytes, responder_ip: str,
+               recv_units: int) -> Optional[tuple[str, int, ProbeResult]]:
+        """
+        Reconstruct (target, ttl, result) from a received packet alone.
+        
+        Returns:
+            Tuple, or None if the packet is not a reply to this engine
+        """
+        if len(data) < 28:
+            return None
+        
+        ip_header_len = (data[0] & 0x0F) * 4
+        icmp_data = data[ip_header_len:]
+        if len(icmp_data) < 8:
+            return None
+        
+        icmp_type = icmp_data[0]
+        
+        if icmp_type == self.ICMP_ECHO_REPLY:
+            ident = struct.unpack('!H', icmp_data[4:6])[0]
+            if ident != self.instance:
+                return None
+            
+            payload = icmp_data[8:8 + self.PAYLOAD.size]
+            if len(payload) < self.PAYLOAD.size:
+                return None
+            
+            magic, ttl, send_units = self.PAYLOAD.unpack(payload)
+            if magic != self.MAGIC:
+                return None
+            
+            elapsed = recv_units - send_units
+            target_ip = responder_ip
+            reached = True
+        
+        elif icmp_type in (self.ICMP_TIME_EXCEEDED, self.ICMP_DEST_UNREACHABLE):
+            if len(icmp_data) < 36:
+                return None
+            
+            inner_ip_start = 8
+            inner_ip_header_len = (icmp_data[inner_ip_start] & 0x0F) * 4
+            inner_icmp_start = inner_ip_start + inner_ip_header_len
+            
+            if len(icmp_data) < inner_icmp_start + 8:
+                return None
+            
+            if icmp_data[inner_ip_start + 9] != socket.IPPROTO_ICMP:
+                return None
+            
+            inner_type = icmp_data[inner_icmp_start]
+            ident, seq = struct.unpack(
+                '!HH', icmp_data[inner_icmp_start + 4:inner_icmp_start + 8]
+            )
+            if inner_type != self.ICMP_ECHO_REQUEST or ident != self.instance:
+                return None
+            
+            ttl = struct.unpack('!H', icmp_data[inner_ip_start + 4:inner_ip_start + 6])[0]
+            target_ip = socket.inet_ntoa(icmp_data[inner_ip_start + 16:inner_ip_start + 20])
+            elapsed = (recv_units - seq) % self.SEQ_WRAP
+            reached = (icmp_type == self.ICMP_DEST_UNREACHABLE)
+        
+        else:
+            return None
+        
+        rtt_ms = elapsed / self.UNITS_PER_MS
+        if not 0 <= rtt_ms <= self.timeout * 1000:
+            return None
+        
+        return target_ip, ttl, ProbeResult(
+            responder_ip=responder_ip,
+            rtt_ms=round(rtt_ms, 2),
+            reached_target=reached
+        )
+    
+    def _read_decoded(self, wait_time: float) -> list[tuple[str, int, ProbeResult]]:
+        """Wait up to ``wait_time`` for replies, then decode everything queued"""
+        batch = self._batch_for(self._recv_socket)
+        decoded = []
+        for _ in range(self.MAX_READS_PER_POLL):
+            readable, _, _ = select.select([self._recv_socket], [], [], wait_time)
+            if not readable:
+                break
+            
+            for data, responder_ip, recv_time in batch.recv_many():
+                reply = self.decode(data, responder_ip, self._perf_to_units(recv_time))
+                if reply is not None:
+                    decoded.append(reply)
+            
+            wait_time = 0.0
+        
+        return decoded
+    
+    def sweep(
+        self,
+        targets: Sequence[str],
+        max_ttl: int = 32,
+        min_ttl: int = 1,
+        seed: Optional[int] = None,
+        probes: int = 1
+    ) -> Iterator[tuple[str, int, ProbeResult]]:
+        """
+        Probe every (target, TTL) pair in random order at ``pps``.
+        
+        Replies are yielded as (target, ttl, ProbeResult) while sending
+        continues; unanswered probes produce nothing. After the last probe
+        is sent, replies are collected for one more ``timeout``. With a
+        pacer installed (the engine's, else the shared one), its global
+        rate caps ``pps``.
+        
+        Probes that fall due together (at high rates, everything scheduled
+        since the last wakeup) leave in one ``sendmmsg`` batch of up to
+        ``SEND_BATCH``.
+        
+        Args:
+            targets: Target IP addresses (already resolved)
+            max_ttl: Highest TTL to probe
+            min_ttl: Lowest TTL to probe
+            seed: Seed for the probe order
+            probes: Probes sent to each (target, TTL) pair
+        """
+        pps = self.pps
+        pacer = self.pacer or shared_pacer()
+        if pacer is not None:
+            pps = min(pps, pacer.pps)
+        
+        ttl_count = max_ttl - min_ttl + 1
+        per_target = ttl_count * probes
+        interval = 1.0 / pps
+        order = self._permutation(len(targets) * per_target, seed)
+        sender = self._batch_for(self._send_socket)
+        next_send = time.perf_counter()
+        
+        while True:
+            while (remaining := next_send - time.perf_counter()) > 0:
+                yield from self._read_decoded(remaining)
+            
+            late = time.perf_counter() - next_send
+            due = min(self.SEND_BATCH, 1 + int(late / interval))
+            
+            send_units = self._now_units()
+            packets = []
+            for index in itertools.islice(order, due):
+                target_ip = targets[index // per_target]
+                ttl = min_ttl + index % per_target // probes
+                packets.append((self._build_packet(target_ip, ttl, send_units), target_ip))
+            
+            if not packets:
+                break
+            
+            sender.send_many(packets)
+            next_send += len(packets) * interval
+            
+            # Drain without waiting so a fast sender never starves the socket
+            yield from self._read_decoded(0)
+        
+        deadline = time.perf_counter() + self.timeout
+        while (remaining := deadline - time.perf_counter()) > 0:
+            yield from self._read_decoded(remaining)
+    
+    @staticmethod
+    def _permutation(n: int, seed: Optional[int] = None) -> Iterator[int]:
+        """
+        Pseudo-random permutation of range(n) in O(1) memory.
+        
+        Walks a full-period linear congruential sequence modulo the next
+        power of two, skipping values outside the range.
+        """
+        if n <= 0:
+            return
+        
+        rng = random.Random(seed)
+        m = 1 << max(1, (n - 1).bit_length())
+        a = (rng.randrange(m) & ~3) | 1   # a = 1 (mod 4)
+        c = rng.randrange(m) | 1          # c odd
+        x = rng.randrange(m)
+        
+        for _ in range(m):
+            x = (a * x + c) % m
+            if x < n:
+                yield x
+    
+    def send(self, target_ip: str, ttl: int,
+             timeout: Optional[float] = None) -> Hashable:
+        """Send a probe; replies are matched back by (target, ttl) in send order"""
+        self.pace(target_ip)
+        key = next(self._keys)
+        self._track(key, target_ip, ttl, time.perf_counter(), timeout)
+        self._by_hop.setdefault((target_ip, ttl), deque()).append(key)
+        self._send_raw(target_ip, ttl)
+        return key
+    
+    def _send_batch(self, probes):
+        """Send probes in one batch; the TTL is already in each IP header"""
+        sender = self._batch_for(self._send_socket)
+        keys, packets = [], []
+        send_units = self._now_units()
+        for target_ip, ttl, _ in probes:
+            key = next(self._keys)
+            self._by_hop.setdefault((target_ip, ttl), deque()).append(key)
+            packets.append((self._build_packet(target_ip, ttl, send_units), target_ip))
+            keys.append(key)
+        
+        sender.send_many(packets)
+        for key, send_time, (target_ip, ttl, timeout) in zip(keys, sender.send_times, probes):
+            self._track(key, target_ip, ttl, send_time, timeout)
+        return keys
+    
+    def probe(self, target_ip: str, ttl: int,
+              timeout: Optional[float] = None) -> ProbeResult:
+        """Send a probe with given TTL and wait for its result"""
+        return self._wait(self.send(target_ip, ttl, timeout), timeout)
+    
+    def _receive_sockets(self) -> list:
+        return [self._recv_socket]
+    
+    def _match_reply(self, sock, data: bytes, responder_ip: str, recv_time: float):
+        """Attribute a decoded reply to the oldest pending probe for its hop"""
+        reply = self.decode(data, responder_ip, self._perf_to_units(recv_time))
+        if reply is None:
+            return None
+        
+        target_ip, ttl, result = reply
+        keys = self._by_hop.get((target_ip, ttl))
+        if not keys:
+            return None
+        
+        key = keys.popleft()
+        if not keys:
+            del self._by_hop[(target_ip, ttl)]
+        
+        self._pending.pop(key, None)
+        return key, result
+    
+    def cancel(self, key: Hashable):
+        """Forget an in-flight probe; its reply will be ignored"""
+        self._forget_hop(key)
+        super().cancel(key)
+    
+    def _expire(self, now: float):
+        for key, pending in self._pending.items():
+            if pending.deadline <= now:
+                self._forget_hop(key)
+        return super()._expire(now)
+    
+    def _forget_hop(self, key: Hashable):
+        """Remove a probe from the (target, ttl) match queue"""
+        pending = self._pending.get(key)
+        if pending is None:
+            return
+        
+        hop = (pending.target_ip, pending.ttl)
+        keys = self._by_hop.get(hop)
+        if keys and key in keys:
+            keys.remove(key)
+            if not keys:
+                del self._by_hop[hop]
+    
+    def close(self):
+        """Close sockets and give back the instance tag"""
+        ICMP_IDENTIFIERS.release(self.instance, self)
+        for sock in (self._send_socket, self._recv_socket):
+            if sock:
+                try:
+                    sock.close()
+                except:
+                    pass
@@ -0,0 +1,66 @@
+"""
+Doubletree local stop set for the near side of the path
+"""
+
+import dataclasses
+from typing import Optional
+from ..models import HopResult
+
+
+class StopSet:
+    """
+    Local stop set (Doubletree) shared by traces from one vantage point.
+    
+    The first hops of a path are nearly identical for every destination.
+    A trace that uses the stop set starts probing at ``start_ttl``; hops
+    below it are probed backwards (one TTL at a time, or a window at once
+    when tracing in parallel) until a hop answers from a (TTL, interface)
+    pair already in the set. The hops below the last one probed are then
+    filled in from the trace that first discovered it, marked with
+    ``from_stop_set``.
+    """
+    
+    DEFAULT_START_TTL = 5
+    
+    def __init__(self, start_ttl: int = DEFAULT_START_TTL):
+        self.start_ttl = start_ttl
+        # (ttl, interface) -> hops 1..ttl-1 that led to it
+        self._paths: dict[tuple[int, str], list[HopResult]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._paths)
+    
+    def __contains__(self, hop: HopResult) -> bool:
+        return hop.ip is not None and (hop.hop, hop.ip) in self._paths
+    
+    def infer(self, hop: HopResult) -> list[HopResult]:
+        """
+        Hops in front of a known interface, as inferred copies.
+        
+        Returns:
+            HopResults for TTLs 1..hop.hop-1, or [] if ``hop`` is not known
+        """
+        if hop not in self:
+            return []
+        
+        return [
+            dataclasses.replace(known, rtts=list(known.rtts),
+                                stop_reason=None, from_stop_set=True, probes_sent=0)
+            for known in self._paths[(hop.hop, hop.ip)]
+        ]
+    
+    def add(self, hops: list[HopResult]):
+        """Record the near-side interfaces of a finished trace"""
+        for index, hop in enumerate(hops):
+            if hop.hop >= self.start_ttl:
+                break
+            if hop.ip is None or hop.reached_target:
+                continue
+            self._paths.setdefault((hop.hop, hop.ip), hops[:index])
+    
+    def near_side(self, max_hops: int) -> Optional[range]:
+        """TTLs to probe backwards before the forward phase, or None"""
+        last = min(self.start_ttl, max_hops + 1) - 1
+        if last < 1:
+            return None
+        return range(last, 0, -1)
@@ -7,8 +7,14 @@ import struct
 import time
 import os
 import random
+from typing import Optional
 from ..models import ProbeResult
 from .base import BaseProbe
+from .batchio import enable_rx_timestamps
+from .bpf import attach_filter, port_filter, tcp_reply_filter
+from .packets import PacketTemplate, TemplateCache, checksum
+from .ids import TCP_SOURCE_PORTS
+from .routes import SourceAddressCache
 
 
 class TCPProbe(BaseProbe):
@@ -20,6 +26,15 @@ class TCPProbe(BaseProbe):
     - ICMP Time Exceeded from intermediate routers
     - TCP SYN-ACK or RST from destination
     
+    SYN-ACK and RST are read from the raw TCP socket and matched by
+    ports and acknowledgement number, so the final hop completes as soon
+    as the destination answers. ICMP errors are matched by the quoted
+    source port and sequence number. Each in-flight SYN holds its source
+    port from the process-wide TCP_SOURCE_PORTS pool, so concurrent
+    engines never share one. With ``reset=True`` a RST is sent back
+    for every SYN-ACK to tear down the half-open connection (the kernel
+    normally does this itself, unless a firewall drops its RST).
+    
     Useful when ICMP is filtered but TCP ports are open.
     Requires administrator privileges.
     """
@@ -27,10 +42,29 @@ class TCPProbe(BaseProbe):
     ICMP_TIME_EXCEEDED = 11
     ICMP_DEST_UNREACHABLE = 3
     
-    def __init__(self, port: int = 80, timeout: float = 2.0):
+    TCP_SYN = 0x02
+    TCP_RST = 0x04
+    TCP_ACK = 0x10
+    
+    # Range of TCP_SOURCE_PORTS, which hands each probe a free source port
+    SRC_PORT_MIN = TCP_SOURCE_PORTS.first
+    SRC_PORT_MAX = TCP_SOURCE_PORTS.last
+    
+    # Field offsets in the IP + TCP packet template
+    IP_ID_OFFSET = 4
+    IP_TTL_OFFSET = 8
+    TCP_SPORT_OFFSET = 20
+    TCP_SEQ_OFFSET = 24
+    TCP_CHECKSUM_OFFSET = 36
+    
+    def __init__(self, port: int = 80, timeout: float = 2.0, reset: bool = False):
         super().__init__(timeout)
         self.port = port
-        self.src_port = random.randint(32768, 60999)
+        self.reset = reset
+        self.src_port: Optional[int] = None  # Most recently used source port
+        self._seqs: dict[int, int] = {}  # source port -> SYN sequence number
+        self._routes = SourceAddressCache()
+        self._templates = TemplateCache(self._build_template)
         self._tcp_socket = None
         self._icmp_socket = None
         self._init_sockets()
@@ -44,12 +78,25 @@ class TCPProbe(BaseProbe):
             )
             self._tcp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
             
+            # The same socket also sees the destination's SYN-ACK / RST
+            enable_rx_timestamps(self._tcp_socket)
+            if self.KERNEL_FILTER:
+                attach_filter(self._tcp_socket, tcp_reply_filter(
+                    self.port, self.SRC_PORT_MIN, self.SRC_PORT_MAX
+                ))
+            
             # Raw socket for receiving ICMP responses
             self._icmp_socket = socket.socket(
                 socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP
             )
             self._icmp_socket.settimeout(self.timeout)
             self._icmp_socket.bind(('', 0))
+            enable_rx_timestamps(self._icmp_socket)
+            if self.KERNEL_FILTER:
+                # Only ICMP errors quoting a SYN to our port reach Python
+                attach_filter(
+                    self._icmp_socket, port_filter(socket.IPPROTO_TCP, self.port)
+                )
             
         except PermissionError:
             raise PermissionError(
@@ -59,28 +106,11 @@ class TCPProbe(BaseProbe):
     
     def _checksum(self, data: bytes) -> int:
         """Calculate checksum"""
-        if len(data) % 2:
-            data += b'\x00'
-        
-        s = 0
-        for i in range(0, len(data), 2):
-            w = (data[i] << 8) + data[i + 1]
-            s += w
-        
-        s = (s >> 16) + (s & 0xFFFF)
-        s += s >> 16
-        return ~s & 0xFFFF
+        return checksum(data)
     
     def _get_local_ip(self, target_ip: str) -> str:
-        """Get local IP for routing to target"""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect((target_ip, 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            return local_ip
-        except:
-            return '0.0.0.0'
+        """Get local IP for routing to target (cached per destination)"""
+        return self._routes.get(target_ip)
     
     def _build_ip_header(self, src_ip: str, dst_ip: str, ttl: int, payload_len: int) -> bytes:
         """Build IP header"""
@@ -112,12 +142,11 @@ class TCPProbe(BaseProbe):
         return header
     
     def _build_tcp_header(self, src_ip: str, dst_ip: str, src_port: int, 
-                          dst_port: int, seq: int) -> bytes:
-        """Build TCP SYN header with checksum"""
+                          dst_port: int, seq: int, flags: int = TCP_SYN) -> bytes:
+        """Build TCP header (SYN by default) with checksum"""
         # TCP header fields
         ack = 0
         data_offset = 5 << 4  # 5 * 4 = 20 bytes, no options
-        flags = 0x02  # SYN flag
         window = socket.htons(65535)
         checksum = 0
         urgent = 0
@@ -171,76 +200,176 @@ class TCPProbe(BaseProbe):
         
         return tcp_header
     
-    def probe(self, target_ip: str, ttl: int) -> ProbeResult:
-        """Send TCP SYN with given TTL"""
+    def _build_template(self, target_ip: str) -> PacketTemplate:
+        """Build and checksum the SYN packet for a target once"""
         src_ip = self._get_local_ip(target_ip)
-        self.src_port = (self.src_port + 1) % 65536
-        if self.src_port < 32768:
-            self.src_port = 32768
-        
-        seq = random.randint(0, 0xFFFFFFFF)
+        tcp_header = self._build_tcp_header(src_ip, target_ip, 0, self.port, 0)
+        ip_header = self._build_ip_header(src_ip, target_ip, 0, len(tcp_header))
+        return PacketTemplate(ip_header + tcp_header, self.TCP_CHECKSUM_OFFSET)
+    
+    def _build_packet(self, target_ip: str, ttl: int) -> tuple[bytes, int]:
+        """Build a SYN packet on a free source port, returns (packet, src_port)"""
+        self.src_port = TCP_SOURCE_PORTS.acquire(self)
         
-        # Build packet
-        tcp_header = self._build_tcp_header(
-            src_ip, target_ip, self.src_port, self.port, seq
-        )
-        ip_header = self._build_ip_header(src_ip, target_ip, ttl, len(tcp_header))
-        packet = ip_header + tcp_header
+        # Templates embed the source address; rebuild them if routes moved
+        if self._routes.refresh():
+            self._templates.clear()
         
+        # The kernel fills in the IP checksum, so IP fields need no fix-up
+        template = self._templates.get(target_ip)
+        template.set16(self.IP_ID_OFFSET, random.getrandbits(16), checksummed=False)
+        template.set8(self.IP_TTL_OFFSET, ttl)
+        template.set16(self.TCP_SPORT_OFFSET, self.src_port)
+        seq = random.getrandbits(32)
+        template.set32(self.TCP_SEQ_OFFSET, seq)
+        self._seqs[self.src_port] = seq
+        return template.packet(), self.src_port
+    
+    def send(self, target_ip: str, ttl: int, timeout: Optional[float] = None) -> int:
+        """Send TCP SYN without waiting; the probe is keyed by its source port"""
+        self.pace(target_ip)
+        packet, src_port = self._build_packet(target_ip, ttl)
         send_time = time.perf_counter()
+        self._track(src_port, target_ip, ttl, send_time, timeout)
         
         try:
             self._tcp_socket.sendto(packet, (target_ip, self.port))
         except Exception:
-            return ProbeResult()
-        
-        # Wait for ICMP or TCP response
-        while True:
-            try:
-                remaining = self.timeout - (time.perf_counter() - send_time)
-                if remaining <= 0:
-                    return ProbeResult()
-                
-                self._icmp_socket.settimeout(remaining)
-                data, addr = self._icmp_socket.recvfrom(1024)
-                recv_time = time.perf_counter()
-                
-                # Parse ICMP response
-                ip_header_len = (data[0] & 0x0F) * 4
-                icmp_data = data[ip_header_len:]
-                
-                if len(icmp_data) < 8:
-                    continue
-                
-                icmp_type = icmp_data[0]
-                
-                if icmp_type in (self.ICMP_TIME_EXCEEDED, self.ICMP_DEST_UNREACHABLE):
-                    # Check if it's our packet
-                    if len(icmp_data) >= 36:
-                        inner_ip_start = 8
-                        inner_ip = icmp_data[inner_ip_start:inner_ip_start + 20]
-                        inner_proto = inner_ip[9]
-                        
-                        if inner_proto == socket.IPPROTO_TCP:
-                            inner_tcp_start = inner_ip_start + 20
-                            if len(icmp_data) >= inner_tcp_start + 8:
-                                inner_tcp = icmp_data[inner_tcp_start:inner_tcp_start + 8]
-                                inner_src_port, inner_dst_port = struct.unpack('!HH', inner_tcp[:4])
-                                
-                                if inner_dst_port == self.port:
-                                    rtt_ms = (recv_time - send_time) * 1000
-                                    reached = (addr[0] == target_ip)
-                                    
-                                    return ProbeResult(
-                                        responder_ip=addr[0],
-                                        rtt_ms=round(rtt_ms, 2),
-                                        reached_target=reached
-                                    )
-                
-            except socket.timeout:
-                return ProbeResult()
-            except Exception:
-                continue
+            # Leave it pending; poll() reports it as a timeout
+            pass
+        
+        return src_port
+    
+    def _send_batch(self, probes):
+        """Send SYNs in one batch; the TTL is already in each IP header"""
+        sender = self._batch_for(self._tcp_socket)
+        keys, packets = [], []
+        for target_ip, ttl, _ in probes:
+            packet, src_port = self._build_packet(target_ip, ttl)
+            packets.append((packet, target_ip))
+            keys.append(src_port)
+        
+        try:
+            sender.send_many(packets, self.port)
+        except Exception:
+            # Leave them pending; poll() reports them as timeouts
+            pass
+        
+        for src_port, send_time, (target_ip, ttl, timeout) in zip(keys, sender.send_times, probes):
+            self._track(src_port, target_ip, ttl, send_time, timeout)
+        return keys
+    
+    def _receive_sockets(self) -> list:
+        return [self._icmp_socket, self._tcp_socket]
+    
+    def _match_reply(self, sock, data: bytes, responder_ip: str, recv_time: float):
+        """Match an ICMP error or the destination's TCP answer to a SYN"""
+        if sock is self._tcp_socket:
+            return self._match_tcp_reply(data, responder_ip, recv_time)
+        return self._match_icmp_reply(data, responder_ip, recv_time)
+    
+    def _match_tcp_reply(self, data: bytes, responder_ip: str, recv_time: float):
+        """Match SYN-ACK / RST from the destination by ports and ack number"""
+        ip_header_len = (data[0] & 0x0F) * 4
+        tcp = data[ip_header_len:]
+        if len(tcp) < 20:
+            return None
+        
+        src_port, dst_port, seq, ack = struct.unpack('!HHII', tcp[:12])
+        flags = tcp[13]
+        if src_port != self.port or not flags & self.TCP_ACK:
+            return None
+        if not flags & (self.TCP_SYN | self.TCP_RST):
+            return None
+        
+        pending = self._pending.get(dst_port)
+        if pending is None or pending.target_ip != responder_ip:
+            return None
+        if ack != (self._seqs.get(dst_port, -1) + 1) & 0xFFFFFFFF:
+            return None
+        
+        if self.reset and flags & self.TCP_SYN:
+            self._send_reset(responder_ip, dst_port, ack)
+        
+        self._release(dst_port)
+        return self._complete(dst_port, responder_ip, recv_time, reached_target=True,
+                              reply_ttl=data[8])
+    
+    def _send_reset(self, target_ip: str, src_port: int, seq: int):
+        """Tear down a half-open connection the destination accepted"""
+        src_ip = self._get_local_ip(target_ip)
+        tcp_header = self._build_tcp_header(
+            src_ip, target_ip, src_port, self.port, seq, flags=self.TCP_RST
+        )
+        ip_header = self._build_ip_header(src_ip, target_ip, 64, len(tcp_header))
+        try:
+            self._tcp_socket.sendto(ip_header + tcp_header, (target_ip, self.port))
+        except OSError:
+            pass
+    
+    def _match_icmp_reply(self, data: bytes, responder_ip: str, recv_time: float):
+        """Match ICMP error quoting one of our SYNs by source port"""
+        ip_header_len = (data[0] & 0x0F) * 4
+        icmp_data = data[ip_header_len:]
+        
+        if len(icmp_data) < 36:
+            return None
+        
+        if icmp_data[0] not in (self.ICMP_TIME_EXCEEDED, self.ICMP_DEST_UNREACHABLE):
+            return None
+        
+        inner_ip_start = 8
+        inner_ip_header_len = (icmp_data[inner_ip_start] & 0x0F) * 4
+        if icmp_data[inner_ip_start + 9] != socket.IPPROTO_TCP:
+            return None
+        
+        inner_tcp_start = inner_ip_start + inner_ip_header_len
+        if len(icmp_data) < inner_tcp_start + 8:
+            return None
+        
+        # Routers quote at least the ports and sequence number
+        inner_src_port, inner_dst_port, inner_seq = struct.unpack(
+            '!HHI', icmp_data[inner_tcp_start:inner_tcp_start + 8]
+        )
+        if inner_dst_port != self.port:
+            return None
+        
+        pending = self._pending.get(inner_src_port)
+        if pending is None:
+            return None
+        inner_dst_ip = socket.inet_ntoa(icmp_data[inner_ip_start + 16:inner_ip_start + 20])
+        if inner_dst_ip != pending.target_ip:
+            return None
+        if inner_seq != self._seqs.get(inner_src_port):
+            return None
+        
+        self._release(inner_src_port)
+        return self._complete(
+            inner_src_port, responder_ip, recv_time,
+            reached_target=(responder_ip == pending.target_ip),
+            reply_ttl=data[8]
+        )
+    
+    def probe(self, target_ip: str, ttl: int,
+              timeout: Optional[float] = None) -> ProbeResult:
+        """Send TCP SYN with given TTL and wait for ICMP, SYN-ACK or RST"""
+        return self._wait(self.send(target_ip, ttl, timeout), timeout)
+    
+    def _release(self, src_port: int):
+        """Forget a finished probe's sequence number and free its source port"""
+        self._seqs.pop(src_port, None)
+        TCP_SOURCE_PORTS.release(src_port, self)
+    
+    def cancel(self, key):
+        if key in self._pending:
+            self._release(key)
+        super().cancel(key)
+    
+    def _expire(self, now: float):
+        expired = super()._expire(now)
+        for key, _ in expired:
+            self._release(key)
+        return expired
     
     def close(self):
         """Close sockets"""
@@ -250,3 +379,5 @@ class TCPProbe(BaseProbe):
                     sock.close()
                 except:
                     pass
+        self._routes.close()
+        TCP_SOURCE_PORTS.release_all(self)
@@ -0,0 +1,128 @@
+"""
+Adaptive probe timeouts from observed RTTs
+"""
+
+import ipaddress
+from typing import Optional
+
+
+class RTTEstimator:
+    """
+    Smoothed RTT and RTT variance, as in TCP's RTO calculation (RFC 6298).
+    
+    All values are in milliseconds.
+    """
+    
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+    
+    def __init__(self, srtt: Optional[float] = None, rttvar: Optional[float] = None):
+        self.srtt = srtt
+        self.rttvar = rttvar
+    
+    def observe(self, rtt_ms: float):
+        """Fold one RTT sample into the estimate"""
+        if self.srtt is None:
+            self.srtt = rtt_ms
+            self.rttvar = rtt_ms / 2
+            return
+        
+        self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt_ms)
+        self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt_ms
+    
+    @property
+    def rto_ms(self) -> Optional[float]:
+        """Retransmission-style timeout, or None before the first sample"""
+        if self.srtt is None:
+            return None
+        return self.srtt + self.K * self.rttvar
+
+
+class TimeoutHistory:
+    """
+    RTT estimates per destination prefix, shared between traces.
+    
+    A trace towards a prefix that has been traced before starts from
+    that prefix's estimate instead of the full fixed timeout.
+    """
+    
+    PREFIX_LEN = 24
+    
+    def __init__(self, prefix_len: int = PREFIX_LEN):
+        self.prefix_len = prefix_len
+        self._estimators: dict[str, RTTEstimator] = {}
+    
+    def prefix(self, ip: str) -> str:
+        """Prefix that ``ip`` is tracked under"""
+        network = ipaddress.ip_network(f"{ip}/{self.prefix_len}", strict=False)
+        return str(network)
+    
+    def get(self, ip: str) -> Optional[RTTEstimator]:
+        return self._estimators.get(self.prefix(ip))
+    
+    def observe(self, ip: str, rtt_ms: float):
+        """Record an RTT seen while tracing towards ``ip``"""
+        key = self.prefix(ip)
+        estimator = self._estimators.get(key)
+        if estimator is None:
+            estimator = self._estimators[key] = RTTEstimator()
+        estimator.observe(rtt_ms)
+
+
+class AdaptiveTimeout:
+    """
+    Per-trace probe timeout derived from the RTTs seen so far.
+    
+    Starts from the prefix history (if any) for the target, then follows
+    the RTTs of earlier hops of this trace. The base timeout is SRTT +
+    4 * RTTVAR; before any RTT is known it is the ceiling.
+    
+    RTTs grow with distance, so a hop further out may answer after the
+    estimate. As in TCP, each retry of a hop doubles the timeout, so a
+    slow hop is caught by its second or third probe while a silent hop
+    costs only a fraction of the fixed timeout. Every value is clamped
+    to [floor, ceiling].
+    """
+    
+    DEFAULT_FLOOR = 0.2
+    
+    def __init__(
+        self,
+        target_ip: str,
+        ceiling: float,
+        floor: float = DEFAULT_FLOOR,
+        history: Optional[TimeoutHistory] = None
+    ):
+        self.target_ip = target_ip
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.history = history
+        
+        seed = history.get(target_ip) if history else None
+        if seed is not None:
+            self._estimator = RTTEstimator(seed.srtt, seed.rttvar)
+        else:
+            self._estimator = RTTEstimator()
+    
+    def timeout(self, retries: int = 0) -> float:
+        """
+        Probe timeout in seconds.
+        
+        Args:
+            retries: Number of earlier probes of the same hop that went
+                unanswered (or were sent alongside this one)
+        """
+        rto_ms = self._estimator.rto_ms
+        if rto_ms is None:
+            return self.ceiling
+        return min(self.ceiling, max(self.floor, rto_ms / 1000) * 2 ** retries)
+    
+    def observe(self, rtt_ms: Optional[float]):
+        """Record one probe's RTT; timeouts (None) are ignored"""
+        if rtt_ms is None:
+            return
+        
+        self._estimator.observe(rtt_ms)
+        if self.history is not None:
+            self.history.observe(self.target_ip, rtt_ms)
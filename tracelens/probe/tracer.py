@@ -2,13 +2,47 @@
 Traceroute orchestrator
 """
 
+import asyncio
+import contextlib
 import socket
-from typing import Callable, Optional
-from ..models import HopResult, ProbeResult
+from typing import AsyncIterator, Callable, Optional
+from ..models import HopResult, ProbeResult, STOP_GAP_LIMIT, STOP_MAX_HOPS, STOP_REACHED
 from .base import BaseProbe
 from .icmp import ICMPProbe
 from .tcp import TCPProbe
 from .udp import UDPProbe
+from .stateless import StatelessProbe
+from .errqueue import DgramICMPProbe, DgramUDPProbe
+from .timeouts import AdaptiveTimeout, TimeoutHistory
+from .probecount import AdaptiveProbeCount
+from .stopset import StopSet
+from .history import PathHistory, distance_from_reply_ttl
+
+
+def create_probe(protocol: str, timeout: float = 2.0, port: int = 80,
+                 unprivileged: bool = False, tcp_reset: bool = False) -> BaseProbe:
+    """
+    Create a probe engine for the given protocol name.
+    
+    With ``unprivileged=True`` the engine uses Linux datagram sockets
+    instead of raw sockets (ICMP and UDP only). With ``tcp_reset=True``
+    the TCP engine answers every SYN-ACK with a RST.
+    """
+    protocols = Tracer.UNPRIVILEGED_PROTOCOLS if unprivileged else Tracer.PROTOCOLS
+    probe_class = protocols.get(protocol)
+    if not probe_class:
+        raise ValueError(
+            f"Unknown protocol '{protocol}'"
+            f"{' for unprivileged probing' if unprivileged else ''}. "
+            f"Supported: {', '.join(protocols.keys())}"
+        )
+    
+    if protocol == 'tcp':
+        return probe_class(port=port, timeout=timeout, reset=tcp_reset)
+    elif protocol == 'udp':
+        return probe_class(timeout=timeout)
+    else:
+        return probe_class(timeout=timeout)
 
 
 class Tracer:
@@ -17,12 +51,59 @@ class Tracer:
     
     Manages probe execution across multiple hops with configurable
     protocol, hop count, and probe count.
+    
+    By default hops are probed one after another. With ``parallel=True``
+    probes for a window of TTLs are kept in flight at once and the trace
+    ends as soon as the destination TTL is known.
+    
+    ``trace()`` blocks; ``trace_async()`` and ``iter_hops()`` run on the
+    current event loop. Pass an existing ``probe`` engine to share its
+    sockets between many concurrent traces.
+    
+    With ``adaptive_timeout=True`` each probe waits for an estimate built
+    from the RTTs of earlier hops (and of earlier traces to the same
+    prefix, via ``timeout_history``) rather than the full ``timeout``,
+    which becomes the upper bound; ``min_timeout`` is the lower bound.
+    
+    With ``adaptive_probes=True`` each hop gets between ``min_probes``
+    and ``probes_per_hop`` probes: probing stops once the answers agree
+    and continues while responders differ or RTTs jitter. The count
+    used is recorded in each HopResult's ``probes_sent``.
+    
+    With ``gap_limit=N`` the trace stops after N consecutive hops without
+    any reply. The last HopResult's ``stop_reason`` records why the trace
+    ended (destination reached, gap limit or max_hops).
+    
+    With a shared ``stop_set`` the trace starts at its ``start_ttl`` and
+    probes the near side backwards only until a known interface answers;
+    the hops in front of it are copied from the stop set (Doubletree).
+    
+    With ``predict_start=True`` the trace starts at the destination's
+    predicted distance: where it was on the last path to the same /24
+    (from ``path_history``), or else as estimated from the TTL left on
+    a reply to one probe sent with ``max_hops``. The near side is then
+    probed backwards until a hop matches the recorded path (or the stop
+    set); the hops below are copied from it and marked ``from_history``.
+    
+    With ``unprivileged=True`` ICMP and UDP probes go out over Linux
+    datagram sockets and ICMP errors are read from the socket error
+    queue, so no root or CAP_NET_RAW is needed.
+    
+    With ``tcp_reset=True`` (TCP only) every SYN-ACK from the destination
+    is answered with a RST, so no half-open connection is left behind
+    where a firewall drops the kernel's own RST.
     """
     
     PROTOCOLS = {
         'icmp': ICMPProbe,
         'tcp': TCPProbe,
         'udp': UDPProbe,
+        'stateless': StatelessProbe,
+    }
+    
+    UNPRIVILEGED_PROTOCOLS = {
+        'icmp': DgramICMPProbe,
+        'udp': DgramUDPProbe,
     }
     
     def __init__(
@@ -32,7 +113,21 @@ class Tracer:
         max_hops: int = 30,
         probes_per_hop: int = 3,
         timeout: float = 2.0,
-        port: int = 80
+        port: int = 80,
+        parallel: bool = False,
+        window: Optional[int] = None,
+        probe: Optional[BaseProbe] = None,
+        adaptive_timeout: bool = False,
+        min_timeout: float = AdaptiveTimeout.DEFAULT_FLOOR,
+        timeout_history: Optional[TimeoutHistory] = None,
+        gap_limit: Optional[int] = None,
+        stop_set: Optional[StopSet] = None,
+        unprivileged: bool = False,
+        adaptive_probes: bool = False,
+        min_probes: int = AdaptiveProbeCount.DEFAULT_MIN,
+        predict_start: bool = False,
+        path_history: Optional[PathHistory] = None,
+        tcp_reset: bool = False
     ):
         self.target = target
         self.protocol = protocol.lower()
@@ -40,8 +135,27 @@ class Tracer:
         self.probes_per_hop = probes_per_hop
         self.timeout = timeout
         self.port = port
+        self.parallel = parallel
+        self.window = window
+        self.adaptive_timeout = adaptive_timeout
+        self.min_timeout = min_timeout
+        self.timeout_history = timeout_history
+        self.gap_limit = gap_limit
+        self.stop_set = stop_set
+        self.unprivileged = unprivileged
+        self.adaptive_probes = adaptive_probes
+        self.min_probes = min_probes
+        self.predict_start = predict_start
+        if path_history is None and predict_start:
+            path_history = PathHistory()
+        self.path_history = path_history
+        self.tcp_reset = tcp_reset
         self.target_ip: Optional[str] = None
-        self._probe: Optional[BaseProbe] = None
+        self._probe: Optional[BaseProbe] = probe
+        self._timeouts: Optional[AdaptiveTimeout] = None
+        self._probe_count: Optional[AdaptiveProbeCount] = (
+            AdaptiveProbeCount(min_probes, probes_per_hop) if adaptive_probes else None
+        )
     
     def resolve_target(self) -> str:
         """Resolve target hostname to IP"""
@@ -53,19 +167,206 @@ class Tracer:
     
     def _create_probe(self) -> BaseProbe:
         """Create probe instance based on protocol"""
-        probe_class = self.PROTOCOLS.get(self.protocol)
-        if not probe_class:
-            raise ValueError(
-                f"Unknown protocol '{self.protocol}'. "
-                f"Supported: {', '.join(self.PROTOCOLS.keys())}"
+        return create_probe(
+            self.protocol, timeout=self.timeout, port=self.port,
+            unprivileged=self.unprivileged, tcp_reset=self.tcp_reset
+        )
+    
+    def _open_probe(self):
+        """Context manager for the probe engine; shared engines are left open"""
+        if self._probe is not None:
+            return contextlib.nullcontext(self._probe)
+        return self._create_probe()
+    
+    def _start_timeouts(self):
+        """Reset the adaptive timeout estimate for a new trace"""
+        if self.adaptive_timeout:
+            self._timeouts = AdaptiveTimeout(
+                self.target_ip,
+                ceiling=self.timeout,
+                floor=self.min_timeout,
+                history=self.timeout_history
             )
-        
-        if self.protocol == 'tcp':
-            return probe_class(port=self.port, timeout=self.timeout)
-        elif self.protocol == 'udp':
-            return probe_class(timeout=self.timeout)
         else:
-            return probe_class(timeout=self.timeout)
+            self._timeouts = None
+    
+    def _probe_timeout(self, retries: int = 0) -> Optional[float]:
+        """Timeout for the next probe (None = the engine's fixed timeout)"""
+        if self._timeouts is None:
+            return None
+        return self._timeouts.timeout(retries)
+    
+    def _observe(self, result: ProbeResult):
+        """Feed a probe result into the adaptive timeout estimate"""
+        if self._timeouts is not None:
+            self._timeouts.observe(result.rtt_ms)
+    
+    def _initial_probes(self) -> int:
+        """Probes sent to a TTL before any of their answers are looked at"""
+        if self._probe_count is None:
+            return self.probes_per_hop
+        return self._probe_count.min_probes
+    
+    def _needs_more(self, results: list[ProbeResult]) -> bool:
+        """Whether a TTL with these completed probes gets another one"""
+        if self._probe_count is None:
+            return len(results) < self.probes_per_hop
+        return self._probe_count.needs_more(results)
+    
+    def _make_hop(self, ttl: int, results: list[ProbeResult]) -> HopResult:
+        """Combine the probe results for one TTL into a HopResult"""
+        hop_ip: Optional[str] = None
+        for result in results:
+            if result.responder_ip:
+                hop_ip = result.responder_ip
+        
+        return HopResult(
+            hop=ttl,
+            ip=hop_ip,
+            rtts=[result.rtt_ms for result in results],
+            reached_target=any(result.reached_target for result in results),
+            probes_sent=len(results)
+        )
+    
+    def _stop_reason(self, hop: HopResult, silent: int) -> Optional[str]:
+        """
+        Decide whether the trace ends at ``hop``.
+        
+        Args:
+            hop: The hop just completed
+            silent: Consecutive all-timeout hops up to and including it
+        
+        Returns:
+            STOP_* reason, or None to keep going
+        """
+        if hop.reached_target:
+            return STOP_REACHED
+        if self.gap_limit and silent >= self.gap_limit:
+            return STOP_GAP_LIMIT
+        if hop.hop >= self.max_hops:
+            return STOP_MAX_HOPS
+        return None
+    
+    @staticmethod
+    def _silent_run(hops: list[HopResult]) -> int:
+        """Number of consecutive all-timeout hops at the end of ``hops``"""
+        silent = 0
+        for hop in reversed(hops):
+            if not hop.all_timeout:
+                break
+            silent += 1
+        return silent
+    
+    def _predicted_distance(self, result: Optional[ProbeResult] = None) -> Optional[int]:
+        """
+        Predicted hop distance of the destination, or None.
+        
+        Args:
+            result: Answer to a probe sent with ``max_hops``, used when
+                there is no recorded path to the target's prefix
+        """
+        distance = self.path_history.distance(self.target_ip)
+        if distance is None and result is not None:
+            if result.reached_target and result.reply_ttl:
+                distance = distance_from_reply_ttl(result.reply_ttl)
+        
+        if distance is None:
+            return None
+        return min(distance, self.max_hops)
+    
+    def _window(self, probe: BaseProbe) -> int:
+        """TTLs probed at once with ``parallel``, within the engine's in-flight cap"""
+        window = self.window or self.max_hops
+        if probe.MAX_INFLIGHT:
+            window = min(window, max(1, probe.MAX_INFLIGHT // self.probes_per_hop))
+        return window
+    
+    def _near_side_ttls(self, start_ttl: Optional[int]) -> Optional[range]:
+        """TTLs to probe backwards before the forward phase, or None"""
+        if start_ttl is None:
+            return self.stop_set.near_side(self.max_hops) if self.stop_set else None
+        
+        last = min(start_ttl, self.max_hops + 1) - 1
+        if last < 1:
+            return None
+        return range(last, 0, -1)
+    
+    def _near_side_chunks(self, probe: BaseProbe, ttls: range) -> list[range]:
+        """Backward TTLs in the groups probed together (a window with ``parallel``)"""
+        size = self._window(probe) if self.parallel else 1
+        return [ttls[start:start + size] for start in range(0, len(ttls), size)]
+    
+    def _is_known(self, hop: HopResult) -> bool:
+        """Whether backward probing can stop at ``hop``"""
+        if self.path_history is not None and self.path_history.known(self.target_ip, hop):
+            return True
+        return self.stop_set is not None and hop in self.stop_set
+    
+    def _infer(self, hop: HopResult) -> list[HopResult]:
+        """Hops in front of a known ``hop``, from the path history or stop set"""
+        if self.path_history is not None and self.path_history.known(self.target_ip, hop):
+            return self.path_history.infer(self.target_ip, hop)
+        if self.stop_set is not None:
+            return self.stop_set.infer(hop)
+        return []
+    
+    def _assemble_near_side(self, probed: list[HopResult],
+                            known: Optional[HopResult] = None) -> list[HopResult]:
+        """
+        Build hops 1..n from a backward probing run.
+        
+        Every probed hop is kept; only the TTLs below the lowest one probed
+        are copied from the path recorded in front of ``known``.
+        
+        Args:
+            probed: Hops in the order probed (highest TTL first), down to
+                TTL 1 or to the last one probed together with ``known``
+            known: The known hop that ended the walk, if any
+        """
+        hops = probed[::-1]
+        if known is not None:
+            lowest = hops[0].hop
+            hops = [hop for hop in self._infer(known) if hop.hop < lowest] + hops
+        
+        # The destination may be closer than the start TTL
+        for index, hop in enumerate(hops):
+            if hop.reached_target:
+                del hops[index + 1:]
+                break
+        
+        hops[-1].stop_reason = self._stop_reason(hops[-1], silent=0)
+        return hops
+    
+    def hops_from_results(self, results: dict[int, list[ProbeResult]]) -> list[HopResult]:
+        """
+        Build the trace from probe results gathered elsewhere.
+        
+        Used for stateless sweeps, where every TTL is probed up front and
+        replies are attributed afterwards. TTLs with fewer answers than
+        ``probes_per_hop`` count the rest as timeouts; the usual stop
+        rules (destination, gap limit, max_hops) end the trace.
+        """
+        hops: list[HopResult] = []
+        silent = 0
+        for ttl in range(1, self.max_hops + 1):
+            answered = results.get(ttl, [])
+            missing = max(0, self.probes_per_hop - len(answered))
+            hop = self._make_hop(ttl, answered + [ProbeResult() for _ in range(missing)])
+            silent = silent + 1 if hop.all_timeout else 0
+            hop.stop_reason = self._stop_reason(hop, silent)
+            hops.append(hop)
+            if hop.stop_reason:
+                break
+        
+        self._record(hops)
+        return hops
+    
+    def _record(self, hops: list[HopResult]):
+        """Add a finished trace to the stop set and path history"""
+        if self.stop_set is not None:
+            self.stop_set.add(hops)
+        if self.path_history is not None:
+            self.path_history.add(self.target_ip, hops)
     
     def trace(
         self,
@@ -83,36 +384,377 @@ class Tracer:
         if not self.target_ip:
             self.resolve_target()
         
-        hops: list[HopResult] = []
+        self._start_timeouts()
+        with self._open_probe() as probe:
+            hops = self._trace_near_side(probe)
+            if on_hop:
+                for hop in hops:
+                    on_hop(hop)
+            
+            if not (hops and hops[-1].stop_reason):
+                if self.parallel:
+                    self._trace_parallel(probe, on_hop, hops)
+                else:
+                    self._trace_sequential(probe, on_hop, hops)
         
-        with self._create_probe() as probe:
-            for ttl in range(1, self.max_hops + 1):
-                rtts: list[Optional[float]] = []
-                hop_ip: Optional[str] = None
-                reached = False
-                
-                for _ in range(self.probes_per_hop):
-                    result = probe.probe(self.target_ip, ttl)
-                    rtts.append(result.rtt_ms)
-                    
-                    if result.responder_ip:
-                        hop_ip = result.responder_ip
+        self._record(hops)
+        return hops
+    
+    def _probe_hop(self, probe: BaseProbe, ttl: int) -> HopResult:
+        """Send the probes for one TTL one after another"""
+        results = []
+        misses = 0
+        while self._needs_more(results):
+            result = probe.probe(self.target_ip, ttl, self._probe_timeout(misses))
+            self._observe(result)
+            if result.rtt_ms is None:
+                misses += 1
+            results.append(result)
+        
+        return self._make_hop(ttl, results)
+    
+    def _probe_hops(self, probe: BaseProbe, ttls: range) -> list[HopResult]:
+        """
+        Send the probes for several TTLs together and wait for all of them.
+        
+        With adaptive probe counts, a TTL whose probes have all completed
+        is sent another one while its answers call for it.
+        """
+        results: dict[int, list[ProbeResult]] = {ttl: [] for ttl in ttls}
+        outstanding = dict.fromkeys(ttls, 0)
+        in_flight: dict = {}  # probe key -> (ttl, probe index)
+        
+        initial = [ttl for ttl in ttls for _ in range(self._initial_probes())]
+        self._send_probes(probe, initial, results, outstanding, in_flight)
+        try:
+            while in_flight:
+                more = []
+                for key, result in probe.poll(self.timeout):
+                    entry = in_flight.pop(key, None)
+                    if entry is None:
+                        continue
                     
-                    if result.reached_target:
-                        reached = True
+                    ttl, index = entry
+                    results[ttl][index] = result
+                    self._observe(result)
+                    outstanding[ttl] -= 1
+                    if outstanding[ttl] == 0 and self._needs_more(results[ttl]):
+                        more.append(ttl)
                 
-                hop = HopResult(
-                    hop=ttl,
-                    ip=hop_ip,
-                    rtts=rtts,
-                    reached_target=reached
-                )
-                hops.append(hop)
+                if more:
+                    self._send_probes(probe, more, results, outstanding, in_flight)
+        finally:
+            for key in in_flight:
+                probe.cancel(key)
+        
+        return [self._make_hop(ttl, results[ttl]) for ttl in ttls]
+    
+    def _send_probes(self, probe: BaseProbe, ttls: list[int],
+                     results: dict[int, list[ProbeResult]], outstanding: dict[int, int],
+                     in_flight: dict):
+        """Send one more probe to each of ``ttls``, together (batched where possible)"""
+        requests, entries = [], []
+        for ttl in ttls:
+            index = len(results[ttl])
+            results[ttl].append(ProbeResult())
+            outstanding[ttl] += 1
+            # Later probes of a hop wait longer, in case it is slow
+            requests.append((self.target_ip, ttl, self._probe_timeout(index)))
+            entries.append((ttl, index))
+        
+        for key, entry in zip(probe.send_many(requests), entries):
+            in_flight[key] = entry
+    
+    def _trace_near_side(self, probe: BaseProbe) -> list[HopResult]:
+        """
+        Probe below the start TTL backwards (Doubletree, predicted start).
+        
+        With ``parallel`` a window of TTLs is probed at once, and the walk
+        ends with the window in which a known hop answered.
+        """
+        start_ttl = None
+        if self.predict_start:
+            start_ttl = self._predicted_distance()
+            if start_ttl is None:
+                start_ttl = self._predicted_distance(probe.probe(self.target_ip, self.max_hops))
+        
+        ttls = self._near_side_ttls(start_ttl)
+        if not ttls:
+            return []
+        
+        probed = []
+        for chunk in self._near_side_chunks(probe, ttls):
+            if self.parallel:
+                hops = self._probe_hops(probe, chunk)
+            else:
+                hops = [self._probe_hop(probe, chunk[0])]
+            
+            probed.extend(hops)
+            known = [hop for hop in hops if self._is_known(hop)]
+            if known:
+                return self._assemble_near_side(probed, known[-1])
+        
+        return self._assemble_near_side(probed)
+    
+    def _trace_sequential(
+        self,
+        probe: BaseProbe,
+        on_hop: Optional[Callable[[HopResult], None]],
+        hops: list[HopResult]
+    ) -> list[HopResult]:
+        """Probe TTLs one at a time after ``hops``, waiting for each probe in turn"""
+        silent = self._silent_run(hops)
+        
+        for ttl in range(len(hops) + 1, self.max_hops + 1):
+            hop = self._probe_hop(probe, ttl)
+            silent = silent + 1 if hop.all_timeout else 0
+            hop.stop_reason = self._stop_reason(hop, silent)
+            hops.append(hop)
+            
+            if on_hop:
+                on_hop(hop)
+            
+            if hop.stop_reason:
+                break
+        
+        return hops
+    
+    def _trace_parallel(
+        self,
+        probe: BaseProbe,
+        on_hop: Optional[Callable[[HopResult], None]],
+        hops: list[HopResult]
+    ) -> list[HopResult]:
+        """
+        Keep probes for a window of TTLs after ``hops`` in flight at once.
+        
+        Replies are matched to their TTL by probe key. Hops are reported
+        in TTL order as soon as all their probes have completed, and the
+        window slides forward each time a hop is reported. Once a reply
+        from the destination is seen, no TTL beyond it is probed. With
+        adaptive probe counts, a TTL whose probes have all completed is
+        sent another one while its answers call for it. Probes launched
+        together go out in one batch where the engine supports it.
+        """
+        window = self._window(probe)
+        
+        results: dict[int, list[ProbeResult]] = {}
+        outstanding: dict[int, int] = {}
+        in_flight: dict = {}  # probe key -> (ttl, probe index)
+        
+        def send(ttls: list[int]):
+            self._send_probes(probe, ttls, results, outstanding, in_flight)
+        
+        def launch(ttls: range):
+            for ttl in ttls:
+                results[ttl] = []
+                outstanding[ttl] = 0
+            send([ttl for ttl in ttls for _ in range(self._initial_probes())])
+        
+        dest_ttl: Optional[int] = None
+        silent = self._silent_run(hops)
+        next_ttl = min(len(hops) + window, self.max_hops) + 1
+        launch(range(len(hops) + 1, next_ttl))
+        
+        try:
+            while True:
+                last_ttl = dest_ttl or self.max_hops
                 
-                if on_hop:
-                    on_hop(hop)
+                # Report completed hops in order and slide the window
+                while len(hops) < last_ttl and outstanding[len(hops) + 1] == 0:
+                    ttl = len(hops) + 1
+                    hop = self._make_hop(ttl, results[ttl])
+                    silent = silent + 1 if hop.all_timeout else 0
+                    hop.stop_reason = self._stop_reason(hop, silent)
+                    hops.append(hop)
+                    
+                    if on_hop:
+                        on_hop(hop)
+                    
+                    if hop.stop_reason:
+                        break
+                    
+                    if next_ttl <= last_ttl:
+                        launch(range(next_ttl, next_ttl + 1))
+                        next_ttl += 1
                 
-                if reached:
+                if hops and hops[-1].stop_reason:
                     break
+                
+                for key, result in probe.poll(self.timeout):
+                    entry = in_flight.pop(key, None)
+                    if entry is None:
+                        continue
+                    
+                    ttl, index = entry
+                    results[ttl][index] = result
+                    self._observe(result)
+                    outstanding[ttl] -= 1
+                    
+                    if result.reached_target:
+                        if dest_ttl is None or ttl < dest_ttl:
+                            dest_ttl = ttl
+                    
+                    if (outstanding[ttl] == 0 and (dest_ttl is None or ttl <= dest_ttl)
+                            and self._needs_more(results[ttl])):
+                        send([ttl])
+        finally:
+            # Probes beyond the last hop are no longer needed
+            for key in in_flight:
+                probe.cancel(key)
+        
+        return hops
+    
+    async def trace_async(
+        self,
+        on_hop: Optional[Callable[[HopResult], None]] = None
+    ) -> list[HopResult]:
+        """
+        Execute traceroute on the running event loop.
         
+        Args:
+            on_hop: Optional callback for real-time hop updates
+            
+        Returns:
+            List of HopResult for each hop
+        """
+        hops: list[HopResult] = []
+        async for hop in self.iter_hops():
+            hops.append(hop)
+            if on_hop:
+                on_hop(hop)
         return hops
+    
+    async def iter_hops(self) -> AsyncIterator[HopResult]:
+        """
+        Execute traceroute, yielding each HopResult as soon as it completes.
+        
+        Hops are yielded in TTL order. Probing honours ``parallel`` and
+        ``window`` exactly like ``trace()``.
+        """
+        if not self.target_ip:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.resolve_target)
+        
+        self._start_timeouts()
+        with self._open_probe() as probe:
+            hops = await self._near_side_async(probe)
+            for hop in hops:
+                yield hop
+            
+            if not (hops and hops[-1].stop_reason):
+                if self.parallel:
+                    forward = self._iter_parallel_async(probe, hops)
+                else:
+                    forward = self._iter_sequential_async(probe, hops)
+                
+                async for hop in forward:
+                    hops.append(hop)
+                    yield hop
+        
+        self._record(hops)
+    
+    async def _probe_hop_async(self, probe: BaseProbe, ttl: int,
+                               concurrent: bool) -> HopResult:
+        """
+        Send the probes for one TTL, either together or one by one.
+        
+        Concurrently, the initial probes go out together and any further
+        ones (adaptive probe counts) follow one at a time.
+        """
+        results: list[ProbeResult] = []
+        if concurrent:
+            results = list(await asyncio.gather(*(
+                probe.probe_async(self.target_ip, ttl, self._probe_timeout(index))
+                for index in range(self._initial_probes())
+            )))
+            for result in results:
+                self._observe(result)
+        
+        misses = sum(1 for result in results if result.rtt_ms is None)
+        while self._needs_more(results):
+            result = await probe.probe_async(
+                self.target_ip, ttl, self._probe_timeout(misses)
+            )
+            self._observe(result)
+            if result.rtt_ms is None:
+                misses += 1
+            results.append(result)
+        
+        return self._make_hop(ttl, results)
+    
+    async def _near_side_async(self, probe: BaseProbe) -> list[HopResult]:
+        """Async counterpart of _trace_near_side"""
+        start_ttl = None
+        if self.predict_start:
+            start_ttl = self._predicted_distance()
+            if start_ttl is None:
+                result = await probe.probe_async(self.target_ip, self.max_hops)
+                start_ttl = self._predicted_distance(result)
+        
+        ttls = self._near_side_ttls(start_ttl)
+        if not ttls:
+            return []
+        
+        probed = []
+        for chunk in self._near_side_chunks(probe, ttls):
+            hops = await asyncio.gather(*(
+                self._probe_hop_async(probe, ttl, concurrent=self.parallel)
+                for ttl in chunk
+            ))
+            probed.extend(hops)
+            known = [hop for hop in hops if self._is_known(hop)]
+            if known:
+                return self._assemble_near_side(probed, known[-1])
+        
+        return self._assemble_near_side(probed)
+    
+    async def _iter_sequential_async(self, probe: BaseProbe,
+                                     hops: list[HopResult]) -> AsyncIterator[HopResult]:
+        """Async counterpart of _trace_sequential; does not modify ``hops``"""
+        silent = self._silent_run(hops)
+        for ttl in range(len(hops) + 1, self.max_hops + 1):
+            hop = await self._probe_hop_async(probe, ttl, concurrent=False)
+            silent = silent + 1 if hop.all_timeout else 0
+            hop.stop_reason = self._stop_reason(hop, silent)
+            yield hop
+            
+            if hop.stop_reason:
+                break
+    
+    async def _iter_parallel_async(self, probe: BaseProbe,
+                                   hops: list[HopResult]) -> AsyncIterator[HopResult]:
+        """Async counterpart of _trace_parallel: one task per TTL in the window"""
+        window = self._window(probe)
+        
+        tasks: dict[int, asyncio.Task] = {}
+        first_ttl = len(hops) + 1
+        next_ttl = first_ttl
+        
+        def launch():
+            nonlocal next_ttl
+            tasks[next_ttl] = asyncio.ensure_future(
+                self._probe_hop_async(probe, next_ttl, concurrent=True)
+            )
+            next_ttl += 1
+        
+        while next_ttl <= min(first_ttl - 1 + window, self.max_hops):
+            launch()
+        
+        silent = self._silent_run(hops)
+        try:
+            for ttl in range(first_ttl, self.max_hops + 1):
+                hop = await tasks.pop(ttl)
+                silent = silent + 1 if hop.all_timeout else 0
+                hop.stop_reason = self._stop_reason(hop, silent)
+                yield hop
+                
+                if hop.stop_reason:
+                    break
+                
+                if next_ttl <= self.max_hops:
+                    launch()
+        finally:
+            # Probes beyond the last hop are no longer needed
+            for task in tasks.values():
+                task.cancel()
@@ -6,8 +6,11 @@ import socket
 import struct
 import time
 import random
+from typing import Optional
 from ..models import ProbeResult
 from .base import BaseProbe
+from .batchio import enable_rx_timestamps, send_with_ttl
+from .bpf import attach_filter, port_filter
 
 
 class UDPProbe(BaseProbe):
@@ -20,16 +23,29 @@ class UDPProbe(BaseProbe):
     - ICMP Port Unreachable from destination (indicates arrival)
     
     This is the classic Unix traceroute method.
+    
+    Probes are identified by (source port, destination port). The source
+    port is the engine's own bound UDP port, which the kernel keeps
+    unique, so engines in this or any other process never take each
+    other's replies even though they share destination ports.
+    
+    Each in-flight probe holds one of ``PORT_RANGE`` destination ports,
+    so an engine has at most that many probes in flight, however many
+    traces share it.
     """
     
     ICMP_TIME_EXCEEDED = 11
     ICMP_DEST_UNREACHABLE = 3
     ICMP_PORT_UNREACHABLE = 3  # Code within DEST_UNREACHABLE
     
+    PORT_RANGE = 30
+    MAX_INFLIGHT = PORT_RANGE  # One in-flight probe per destination port
+    
     def __init__(self, base_port: int = 33434, timeout: float = 2.0):
         super().__init__(timeout)
         self.base_port = base_port
         self.port_offset = 0
+        self.src_port: Optional[int] = None
         self._udp_socket = None
         self._icmp_socket = None
         self._init_sockets()
@@ -39,6 +55,8 @@ class UDPProbe(BaseProbe):
         try:
             # UDP socket for sending
             self._udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._udp_socket.bind(('', 0))
+            self.src_port = self._udp_socket.getsockname()[1]
             
             # Raw ICMP socket for receiving responses
             self._icmp_socket = socket.socket(
@@ -46,6 +64,12 @@ class UDPProbe(BaseProbe):
             )
             self._icmp_socket.settimeout(self.timeout)
             self._icmp_socket.bind(('', 0))
+            enable_rx_timestamps(self._icmp_socket)
+            if self.KERNEL_FILTER:
+                # Only ICMP errors quoting a datagram to our port range reach Python
+                attach_filter(self._icmp_socket, port_filter(
+                    socket.IPPROTO_UDP, self.base_port, self.base_port + self.PORT_RANGE - 1
+                ))
             
         except PermissionError:
             raise PermissionError(
@@ -53,75 +77,75 @@ class UDPProbe(BaseProbe):
                 "Please run as Administrator."
             )
     
-    def probe(self, target_ip: str, ttl: int) -> ProbeResult:
-        """Send UDP probe with given TTL"""
-        # Set TTL on UDP socket
-        self._udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
-        
-        # Calculate destination port
-        dst_port = self.base_port + self.port_offset
-        self.port_offset = (self.port_offset + 1) % 30
-        
-        # Payload with identifier
-        payload = struct.pack('!HHI', 
-            dst_port,  # Store port for identification
-            ttl,       # Store TTL
-            int(time.time()) & 0xFFFFFFFF
+    def _next_free_port(self) -> int:
+        """Next destination port that has no probe in flight"""
+        for _ in range(self.PORT_RANGE):
+            dst_port = self.base_port + self.port_offset
+            self.port_offset = (self.port_offset + 1) % self.PORT_RANGE
+            if dst_port not in self._pending:
+                return dst_port
+        
+        raise RuntimeError(
+            f"All {self.PORT_RANGE} UDP probe ports are in flight"
         )
+    
+    def send(self, target_ip: str, ttl: int, timeout: Optional[float] = None) -> int:
+        """Send UDP probe without waiting; the probe is keyed by its destination port"""
+        self.pace(target_ip)
+        dst_port = self._next_free_port()
+        payload = struct.pack('!HHI', dst_port, ttl, int(time.time()) & 0xFFFFFFFF)
         
         send_time = time.perf_counter()
+        self._track(dst_port, target_ip, ttl, send_time, timeout)
         
         try:
-            self._udp_socket.sendto(payload, (target_ip, dst_port))
+            send_with_ttl(self._udp_socket, payload, (target_ip, dst_port), ttl)
         except Exception:
-            return ProbeResult()
-        
-        # Wait for ICMP response
-        while True:
-            try:
-                remaining = self.timeout - (time.perf_counter() - send_time)
-                if remaining <= 0:
-                    return ProbeResult()
-                
-                self._icmp_socket.settimeout(remaining)
-                data, addr = self._icmp_socket.recvfrom(1024)
-                recv_time = time.perf_counter()
-                
-                # Parse ICMP response
-                ip_header_len = (data[0] & 0x0F) * 4
-                icmp_data = data[ip_header_len:]
-                
-                if len(icmp_data) < 8:
-                    continue
-                
-                icmp_type = icmp_data[0]
-                icmp_code = icmp_data[1]
-                
-                if icmp_type == self.ICMP_TIME_EXCEEDED:
-                    # Intermediate router
-                    if self._verify_our_packet(icmp_data, target_ip, dst_port):
-                        rtt_ms = (recv_time - send_time) * 1000
-                        return ProbeResult(
-                            responder_ip=addr[0],
-                            rtt_ms=round(rtt_ms, 2),
-                            reached_target=False
-                        )
-                        
-                elif icmp_type == self.ICMP_DEST_UNREACHABLE:
-                    # Port unreachable means we reached destination
-                    if self._verify_our_packet(icmp_data, target_ip, dst_port):
-                        rtt_ms = (recv_time - send_time) * 1000
-                        reached = (icmp_code == self.ICMP_PORT_UNREACHABLE)
-                        return ProbeResult(
-                            responder_ip=addr[0],
-                            rtt_ms=round(rtt_ms, 2),
-                            reached_target=reached
-                        )
-                
-            except socket.timeout:
-                return ProbeResult()
-            except Exception:
-                continue
+            # Leave it pending; poll() reports it as a timeout
+            pass
+        
+        return dst_port
+    
+    def _receive_sockets(self) -> list:
+        return [self._icmp_socket]
+    
+    def _match_reply(self, sock, data: bytes, responder_ip: str, recv_time: float):
+        """Match ICMP error quoting one of our datagrams by destination port"""
+        ip_header_len = (data[0] & 0x0F) * 4
+        icmp_data = data[ip_header_len:]
+        
+        if len(icmp_data) < 36:
+            return None
+        
+        icmp_type = icmp_data[0]
+        icmp_code = icmp_data[1]
+        if icmp_type not in (self.ICMP_TIME_EXCEEDED, self.ICMP_DEST_UNREACHABLE):
+            return None
+        
+        inner_dst_ip = socket.inet_ntoa(icmp_data[24:28])
+        inner_udp_start = 8 + (icmp_data[8] & 0x0F) * 4
+        if len(icmp_data) < inner_udp_start + 4:
+            return None
+        
+        _, inner_dst_port = struct.unpack(
+            '!HH', icmp_data[inner_udp_start:inner_udp_start + 4]
+        )
+        
+        pending = self._pending.get(inner_dst_port)
+        if pending is None or pending.target_ip != inner_dst_ip:
+            return None
+        if not self._verify_our_packet(icmp_data, pending.target_ip, inner_dst_port):
+            return None
+        
+        reached = (icmp_type == self.ICMP_DEST_UNREACHABLE and
+                   icmp_code == self.ICMP_PORT_UNREACHABLE)
+        return self._complete(inner_dst_port, responder_ip, recv_time, reached,
+                              reply_ttl=data[8])
+    
+    def probe(self, target_ip: str, ttl: int,
+              timeout: Optional[float] = None) -> ProbeResult:
+        """Send UDP probe with given TTL and wait for Time Exceeded or Port Unreachable"""
+        return self._wait(self.send(target_ip, ttl, timeout), timeout)
     
     def _verify_our_packet(self, icmp_data: bytes, target_ip: str, 
                            dst_port: int) -> bool:
@@ -146,15 +170,12 @@ class UDPProbe(BaseProbe):
         if inner_dst_ip != target_ip:
             return False
         
-        # Check UDP header for destination port
-        inner_udp_start = inner_ip_start + 20
+        # Check UDP header: our socket's source port, the probe's destination port
+        inner_udp_start = inner_ip_start + (inner_ip[0] & 0x0F) * 4
         if len(icmp_data) >= inner_udp_start + 4:
             inner_udp = icmp_data[inner_udp_start:inner_udp_start + 4]
-            _, inner_dst_port = struct.unpack('!HH', inner_udp)
-            
-            # Port should be in our range
-            if self.base_port <= inner_dst_port < self.base_port + 30:
-                return True
+            inner_src_port, inner_dst_port = struct.unpack('!HH', inner_udp)
+            return inner_src_port == self.src_port and inner_dst_port == dst_port
         
         return False
     